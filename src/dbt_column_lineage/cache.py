@@ -0,0 +1,206 @@
+import hashlib
+import json
+import threading
+import typing as t
+from collections import OrderedDict
+
+from sqlglot import MappingSchema, Schema, exp
+from sqlglot.expressions import Expression
+from sqlglot.optimizer import build_scope, Scope, qualify
+from sqlglot.schema import normalize_name
+
+# パース済み AST(+ qualify 済み Scope)がコンパイル済み SQL 1文字あたりに占めるおおよその
+# バイト数。sqlglot の式ツリーを正確に計測するのは高価なので、キャッシュのメモリ上限は
+# SQL 長からのこの概算で判定する。
+PARSED_BYTES_PER_CHAR = 100
+
+
+class LruCache:
+    """スレッドセーフな LRU キャッシュ。件数上限と(概算)バイト数上限の両方で古いものから追い出す。
+    hits/misses はメトリクス用に数えるだけで、挙動には影響しない。"""
+
+    def __init__(self, max_entries: int, max_bytes: t.Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size: int = 0):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._data[key] = (value, size)
+            self.total_bytes += size
+            while self._data and (len(self._data) > self.max_entries or
+                                  (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def items(self) -> list:
+        """(key, value, size) の一覧(古い順)。ホットリロード時の引き継ぎなどに使う。"""
+        with self._lock:
+            return [(k, v[0], v[1]) for k, v in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+
+class ParsedModel:
+    """1モデル分のパース結果。DbtProject.model_cache_key(unique_id・コンパイル済み SQL・
+    依存スキーマのハッシュ)をキーにキャッシュし、リクエストを跨いで再利用する。
+
+    parsed はパースしたままの AST(読み取り専用。sqlglot の lineage() は既定で copy するので
+    そのまま渡してよい)。qualify は AST を破壊的に書き換えるため、parsed のコピーを初回要求時に
+    qualify して qualified に保持する。parsed が None ならパース失敗(失敗もキャッシュして
+    同じ SQL を何度もパースし直さない)。"""
+    __slots__ = ('unique_id', 'code_hash', 'parsed', 'depends_on_table_info', 'schema',
+                 '_built', '_qualified', '_scope_error', '_lock')
+
+    def __init__(self, unique_id: str, code_hash: str, parsed: t.Optional[Expression],
+                 depends_on_table_info: list, schema: Schema):
+        self.unique_id = unique_id
+        self.code_hash = code_hash
+        self.parsed = parsed
+        self.depends_on_table_info = depends_on_table_info
+        self.schema = schema
+        self._built = False
+        self._qualified = None
+        self._scope_error = None
+        self._lock = threading.Lock()
+
+    def qualified_scope(self, dialect: str) -> t.Tuple[Expression, Scope]:
+        """qualify 済みの式(初回のみ構築)と、その式から呼び出しごとに作った Scope を返す。
+        構築に失敗した場合は同じ例外を毎回送出する。
+
+        Scope は共有しない。sqlglot の Scope はテーブルやカラムを初回参照時に自身のリストへ
+        追記して集めるため、同じ Scope で lineage() を複数スレッドから同時に呼ぶと集めた
+        ソースやカラムが重複・欠落する。build_scope は qualify に比べて十分安い。"""
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    try:
+                        self._qualified = qualify.qualify(
+                            self.parsed.copy(),
+                            dialect=dialect,
+                            schema=self.schema,
+                            **{"validate_qualify_columns": False, "identify": False},  # type: ignore
+                        )
+                    except Exception as e:
+                        self._scope_error = e
+                    self._built = True
+        if self._scope_error is not None:
+            raise self._scope_error
+        return self._qualified, build_scope(self._qualified)
+
+
+class DependencyTable:
+    """依存テーブル1つ分の解決結果(DependencySchemas がテーブルごとに1回だけ作る)。
+
+    columns は catalog.json のカラム(無ければ manifest.json のカラム)。key_json は
+    DbtProject.model_cache_key が依存スキーマのハッシュに使う JSON 片。"""
+    __slots__ = ('parts', 'info', 'key_json', '_column_mapping')
+
+    def __init__(self, element, columns: dict):
+        self.parts = (element['database'].upper(), element['schema'].upper(), element['name'].upper())
+        self.info = {
+            'columns': columns,
+            'table': exp.Table(
+                catalog=exp.Identifier(this=self.parts[0]),
+                db=exp.Identifier(this=self.parts[1]),
+                this=exp.Identifier(this=self.parts[2]),
+            ),
+        }
+        self.key_json = json.dumps([
+            element['database'], element['schema'], element['name'],
+            [[k, v.get('type', 'STRING')] for k, v in columns.items()],
+        ])
+        self._column_mapping = None
+
+    def column_mapping(self, dialect: str) -> dict:
+        """カラム -> 型。MappingSchema.add_table(normalize=False) と同じくカラム名は識別子として
+        パースした名前にする(初回のみ作り、以降は全スキーマで同じ dict を共有する)。"""
+        if self._column_mapping is None:
+            self._column_mapping = {
+                normalize_name(k, dialect=dialect, normalize=False).name: v.get('type', 'STRING')
+                for k, v in self.info['columns'].items()
+            }
+        return self._column_mapping
+
+
+class DependencySchemas:
+    """モデルの依存テーブルの MappingSchema を、依存ノードの組ごとに作って使い回す。
+
+    カラムの解決とカラム名のパースは依存テーブルごとに1回だけ行い、各 MappingSchema は
+    そのカラムの dict を共有して組み立てる。stg_orders のように何百ものモデルから参照される
+    テーブルでも、スキーマ構築のコストはテーブル1回分で済む。MappingSchema は読み取り専用
+    (lineage / qualify は add_table しない)なので、リクエスト・スレッドを跨いで共有してよい。
+
+    キャッシュは unique_id で引くので、1つの版の成果物(DbtProject か、同じ版から切り出した
+    ModelSlice)にだけ使うこと。project は dbt_manifest_nodes / dbt_manifest_sources /
+    catalog_by_name を持つもの。"""
+
+    def __init__(self, dialect: str, max_entries: int):
+        self.dialect = dialect
+        # unique_id -> DependencyTable(解決できない依存は None)
+        self.tables = {}
+        # 依存ノードの組 -> (depends_on_table_info, MappingSchema)
+        self.schemas = LruCache(max_entries)
+
+    def table(self, project, unique_id: str) -> t.Optional[DependencyTable]:
+        if unique_id in self.tables:
+            return self.tables[unique_id]
+        element = project.dbt_manifest_nodes.get(unique_id, project.dbt_manifest_sources.get(unique_id))
+        table = None
+        if element:
+            # catalog.json にカラム情報があればそれを使い、なければ manifest.json のカラム情報を使う
+            columns = project.catalog_by_name.get(element['name'], {}).get('columns', element.get('columns', {}))
+            table = DependencyTable(element, columns)
+        self.tables[unique_id] = table
+        return table
+
+    def tables_of(self, project, depends_on_nodes: t.Sequence[str]) -> t.List[DependencyTable]:
+        tables = (self.table(project, depends_on_node) for depends_on_node in depends_on_nodes)
+        return [table for table in tables if table is not None]
+
+    def schema(self, project, depends_on_nodes: t.Sequence[str]) -> t.Tuple[list, MappingSchema]:
+        """(depends_on_table_info, MappingSchema)。依存テーブルを順に add_table したのと同じスキーマ。"""
+        key = tuple(depends_on_nodes)
+        cached = self.schemas.get(key)
+        if cached is None:
+            tables = self.tables_of(project, depends_on_nodes)
+            mapping = {}
+            for table in tables:
+                catalog, db, name = table.parts
+                column_mapping = table.column_mapping(self.dialect)
+                by_name = mapping.setdefault(catalog, {}).setdefault(db, {})
+                # add_table と同じく、カラムが空なら登録済みのテーブルを上書きしない
+                if column_mapping or not by_name.get(name):
+                    by_name[name] = column_mapping
+            cached = ([table.info for table in tables], MappingSchema(mapping, dialect=self.dialect, normalize=False))
+            self.schemas.put(key, cached)
+        return cached
+
+    def depends_on_hash(self, project, depends_on_nodes: t.Sequence[str]) -> str:
+        """依存テーブルの (database, schema, name, [[カラム, 型], ...]) の一覧の JSON のハッシュ。
+        json.dumps(一覧) と同じ文字列をテーブルごとの JSON 片から組み立てる。"""
+        depends_on_json = '[' + ', '.join(table.key_json for table in self.tables_of(project, depends_on_nodes)) + ']'
+        return hashlib.sha1(depends_on_json.encode('utf-8')).hexdigest()
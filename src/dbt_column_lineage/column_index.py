@@ -0,0 +1,215 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlglot
+
+from dbt_column_lineage.cache import DependencySchemas, LruCache
+from dbt_column_lineage.constants import PARSE_CACHE_MAX_ENTRIES
+
+COLUMN_INDEX_FILE = 'column_lineage_index.json'
+# 形式を変えたら上げる(古い形式のファイルは読み込まない)
+COLUMN_INDEX_FORMAT_VERSION = 1
+
+
+class ColumnLineageIndex:
+    """`dbt-column-lineage build-index` が書き出す、全モデル・全出力カラムの列リネージの事前計算結果。
+
+    models は unique_id -> {'key': [compiled_code のハッシュ, 依存スキーマのハッシュ],
+    'columns': {カラム名(大文字): [labels, columns]}}。labels/columns は sqlglot のリネージから
+    抽出した値そのもの(DbtSqlglot.__extract_lineage_node)で、サーバーはこれを引くだけで
+    forward / reverse の列リネージを辿れる。key が読み込み中の manifest と一致しないモデル
+    (build-index 後に SQL や上流カラムが変わったもの)は使わず、従来どおり sqlglot で計算する。"""
+
+    def __init__(self, metadata: dict, models: dict):
+        self.metadata = metadata
+        self.models = models
+
+    @staticmethod
+    def new_metadata(dialect: str, invocation_id: str | None) -> dict:
+        return {
+            'version': COLUMN_INDEX_FORMAT_VERSION,
+            'sqlglot': sqlglot.__version__,
+            'dialect': dialect,
+            'invocation_id': invocation_id,
+            'generated_at': time.time(),
+        }
+
+    @classmethod
+    def load(cls, path: str, dialect: str, logger) -> 'ColumnLineageIndex | None':
+        """path の索引を読み込む。無い・形式や方言が違う・壊れている場合は None。"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f'column lineage index load error. path={path}, error={e}')
+            return None
+        metadata = data.get('metadata', {})
+        if metadata.get('version') != COLUMN_INDEX_FORMAT_VERSION or metadata.get('dialect') != dialect:
+            logger.info(f'ignore column lineage index (version/dialect mismatch). path={path}, metadata={metadata}')
+            return None
+        if metadata.get('sqlglot') != sqlglot.__version__:
+            logger.info(f'column lineage index was built with sqlglot {metadata.get("sqlglot")} (running {sqlglot.__version__})')
+        return cls(metadata, data.get('models', {}))
+
+    def save(self, path: str):
+        """一時ファイルに書いてから置き換える(読み込み中のサーバーが書きかけを読まないように)。"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'metadata': self.metadata, 'models': self.models}, f, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def set_model(self, unique_id: str, cache_key: tuple, column_results: dict):
+        """DbtSqlglot.model_column_lineage の結果を登録する(順序に依らない出力にするため整列する)。"""
+        self.models[unique_id] = {
+            'key': list(cache_key[1:]),
+            'columns': {
+                column: [sorted(result['labels']), sorted(result['columns'])]
+                for column, result in sorted(column_results.items())
+            },
+        }
+
+    def fresh_entry(self, unique_id: str, cache_key: tuple) -> dict | None:
+        """索引内のモデルのエントリ。無い、または cache_key(SQL・依存スキーマ)が変わっていれば None。"""
+        entry = self.models.get(unique_id)
+        if entry is None or entry['key'] != list(cache_key[1:]):
+            return None
+        return entry
+
+    def model_columns(self, unique_id: str, cache_key: tuple) -> dict | None:
+        """モデルの {カラム: {'labels', 'columns'}}。索引に無い・古い場合は None。"""
+        entry = self.fresh_entry(unique_id, cache_key)
+        if entry is None:
+            return None
+        return {
+            column: {'labels': labels, 'columns': columns}
+            for column, (labels, columns) in entry['columns'].items()
+        }
+
+
+def indexable_unique_ids(project) -> list:
+    """索引の対象: リネージで訪問し得る、compiled_code を持つノード
+    (forward で辿る model/snapshot と、reverse で子として引かれるカラム定義付きのノード)。"""
+    return [
+        unique_id for unique_id, dbt_node in project.dbt_manifest_nodes.items()
+        if 'compiled_code' in dbt_node
+        and (dbt_node.get('resource_type') in ('model', 'snapshot') or dbt_node.get('columns'))
+    ]
+
+
+class ModelSlice:
+    """並列 build-index のワーカーに渡す1モデル分の入力。
+
+    DbtSqlglot.model_column_lineage が参照する DbtProject の属性のうち、対象ノード・直接の依存
+    (name/database/schema/columns)・依存の catalog カラムだけを持つ。ワーカーに manifest 全体を
+    送らずに、直列実行とまったく同じコード経路で計算するためのもの。"""
+    looker = None
+    node_ids = {}
+
+    def __init__(self, project, unique_id: str):
+        dbt_node = project.dbt_manifest_nodes[unique_id]
+        self.unique_id = unique_id
+        self.dialect = project.dialect
+        self.cache_key = project.model_cache_key(unique_id)
+        self.dbt_manifest_nodes = {unique_id: {
+            key: dbt_node[key] for key in ('unique_id', 'name', 'compiled_code', 'depends_on') if key in dbt_node
+        }}
+        self.dbt_manifest_sources = {}
+        self.catalog_by_name = {}
+        for depends_on_node in dbt_node.get('depends_on', {}).get('nodes', []):
+            element = project.dbt_manifest_nodes.get(depends_on_node, project.dbt_manifest_sources.get(depends_on_node))
+            if not element:
+                continue
+            self.dbt_manifest_nodes[depends_on_node] = {
+                key: element[key] for key in ('name', 'database', 'schema', 'columns') if key in element
+            }
+            if element['name'] in project.catalog_by_name:
+                self.catalog_by_name[element['name']] = {'columns': project.catalog_by_name[element['name']].get('columns', {})}
+        # 以下はワーカー側で設定する(pickle して送らない)
+        self.parse_cache = None
+        self.dependency_schemas = None
+        self.real_object_names_cache = None
+
+    def model_cache_key(self, unique_id: str) -> tuple:
+        return self.cache_key
+
+    def real_object_names(self) -> set:
+        return self.real_object_names_cache
+
+
+# ワーカープロセス内の状態(_init_worker で設定)
+_worker_real_object_names = None
+# 同じ build-index の slice はすべて同じ版の成果物から作るので、依存スキーマはワーカー内で共有できる
+_worker_dependency_schemas = None
+
+
+def _init_worker(real_object_names: set, dialect: str):
+    global _worker_real_object_names, _worker_dependency_schemas
+    _worker_real_object_names = real_object_names
+    _worker_dependency_schemas = DependencySchemas(dialect, PARSE_CACHE_MAX_ENTRIES)
+
+
+def _build_model(model_slice: ModelSlice) -> dict:
+    from dbt_column_lineage.lineage import DbtSqlglot
+
+    model_slice.parse_cache = LruCache(1)
+    model_slice.real_object_names_cache = _worker_real_object_names
+    model_slice.dependency_schemas = _worker_dependency_schemas
+    session = DbtSqlglot(logging.getLogger(__name__), project=model_slice)
+    return session.model_column_lineage(model_slice.unique_id)
+
+
+def build_column_index(session, progress=None, workers: int = 1, previous: ColumnLineageIndex = None) -> ColumnLineageIndex:
+    """session(DbtSqlglot)のプロジェクトの全対象ノードについて列リネージを計算し、索引を作る。
+
+    previous(前回の索引)を渡すと差分更新になる: compiled_code と依存テーブルのカラム
+    (model_cache_key)が前回と同じモデルはエントリをそのまま引き継ぎ、変わった・増えたモデル
+    だけを計算し直す。manifest から消えたモデルは落とす。sqlglot のバージョンが違う索引は
+    結果が変わり得るので引き継がない。
+    workers > 1 なら計算するモデルをプロセスプールに分散する(各ワーカーには ModelSlice だけを送る)。
+    結果は対象ノードの順に取り込むので、並列度に依らず同じ索引になる。
+    progress(done, total) は計算したモデルを1つ取り込む毎に呼ばれる(total は計算対象の数)。"""
+    project = session.project
+    index = ColumnLineageIndex(
+        ColumnLineageIndex.new_metadata(project.dialect, project.dbt_metadata.get('invocation_id')), {})
+    if previous is not None and previous.metadata.get('sqlglot') != sqlglot.__version__:
+        previous = None
+
+    unique_ids = []
+    reused = {}
+    for unique_id in indexable_unique_ids(project):
+        entry = previous.fresh_entry(unique_id, project.model_cache_key(unique_id)) if previous is not None else None
+        if entry is not None:
+            reused[unique_id] = entry
+        else:
+            unique_ids.append(unique_id)
+    index.metadata['build'] = {'reused': len(reused), 'rebuilt': len(unique_ids)}
+
+    if workers > 1 and len(unique_ids) > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(project.real_object_names(), project.dialect),
+        )
+        with executor:
+            slices = [ModelSlice(project, unique_id) for unique_id in unique_ids]
+            # 小さいモデルが多いのでまとめて送る(ワーカー間の偏りが出ない程度に)
+            chunksize = max(1, min(32, len(slices) // (workers * 8)))
+            results = executor.map(_build_model, slices, chunksize=chunksize)
+            for done, (model_slice, column_results) in enumerate(zip(slices, results), start=1):
+                index.set_model(model_slice.unique_id, model_slice.cache_key, column_results)
+                if progress:
+                    progress(done, len(unique_ids))
+    else:
+        for done, unique_id in enumerate(unique_ids, start=1):
+            index.set_model(unique_id, project.model_cache_key(unique_id), session.model_column_lineage(unique_id))
+            if progress:
+                progress(done, len(unique_ids))
+    index.models.update(reused)
+    return index
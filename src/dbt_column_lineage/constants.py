@@ -24,3 +24,60 @@ SESSION_SECRET = os.getenv('SESSION_SECRET')
 # コストが深さでなく横幅(ハブ列の全下流など)の場合に効く本命の保護。本番では
 # ゲートウェイのリクエストタイムアウト未満に設定し、504 でなく 200+truncated を返す。
 MAX_LINEAGE_SECONDS = float(os.getenv('MAX_LINEAGE_SECONDS', '-1'))
+
+# リネージ計算を実行するワーカープール。async ハンドラ内で sqlglot を同期実行すると
+# 1本の重い探索でイベントループ(/healthcheck を含む全リクエスト)が止まるため、計算は
+# このプールに逃がす。
+# LINEAGE_POOL_MODE: 'thread'(既定。読み込み済みプロジェクトを共有) か 'process'
+#   (プロセス毎にプロジェクトを読み込むが、GIL を跨いでコア数に比例してスケールする)。
+# LINEAGE_POOL_WORKERS: 同時に計算するワーカー数。既定は thread なら min(4, コア数)、process なら
+#   コア数。sqlglot は純 Python で GIL を離さないため、スレッドを増やしてもスループットは
+#   上がらず、待ち行列が実行中に変わるだけになる。
+# LINEAGE_POOL_QUEUE_DEPTH: ワーカーが埋まっているときに待たせてよい件数。これを超えた
+#   リクエストは即座に 503 を返す(ゲートウェイのタイムアウトまで積み上げない)。
+LINEAGE_POOL_MODE = os.getenv('LINEAGE_POOL_MODE', 'thread').lower()
+LINEAGE_POOL_WORKERS = int(os.getenv('LINEAGE_POOL_WORKERS') or (
+    os.cpu_count() or 1 if LINEAGE_POOL_MODE == 'process' else min(4, os.cpu_count() or 1)))
+LINEAGE_POOL_QUEUE_DEPTH = int(os.getenv('LINEAGE_POOL_QUEUE_DEPTH', '16'))
+
+# これ以上の大きさ(バイト)の JSON レスポンスは、Accept-Encoding に応じて br / gzip で圧縮する。
+# 0 で圧縮しない。br は brotli パッケージが入っているときだけ使う。
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+
+# /lineage・/cte のレスポンスの結果キャッシュ。キーは正規化したクエリと manifest/catalog の版
+# (metadata.invocation_id。無ければ更新時刻)なので、dbt の成果物が変われば自動的に使われなくなる。
+# LINEAGE_RESULT_CACHE_MAX_ENTRIES: 件数上限。0 でキャッシュしない。
+# LINEAGE_RESULT_CACHE_MAX_MB: メモリ上限(レスポンスのバイト数の合計)。
+# LINEAGE_RESULT_CACHE_TTL_SECONDS: 0 より大きければ、この秒数を過ぎた結果は使わない。
+# LINEAGE_RESULT_CACHE_DB: 設定すると SQLite にも保存し、再起動後や他のワーカーと共有する。
+LINEAGE_RESULT_CACHE_MAX_ENTRIES = int(os.getenv('LINEAGE_RESULT_CACHE_MAX_ENTRIES', '512'))
+LINEAGE_RESULT_CACHE_MAX_MB = float(os.getenv('LINEAGE_RESULT_CACHE_MAX_MB', '256'))
+LINEAGE_RESULT_CACHE_TTL_SECONDS = float(os.getenv('LINEAGE_RESULT_CACHE_TTL_SECONDS', '0'))
+LINEAGE_RESULT_CACHE_DB = os.getenv('LINEAGE_RESULT_CACHE_DB')
+
+# POST /api/v1/lineage/batch で1回に受け付ける起点の上限
+BATCH_LINEAGE_MAX_SEEDS = int(os.getenv('BATCH_LINEAGE_MAX_SEEDS', '1000'))
+
+# パース済みモデル(AST / MappingSchema / qualify 済み Scope)のプロセス内キャッシュの上限。
+# 同じステージングモデルが1回の探索で何十回も訪問されるため、リクエストを跨いで保持する。
+# MB はコンパイル済み SQL 長からの概算(cache.PARSED_BYTES_PER_CHAR)で判定する。
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv('PARSE_CACHE_MAX_ENTRIES', '2048'))
+PARSE_CACHE_MAX_MB = float(os.getenv('PARSE_CACHE_MAX_MB', '512'))
+# forward カラムリネージの (モデル, カラム) -> 上流 (labels/columns) のプロセス内キャッシュの件数上限。
+# 1件は数百バイト程度なので件数だけで縛る。
+COLUMN_LINEAGE_CACHE_MAX_ENTRIES = int(os.getenv('COLUMN_LINEAGE_CACHE_MAX_ENTRIES', '200000'))
+
+# manifest.json / catalog.json の更新を監視する間隔(秒)。0 以下で監視しない(既定)。
+# 変更を検知するとバックグラウンドで読み直し、処理中のリクエストを止めずに差し替える。
+# 監視しない場合も POST /api/v1/admin/reload で読み直せる。
+MANIFEST_WATCH_SECONDS = float(os.getenv('MANIFEST_WATCH_SECONDS', '0'))
+
+# リバースカラムリネージ索引を永続化する SQLite ファイルのパス。未設定なら永続化しない(従来挙動)。
+# 設定すると同一マシンの全ワーカーと再起動後のプロセスで索引を共有し、デプロイ直後も
+# ハブモデルの初回リバース探索で索引を作り直さずに済む(dbt の成果物が変わった source だけ再構築)。
+# 例: /app/target/reverse_index.sqlite
+REVERSE_INDEX_DB = os.getenv('REVERSE_INDEX_DB')
+
+# manifest のコンパイル済み SQL をメモリに持たず、読み込み時に一時ファイルへ書き出して必要なときに読むか。
+# 大きなプロジェクトでは compiled_code が manifest のメモリの大半を占める。false で従来どおりメモリに持つ。
+LAZY_COMPILED_SQL = os.getenv('LAZY_COMPILED_SQL', 'true').lower() == 'true'
@@ -0,0 +1,140 @@
+class LineageGraph:
+    """React Flow に返すノード/エッジを id で索引しながら組み立てる。
+
+    ノード/エッジは id -> dict で持ち、重複判定とカラムのマージを O(1) で行う。dict は追加順を
+    保つので、to_dict() の出力は従来のリスト + 線形探索の実装とまったく同じ順序になる。
+
+    listener を渡すと、グラフが変化するたびにその差分をイベント(dict)として渡す
+    (ストリーミング API 用)。retain=False ならノード/エッジ本体は保持せず、重複判定に必要な
+    id・カラム・要素 id だけを持つ(node_list()/edge_list() は使えない)。"""
+
+    def __init__(self, listener=None, retain: bool = True):
+        self.listener = listener
+        self.retain = retain
+        self.nodes = {}
+        self.edges = {}
+        # ノード id -> data.columns に含まれるカラム(重複追加の判定用)
+        self._node_columns = {}
+        # data.name -> そのnameを持つ最初のノード id
+        self._node_ids_by_name = {}
+        # ダッシュボードノード id -> data.elements に含まれる要素 id
+        self._dashboard_element_ids = {}
+        # 立てた (ノード id, フラグ名)
+        self._flags = set()
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self.nodes
+
+    def get_node(self, node_id: str) -> dict | None:
+        return self.nodes.get(node_id)
+
+    def find_node_by_name(self, name: str) -> dict | None:
+        node_id = self._node_ids_by_name.get(name)
+        return self.nodes[node_id] if node_id is not None else None
+
+    def find_node_id_by_name(self, name: str) -> str | None:
+        return self._node_ids_by_name.get(name)
+
+    def _emit(self, event: dict):
+        if self.listener is not None:
+            self.listener(event)
+
+    def add_node(self, node: dict) -> bool:
+        """ノードを追加する。同じ id が既にあれば何もせず False。"""
+        node_id = node['id']
+        if node_id in self.nodes:
+            return False
+        self.nodes[node_id] = node if self.retain else None
+        data = node.get('data', {})
+        if 'columns' in data:
+            self._node_columns[node_id] = set(data['columns'])
+        if 'elements' in data:
+            self._dashboard_element_ids[node_id] = {e['id'] for e in data['elements']}
+        if 'name' in data:
+            self._node_ids_by_name.setdefault(data['name'], node_id)
+        if self.listener is not None:
+            # 保持しているノードは後から columns 等が追記されるので、その時点の内容を渡す
+            self._emit({'event': 'node', 'node': {**node, 'data': _snapshot(data)} if self.retain else node})
+        return True
+
+    def merge_columns(self, node_id: str, columns: list):
+        """既存ノードの data.columns に、まだ無いカラムだけを順序を保って追加する。"""
+        exist_columns = self.nodes[node_id]['data']['columns'] if self.retain else None
+        seen = self._node_columns.setdefault(node_id, set(exist_columns or []))
+        added = []
+        for column in columns:
+            if column not in seen:
+                seen.add(column)
+                added.append(column)
+        if not added:
+            return
+        if exist_columns is not None:
+            exist_columns.extend(added)
+        self._emit({'event': 'columns', 'id': node_id, 'columns': added})
+
+    def merge_dashboard_elements(self, node_id: str, elements: list):
+        """既存ダッシュボードノードの data.elements に、まだ無い要素だけを追加する。"""
+        exist_elements = self.nodes[node_id]['data']['elements'] if self.retain else None
+        seen = self._dashboard_element_ids.setdefault(node_id, {e['id'] for e in exist_elements or []})
+        added = []
+        for element in elements:
+            if element['id'] not in seen:
+                seen.add(element['id'])
+                added.append(element)
+        if not added:
+            return
+        if exist_elements is not None:
+            exist_elements.extend(added)
+        self._emit({'event': 'elements', 'id': node_id, 'elements': added})
+
+    def set_flag(self, node_id: str, flag: str):
+        """ノードの data.<flag>(first/last)を立てる。"""
+        if (node_id, flag) in self._flags:
+            return
+        self._flags.add((node_id, flag))
+        if self.retain:
+            self.nodes[node_id]['data'][flag] = True
+        self._emit({'event': 'flag', 'id': node_id, 'flag': flag})
+
+    def has_edge(self, edge_id: str) -> bool:
+        return edge_id in self.edges
+
+    def add_edge(self, edge: dict) -> bool:
+        """エッジを追加する。同じ id が既にあれば何もせず False。"""
+        if edge['id'] in self.edges:
+            return False
+        self.edges[edge['id']] = edge if self.retain else None
+        self._emit({'event': 'edge', 'edge': edge})
+        return True
+
+    def merge(self, other: 'LineageGraph'):
+        """別セッションのグラフを取り込む。同じ id のノードはカラム・ダッシュボード要素をマージし、
+        first/last はどちらかで立っていれば立てる。other はこの後使わないこと(ノードを共有する)。"""
+        for node_id, node in other.nodes.items():
+            if self.add_node(node):
+                continue
+            data = node.get('data', {})
+            if 'columns' in data:
+                self.merge_columns(node_id, data['columns'])
+            if 'elements' in data:
+                self.merge_dashboard_elements(node_id, data['elements'])
+            for flag in ('first', 'last'):
+                if data.get(flag):
+                    self.set_flag(node_id, flag)
+        for edge in other.edges.values():
+            self.add_edge(edge)
+
+    def node_list(self) -> list:
+        return list(self.nodes.values())
+
+    def edge_list(self) -> list:
+        return list(self.edges.values())
+
+
+def _snapshot(data: dict) -> dict:
+    """ノードの data の、後から追記されるリスト(columns/elements)だけを複製する。"""
+    data = dict(data)
+    for key in ('columns', 'elements'):
+        if key in data:
+            data[key] = list(data[key])
+    return data
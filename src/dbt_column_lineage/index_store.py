@@ -0,0 +1,87 @@
+import json
+import os
+import sqlite3
+import time
+
+import sqlglot
+
+# 索引の形式を変えたら上げる(古い形式の行は別キーになり参照されなくなる)
+INDEX_FORMAT_VERSION = 1
+
+# source ごとに残す世代(fingerprint)の数。ホットリロードやデプロイの途中は新旧の版のワーカーが
+# 同じファイルに書くので、最新の1世代だけを残すと互いの行を消し合って毎回作り直しになる
+KEEP_GENERATIONS = 3
+
+
+class ReverseIndexStore:
+    """リバースカラムリネージの source 単位索引(DbtSqlglot.__build_reverse_indexes の結果)を
+    SQLite に永続化する。
+
+    キーは source と DbtProject.reverse_index_fingerprint(子モデルの compiled_code・依存スキーマの
+    ハッシュ)。同じマシン上の全ワーカー・再起動後のプロセスで共有され、dbt の成果物が変わった
+    source だけが別キーになって作り直される。sqlglot のバージョンと方言も鍵に含める(結果が
+    変わり得るため)。接続は操作毎に開く(スレッド/プロセスを跨いで安全に使うため)。
+    永続化はあくまでキャッシュなので、失敗しても例外は送出せずログだけ残す。"""
+
+    def __init__(self, path: str, dialect: str, logger):
+        self.path = path
+        self.logger = logger
+        self.salt = f'{INDEX_FORMAT_VERSION}:{sqlglot.__version__}:{dialect}'
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            # 複数ワーカーの同時読み書きのため WAL にする
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS reverse_index ('
+                ' source TEXT NOT NULL,'
+                ' fingerprint TEXT NOT NULL,'
+                ' entries TEXT NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' PRIMARY KEY (source, fingerprint))'
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def get(self, source: str, fingerprint: str) -> list | None:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT entries FROM reverse_index WHERE source = ? AND fingerprint = ?',
+                    (source, f'{self.salt}:{fingerprint}'),
+                ).fetchone()
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f'reverse index store read error. path={self.path}, error={e}')
+            return None
+        return json.loads(row[0]) if row else None
+
+    def put(self, source: str, fingerprint: str, entries: list):
+        key = f'{self.salt}:{fingerprint}'
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO reverse_index (source, fingerprint, entries, created_at) VALUES (?, ?, ?, ?)',
+                        (source, key, json.dumps(entries, separators=(',', ':')), time.time()),
+                    )
+                    # 同じ source の古い世代は(新しい方から KEEP_GENERATIONS を残して)消す
+                    conn.execute(
+                        'DELETE FROM reverse_index WHERE source = ? AND fingerprint NOT IN ('
+                        ' SELECT fingerprint FROM reverse_index WHERE source = ? ORDER BY created_at DESC, rowid DESC LIMIT ?)',
+                        (source, source, KEEP_GENERATIONS),
+                    )
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f'reverse index store write error. path={self.path}, error={e}')
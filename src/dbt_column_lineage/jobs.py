@@ -0,0 +1,218 @@
+"""LineagePool で実行するリネージ計算のジョブ。
+
+process モードのプールへ pickle して渡すため、すべてモジュールレベルの関数にしている。
+logger は名前で pickle されるので、子プロセス側では同名の logger が使われる。"""
+import json
+import threading
+import time
+
+from dbt_column_lineage.graph import LineageGraph
+from dbt_column_lineage.lineage import DbtSqlglot, lineage_deadline
+from dbt_column_lineage.profiling import RequestProfile, server_timing
+from dbt_column_lineage.project import DbtProject
+from dbt_column_lineage.responses import EncodedBody, ResponseStats, encode_json
+from dbt_column_lineage.stream import EventEmitter, StreamCancelled
+
+# encoded_job の実行中に、ジョブが作ったセッション(探索の深さと打ち切りをメトリクスに返すため)。
+# ジョブは encoded_job と同じワーカーのスレッドで同期的に動くので、スレッドごとに持つ
+_tracked = threading.local()
+
+
+def load_project(logger):
+    """process モードの子プロセスの初期化。最初のリクエストを待たずにプロジェクトを読み込む
+    (スナップショットがあれば、コンパイル済み SQL は全プロセスで同じページを mmap する)。"""
+    try:
+        DbtProject.get(logger)
+    except Exception as e:
+        # 失敗しても子プロセスは起動させる(最初のジョブで読み込みを再試行し、エラーを返す)
+        logger.error(f'dbt project load error. error={e}')
+
+
+def encoded_job(fn, encoding: str | None, *args) -> EncodedBody | None:
+    """fn(*args) の結果を、ワーカー側で直列化(と encoding での圧縮)まで済ませて返す。
+    大きなグラフでもイベントループ(と process モードの pickle)は bytes だけを扱う。
+    /metrics 用に、ノード・エッジ数と探索の深さを stats に付ける。"""
+    _tracked.sessions = sessions = []
+    try:
+        res = fn(*args)
+    finally:
+        _tracked.sessions = None
+    if res is None:
+        return None
+    stats = _response_stats(res, sessions)
+    timing = res.get('timing') if isinstance(res, dict) else None
+    if timing is None:
+        return encode_json(res, encoding)._replace(stats=stats)
+    # debug=timing: 直列化・圧縮の時間も Server-Timing に足す
+    started = time.perf_counter()
+    encoded = encode_json(res, encoding)
+    encode_ms = round((time.perf_counter() - started) * 1000, 3)
+    return encoded._replace(server_timing=f'{server_timing(timing)}, encode;dur={encode_ms}', stats=stats)
+
+
+def _track(dbt_sqlglot: DbtSqlglot) -> DbtSqlglot:
+    """encoded_job の中で動いていれば、セッションを stats の集計対象に加える。"""
+    sessions = getattr(_tracked, 'sessions', None)
+    if sessions is not None:
+        sessions.append(dbt_sqlglot)
+    return dbt_sqlglot
+
+
+def _response_stats(res: dict, sessions: list) -> ResponseStats:
+    # merge=False のバッチは起点ごとのグラフの合計
+    graphs = res.get('results', [res])
+    return ResponseStats(
+        nodes=sum(len(graph.get('nodes', [])) for graph in graphs),
+        edges=sum(len(graph.get('edges', [])) for graph in graphs),
+        depth=max((dbt_sqlglot.max_depth for dbt_sqlglot in sessions), default=0),
+        # バッチで時間切れのため計算しなかった起点はセッションを持たず、結果の truncated にだけ出る
+        truncated=(any(dbt_sqlglot.budget_truncated for dbt_sqlglot in sessions)
+                   or any(graph.get('truncated') for graph in graphs)),
+    )
+
+
+def _new_profile(profile: bool) -> RequestProfile | None:
+    return RequestProfile() if profile else None
+
+
+def _with_timing(res: dict, profile: RequestProfile | None) -> dict:
+    if profile is not None:
+        res['timing'] = profile.as_dict()
+    return res
+
+
+def lineage_job(logger, sources: str, columns: str, show_column: bool, reverse: bool, depth: int,
+                profile: bool = False) -> dict:
+    """profile=True(debug=timing)なら、結果に段階ごとの時間などの timing を付ける。"""
+    request_profile = _new_profile(profile)
+    dbt_sqlglot = _track(DbtSqlglot(logger, request_depth=depth, profile=request_profile))
+    _run_lineage(dbt_sqlglot, sources, columns, show_column, reverse)
+    return _with_timing(dbt_sqlglot.ret_edges_nodes(), request_profile)
+
+
+def lineage_stream_job(events, cancel, logger, sources: str, columns: str, show_column: bool, reverse: bool,
+                       depth: int, profile: bool = False):
+    """lineage_job と同じ計算をしながら、見つかったノード/エッジをその都度 events へ送る
+    (LineagePool.stream 用)。グラフ本体は保持しない。最後に summary(エラー時は error)を送る。
+    profile=True なら summary に timing を付ける(ヘッダーは送信済みなので Server-Timing は無い)。"""
+    emitter = EventEmitter(events, cancel)
+    graph = LineageGraph(listener=emitter.emit, retain=False)
+    request_profile = _new_profile(profile)
+    try:
+        dbt_sqlglot = DbtSqlglot(logger, request_depth=depth, graph=graph, profile=request_profile)
+        _run_lineage(dbt_sqlglot, sources, columns, show_column, reverse)
+        emitter.emit(_with_timing({
+            'event': 'summary',
+            'truncated': dbt_sqlglot.budget_truncated,
+            'nodes': len(graph.nodes),
+            'edges': len(graph.edges),
+            'depth': dbt_sqlglot.max_depth,
+        }, request_profile))
+    except StreamCancelled:
+        logger.info(f'lineage stream cancelled: {sources}')
+    except Exception as e:
+        logger.exception(f'lineage stream failed: {sources}')
+        if not cancel.is_set():
+            emitter.emit({'event': 'error', 'detail': str(e)})
+    finally:
+        emitter.close()
+
+
+def _run_lineage(dbt_sqlglot, sources: str, columns: str, show_column: bool, reverse: bool):
+    if show_column:
+        parsed_columns = json.loads(columns)
+        for source in sources.split(','):
+            for column in parsed_columns.get(source, ['']):
+                dbt_sqlglot.column_lineage(source, column.upper(), reverse)
+    else:
+        for source in sources.split(','):
+            dbt_sqlglot.table_lineage(source, reverse)
+
+
+def batch_lineage_job(logger, seeds: list, merge: bool, profile: bool = False) -> dict:
+    """複数の起点 {'source','column','reverse','depth'} のリネージをまとめて計算する。
+    column が空ならテーブルリネージ。同じ起点は1回だけ計算する。
+
+    merge=True なら同じ depth の起点を1つのセッションで計算して1つのグラフにまとめる
+    (セッション内の展開済み (モデル, カラム) の記録で、起点間で共通の部分グラフは1回だけ辿る)。
+    merge=False なら起点ごとのグラフを入力順に返す。起点ごとに別のセッションで辿るので、共通の
+    部分グラフの探索・グラフの組み立て・直列化は起点ごとに行い、共有されるのはパース結果・
+    カラムリネージ・リバース索引のキャッシュだけ(セッション内の展開済みの記録はグラフに
+    追加済みであることを前提にしているため、1つのセッションから起点ごとのグラフは切り出せない)。profile=True なら全起点をまとめた timing を付ける。
+
+    時間予算(MAX_LINEAGE_SECONDS)はリクエスト全体で1つ。締切は全セッションで共有し、締切を
+    過ぎた後の起点は計算せず truncated にする(起点の数だけ予算を掛け算しない)。"""
+    keys = [(seed['source'], (seed.get('column') or '').upper(), bool(seed.get('reverse')), seed.get('depth', -1))
+            for seed in seeds]
+    unique_keys = list(dict.fromkeys(keys))
+    # 途中でプロジェクトが読み直されても、全起点を同じスナップショットで計算する
+    project = None
+    request_profile = _new_profile(profile)
+    deadline = lineage_deadline()
+
+    def out_of_time() -> bool:
+        if deadline is None or time.monotonic() <= deadline:
+            return False
+        if request_profile is not None:
+            request_profile.budget_truncated()
+        return True
+
+    def run(dbt_sqlglot, source, column, reverse):
+        if column:
+            dbt_sqlglot.column_lineage(source, column, reverse)
+        else:
+            dbt_sqlglot.table_lineage(source, reverse)
+
+    if merge:
+        sessions = {}
+        skipped = False
+        for source, column, reverse, depth in unique_keys:
+            if out_of_time():
+                # 残りの起点は計算しない
+                skipped = True
+                break
+            dbt_sqlglot = sessions.get(depth)
+            if dbt_sqlglot is None:
+                dbt_sqlglot = sessions[depth] = _track(DbtSqlglot(logger, request_depth=depth, project=project,
+                                                                  profile=request_profile, deadline=deadline))
+                project = dbt_sqlglot.project
+            run(dbt_sqlglot, source, column, reverse)
+        if len(sessions) == 1 and not skipped:
+            return _with_timing(next(iter(sessions.values())).ret_edges_nodes(), request_profile)
+        graph = LineageGraph()
+        for dbt_sqlglot in sessions.values():
+            graph.merge(dbt_sqlglot.graph)
+        return _with_timing({
+            'edges': graph.edge_list(),
+            'nodes': graph.node_list(),
+            'truncated': skipped or any(dbt_sqlglot.budget_truncated for dbt_sqlglot in sessions.values()),
+        }, request_profile)
+
+    results = {}
+    for key in unique_keys:
+        if out_of_time():
+            results[key] = {'edges': [], 'nodes': [], 'truncated': True}
+            continue
+        source, column, reverse, depth = key
+        dbt_sqlglot = _track(DbtSqlglot(logger, request_depth=depth, project=project, profile=request_profile,
+                                        deadline=deadline))
+        project = dbt_sqlglot.project
+        run(dbt_sqlglot, source, column, reverse)
+        results[key] = dbt_sqlglot.ret_edges_nodes()
+    return _with_timing({'results': [
+        {**dict(zip(('source', 'column', 'reverse', 'depth'), key)), **results[key]} for key in keys
+    ]}, request_profile)
+
+
+def dashboard_lineage_job(logger, dashboard_id: str, depth: int, profile: bool = False) -> dict:
+    request_profile = _new_profile(profile)
+    dbt_sqlglot = _track(DbtSqlglot(logger, request_depth=depth, profile=request_profile))
+    dbt_sqlglot.dashboard_lineage(dashboard_id)
+    return _with_timing(dbt_sqlglot.ret_edges_nodes(), request_profile)
+
+
+def cte_job(logger, source: str, columns: list, profile: bool = False) -> dict | None:
+    request_profile = _new_profile(profile)
+    dbt_sqlglot = _track(DbtSqlglot(logger, profile=request_profile))
+    res = dbt_sqlglot.cte_dependency(source, columns)
+    return None if res is None else _with_timing(res, request_profile)
@@ -0,0 +1,130 @@
+"""巨大な JSON ファイル(manifest.json / catalog.json)を先頭から少しずつ読む。
+
+json.load はファイル全体を1つの文字列にし、さらに全体を dict にするので、ピークメモリが
+ファイルサイズの数倍になる。JsonStreamReader はオブジェクトのキーを1つずつ返し、呼び出し側が
+値ごとに「丸ごと読む」「さらに中のキーを1つずつ読む」「読み飛ばす」を選ぶ。手元に持つのは
+読み込み中のチャンクと、その時点で読んでいる値1つだけになる。値の解析には標準ライブラリの
+JSONDecoder.raw_decode(C 実装)を使うので、追加の依存は要らない。"""
+import codecs
+import json
+import re
+import typing as t
+
+# 1回に読むバイト数。1つの値がこれより大きければ、読み切るまでバッファを倍々に広げる
+CHUNK_BYTES = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_CHARS = re.compile(r'[-+0-9.eE]*')
+# 解析に失敗した位置からバッファの末尾まで。区切り文字も空白も無ければ、書きかけのトークンが
+# チャンクの境目で切れているだけかもしれない
+_PARTIAL_TOKEN = re.compile(r'[^ \t\n\r,:\[\]{}"]*\Z')
+
+
+class JsonStreamReader:
+    """バイナリモードで開いたファイルから JSON を逐次読む。
+
+        reader = JsonStreamReader(f)
+        for key in reader.items():
+            if key == 'nodes':
+                for unique_id in reader.items():
+                    node = reader.value()
+            else:
+                reader.skip()
+
+    items() が返したキーごとに、呼び出し側は value() / items() / skip() のどれかで値を
+    必ず1つ読むこと。"""
+
+    def __init__(self, f: t.BinaryIO, chunk_bytes: int = CHUNK_BYTES):
+        self._file = f
+        self._chunk_bytes = chunk_bytes
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def items(self) -> t.Iterator[str]:
+        """現在位置のオブジェクトのキーを順に返す。"""
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise self._error('expected an object key')
+            key = self.value()
+            self._expect(':')
+            yield key
+            separator = self._peek()
+            self._pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise self._error("expected ',' or '}'")
+
+    def value(self):
+        """現在位置の値を1つ丸ごと読む。"""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                # 値がバッファの途中で切れているなら読み足す。失敗した位置の後ろに次の区切りまで
+                # 読めているのに解析できないなら、残りを読まずに不正な JSON として送出する
+                if self._eof or not _may_be_truncated(e):
+                    raise
+                self._fill(len(self._buf) - self._pos)
+                continue
+            # 数値がチャンクの境目で切れているかもしれない(-0. まで読めた時点で -0 と解析される)
+            if not self._eof and _NUMBER_CHARS.match(self._buf, end).end() == len(self._buf):
+                self._fill(len(self._buf) - self._pos)
+                continue
+            self._pos = end
+            return value
+
+    def skip(self):
+        """現在位置の値を読み飛ばす。オブジェクトは中のキーごとに読み捨てるので、
+        大きなオブジェクト(macros・docs など)でも全体をメモリに持たない。"""
+        if self._peek() == '{':
+            for _ in self.items():
+                self.skip()
+        else:
+            self.value()
+
+    def _peek(self) -> str:
+        self._skip_whitespace()
+        if self._pos >= len(self._buf):
+            raise self._error('unexpected end of JSON')
+        return self._buf[self._pos]
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise self._error(f"expected '{char}'")
+        self._pos += 1
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or self._eof:
+                return
+            self._fill(0)
+
+    def _fill(self, pending: int):
+        """読み終えた部分を捨て、少なくとも pending 文字ぶん以上を追加で読む。"""
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        data = self._file.read(max(self._chunk_bytes, pending))
+        if not data:
+            self._eof = True
+        self._buf += self._utf8.decode(data, final=not data)
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buf, self._pos)
+
+
+def _may_be_truncated(e: json.JSONDecodeError) -> bool:
+    """raw_decode の失敗が、バッファの末尾で値が切れているせいかもしれないか。"""
+    # 閉じていない文字列は、失敗位置が文字列の先頭になるので後ろの内容では判断できない
+    if e.msg.startswith('Unterminated string'):
+        return True
+    return _PARTIAL_TOKEN.match(e.doc, e.pos) is not None
@@ -1,71 +1,104 @@
-import json
 import time
 import typing as t
 
-from sqlglot import exp, parse_one, MappingSchema, Schema
+from sqlglot import exp, parse_one, Schema
 from sqlglot.expressions import Expression
 from sqlglot.errors import SqlglotError
 from sqlglot.lineage import lineage
-from sqlglot.optimizer import build_scope, Scope, qualify
+from sqlglot.optimizer import Scope
+
+from dbt_column_lineage.cache import ParsedModel, PARSED_BYTES_PER_CHAR
+from dbt_column_lineage.constants import DBT_DOCS_BASE_URL, MAX_LINEAGE_SECONDS
+from dbt_column_lineage.graph import LineageGraph
+from dbt_column_lineage.node_ids import node_id
+from dbt_column_lineage.profiling import NULL_PROFILE, RequestProfile
+from dbt_column_lineage.project import DbtProject
+
+# Column が持てる識別子の数(catalog.db.table.name)。パーサはそれより長いドット連結を Dot にする
+_COLUMN_PARTS = 4
+
+
+def _referenced_column_names(expression: Expression) -> t.Iterator[str]:
+    """式が参照するカラム名(alias_or_name)を、式の木を辿って返す。
+    以前は式を SQL に戻して parse_one し直してから find_all(exp.Column) していたので、それと同じ
+    名前になるようにしている: qualify 後の構造体フィールド参照 Dot(t.col, field) は、再パース
+    すると t.col.field という1つの Column になり名前が field になる。"""
+    for column in expression.find_all(exp.Column):
+        parts = [part.name for part in column.parts]
+        node = column
+        while isinstance(node.parent, exp.Dot) and node.arg_key == 'this' and isinstance(node.parent.expression, exp.Identifier):
+            node = node.parent
+            parts.append(node.expression.name)
+        yield parts[min(len(parts), _COLUMN_PARTS) - 1]
+
+
+def _leaf_column_name(name: str) -> str:
+    """テーブル末端のリネージノード名(Column を既定の方言で SQL にしたもの。例: "T"."ID")から
+    カラム名を取り出す。parse_one(name).alias_or_name と同じ値を、パースせずに返す。"""
+    parts = []
+    part = []
+    quoted = False
+    i = 0
+    while i < len(name):
+        char = name[i]
+        if char == '"':
+            if quoted and name[i + 1:i + 2] == '"':
+                part.append('"')
+                i += 1
+            else:
+                quoted = not quoted
+        elif char == '.' and not quoted:
+            parts.append(''.join(part))
+            part = []
+        else:
+            part.append(char)
+        i += 1
+    parts.append(''.join(part))
+    return parts[min(len(parts), _COLUMN_PARTS) - 1]
+
 
-from dbt_column_lineage.constants import SQLGLOT_DIALECT, USE_LOOKER, DBT_DOCS_BASE_URL, MAX_LINEAGE_SECONDS
-from dbt_column_lineage.looker import Looker
-from dbt_column_lineage.utils import get_dbt_project_dir
+def lineage_deadline() -> t.Optional[float]:
+    """今から MAX_LINEAGE_SECONDS 後の締切(time.monotonic の値)。MAX_LINEAGE_SECONDS<=0 なら None(無制限)。"""
+    return (time.monotonic() + MAX_LINEAGE_SECONDS) if MAX_LINEAGE_SECONDS and MAX_LINEAGE_SECONDS > 0 else None
 
 
 class DbtSqlglot:
-    _instance = None
-
-    def __new__(cls, logger, request_depth=-1):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
-
-    def __init__(self, logger, request_depth=-1):
-        # 毎度初期化する変数
-        self.nodes = []
-        self.edges = []
+    """1リクエスト分のリネージセッション。
+
+    構築中のグラフ(nodes/edges)、要求 depth、時間予算だけを持つ軽量オブジェクトで、
+    リクエスト毎に生成する。manifest/catalog と索引キャッシュは共有の DbtProject を参照する
+    (リクエスト毎に manifest を複製しない)。"""
+
+    def __init__(self, logger, request_depth=-1, project: t.Optional[DbtProject] = None,
+                 graph: t.Optional[LineageGraph] = None, profile: t.Optional[RequestProfile] = None,
+                 deadline: t.Optional[float] = None):
+        self.project = project or DbtProject.get(logger)
+        self.logger = logger
+        self.dialect = self.project.dialect
+        self.looker = self.project.looker
+
+        self.graph = graph if graph is not None else LineageGraph()
         self.target_dashboard_ids = []
         self.request_depth = request_depth
         # 時間予算(MAX_LINEAGE_SECONDS)による打ち切りが起きたか。フロントの truncated バナーは
         # この“想定外の保護打ち切り”専用。要求 depth に達して止まるのは設計どおりなので含めない
         # (depth=1 のテーブル表示で毎回バナーが出てしまう問題を避ける)。
         self.budget_truncated = False
+        # 実際に辿った最も深い段数(起点が 0。メトリクスの探索の深さ)
+        self.max_depth = 0
+        # forward で上流を展開済みの (モデル, カラム) -> 展開したときの depth
+        self._expanded_columns = {}
+        # reverse で下流を展開済みの (モデル, カラム) -> 起点からの段数
+        self._reverse_expanded = {}
         # 時間予算の締切(MAX_LINEAGE_SECONDS>0 のときだけ。それ以外は None=無制限)。
-        self._deadline = (time.monotonic() + MAX_LINEAGE_SECONDS) if MAX_LINEAGE_SECONDS and MAX_LINEAGE_SECONDS > 0 else None
-
-        if self._initialized:
-            return
-        self._initialized = True
-
-        # リバースカラムリネージの source 単位索引キャッシュ。
-        # per-request リセット(上の nodes/edges クリア)の外、_initialized ガードの
-        # 内側に置くことで、パースした dbt ファイル同様プロセス内で一度だけ保持される。
-        self.__reverse_index_cache = {}
-
-        dbt_project_dir = get_dbt_project_dir()
-        with open(f'{dbt_project_dir}/target/manifest.json') as f:
-            manifest = json.load(f)
-        with open(f'{dbt_project_dir}/target/catalog.json') as f:
-            catalog = json.load(f)
-
-        self.dbt_metadata = manifest['metadata']
-        self.dbt_manifest_nodes = manifest['nodes']
-        self.dbt_manifest_sources = manifest['sources']
-        self.dbt_catalog_nodes = catalog['nodes']
-        self.dbt_manifest_child_map = manifest['child_map']
-        self.dbt_manifest_parent_map = manifest['parent_map']
-
-        self.looker = None
-        if USE_LOOKER:
-            self.looker = Looker(logger)
-        self.logger = logger
-        self.dialect = SQLGLOT_DIALECT
+        # 複数のセッションで1つのリクエストを計算する(バッチ)ときは、リクエストの締切を渡す
+        self._deadline = deadline if deadline is not None else lineage_deadline()
+        # debug=timing のときだけ段階ごとの時間などを記録する(それ以外は何もしない NULL_PROFILE)
+        self.profile = profile if profile is not None else NULL_PROFILE
 
     def project_name(self):
-        self.logger.info(self.dbt_metadata)
-        return self.dbt_metadata['project_name']
+        self.logger.info(self.project.dbt_metadata)
+        return self.project.dbt_metadata['project_name']
 
     def schema_by_source(self, source: str):
         dbt_node = self.__get_dbt_node(source)
@@ -79,57 +112,19 @@ class DbtSqlglot:
         return lowercase_dbt_columns
 
     def list_schemas(self):
-        schemas = []
-        ret = []
-        for k in self.dbt_manifest_nodes:
-            dbt_node = self.dbt_manifest_nodes[k]
-            dbt_schema = dbt_node['schema']
-            if (dbt_schema not in schemas and
-                bool(dbt_node['columns']) and
-                dbt_node['resource_type'] == 'model' and
-                dbt_node['package_name'] == self.dbt_metadata['project_name']):
-                schemas.append(dbt_schema)
-        schemas.sort()
-        for schema in schemas:
-            ret.append({'value': schema, 'label': schema})
-        return ret
+        return self.project.schema_options
 
     def list_sources(self, req_schema):
-        tmp = []
-        for k in self.dbt_manifest_nodes:
-            dbt_node = self.dbt_manifest_nodes[k]
-            dbt_resource_type = dbt_node['resource_type']
-            dbt_schema = dbt_node['schema']
-            dbt_alias = dbt_node['alias']
-            # (例) fqn = ['data_cuisine_dbt', 'raw_coredb_hourly', 'xxx', 'yyy', 'model_name']
-            # ↑の 'xxx/yyy' の部分がほしい
-            dbt_fqn = '/'.join(dbt_node['fqn'][2:-1])
-            if dbt_resource_type == 'model' and dbt_schema == req_schema:
-                tmp.append({'fqn': dbt_fqn, 'alias': dbt_alias})
-        label_fqn_alias = {}
-        for t in tmp:
-            fqn = t['fqn']
-            if not label_fqn_alias.get(fqn):
-                label_fqn_alias[fqn] = []
-            label_fqn_alias[fqn].append({'value': t['alias'], 'label': t['alias']})
-        ret = []
-        for label in label_fqn_alias:
-            # ソート
-            label_fqn_alias[label].sort(key=lambda v: v['label'])
-            ret.append({'label': label, 'options': label_fqn_alias[label]})
-        ret = sorted(ret, key=lambda x:x['label'])
-        return ret
+        return self.project.source_options_by_schema.get(req_schema, [])
 
     def list_columns(self, req_source):
-        for k in self.dbt_manifest_nodes:
-            dbt_node = self.dbt_manifest_nodes[k]
-            dbt_alias = dbt_node['alias']
-            dbt_columns = dbt_node['columns']
-            if dbt_alias == req_source:
-                ret = []
-                for key, value in dbt_columns.items():
-                    ret.append({'value': key, 'label': value['name'], 'description': value['description']})
-                return ret
+        dbt_node = self.project.nodes_by_alias.get(req_source)
+        if dbt_node is None:
+            return None
+        ret = []
+        for key, value in dbt_node['columns'].items():
+            ret.append({'value': key, 'label': value['name'], 'description': value['description']})
+        return ret
 
     def dashboard_lineage(self, dashboard_id: str):
         tables = set()
@@ -158,13 +153,14 @@ class DbtSqlglot:
 
 
     def ret_edges_nodes(self) -> dict:
-        return {'edges': self.edges, 'nodes': self.nodes, 'truncated': self.budget_truncated}
+        return {'edges': self.graph.edge_list(), 'nodes': self.graph.node_list(), 'truncated': self.budget_truncated}
 
     def _budget_exceeded(self) -> bool:
         """時間予算(MAX_LINEAGE_SECONDS)を超えていれば打ち切りフラグを立てて True。
         コストが横幅(ハブ列の全下流など)の場合に、形状に依らず処理を止める保護。"""
         if self._deadline is not None and time.monotonic() > self._deadline:
             self.budget_truncated = True
+            self.profile.budget_truncated()
             return True
         return False
 
@@ -177,15 +173,15 @@ class DbtSqlglot:
         compiled_code = dbt_node.get('compiled_code')
         description = dbt_node.get('description')
         dbt_columns = dbt_catalog.get('columns')
-        dbt_depends_on_nodes = dbt_node.get('depends_on', {}).get('nodes', [])
 
         if compiled_code is None:
             self.logger.info('compiled_code is None')
             return None
-        entire_meta = self.__cte_dependency_impl(dbt_depends_on_nodes, compiled_code, source, columns)
+        self.profile.visit(table_name)
+        entire_meta = self.__cte_dependency_impl(dbt_node, compiled_code, source, columns)
         return {
-            'edges': self.edges,
-            'nodes': self.nodes,
+            'edges': self.graph.edge_list(),
+            'nodes': self.graph.node_list(),
             'tableName': table_name,
             'materialized': materialized,
             'query': compiled_code,
@@ -200,33 +196,13 @@ class DbtSqlglot:
         if len(dn_columns) == 0:
             sources = dbt_node.get('sources', [[]])[0]
             source_key = '.'.join(sources)
-            project_name = self.dbt_metadata['project_name']
+            project_name = self.project.dbt_metadata['project_name']
             ds_columns = list(
-                self.dbt_manifest_sources.get(f'source.{project_name}.{source_key}', {}).get('columns', {}).keys())
+                self.project.dbt_manifest_sources.get(f'source.{project_name}.{source_key}', {}).get('columns', {}).keys())
             dn_columns = ds_columns
         return dn_columns
 
 
-    def __get_depends_on_table_info(self, depends_on_nodes: []) -> []:
-        res = []
-        for depends_on_node in depends_on_nodes:
-            # 依存テーブルから manifest.json を検索
-            element = self.dbt_manifest_nodes.get(depends_on_node, self.dbt_manifest_sources.get(depends_on_node))
-            if not element:
-                continue
-            # catalog.json にカラム情報があればそれを使い、なければ manifest.json のカラム情報を使う
-            element_columns = element.get('columns', {})
-            columns = self.__get_dbt_catalog(element['name']).get('columns', element_columns)
-            res.append({
-                'columns': columns,
-                'table': exp.Table(
-                    catalog=exp.Identifier(this=element['database'].upper()),
-                    db=exp.Identifier(this=element['schema'].upper()),
-                    this=exp.Identifier(this=element['name'].upper()),
-                )
-            })
-        return res
-
     def __dbt_docs_url(self, dbt_node: dict) -> t.Optional[str]:
         """dbt-docs SPA の該当ノードURLを返す。DBT_DOCS_BASE_URL 未設定、または
         dbt ノードが解決できない(exposure/source/未知名 → {})場合は None。
@@ -244,16 +220,10 @@ class DbtSqlglot:
     def __add_node(self, next_source, dbt_schema, filtered_columns, dbt_materialized, depth):
         node_columns = list(filtered_columns)
         node_id = self.__str_to_base_10_int_str(next_source)
-        found_node = self.__find(self.nodes, 'id', node_id)
-
-        if found_node:
-            # すでにノードがあれば columns を増やす
-            exist_columns = found_node['data']['columns']
-            for node_column in node_columns:
-                # 存在しないカラムだけ追加
-                if node_column not in exist_columns:
-                    exist_columns.append(node_column)
-            # self.logger.info(f'**********already exists node source: {next_source}, columns: {exist_columns}')
+
+        if self.graph.has_node(node_id):
+            # すでにノードがあれば columns を増やす(存在しないカラムだけ追加)
+            self.graph.merge_columns(node_id, node_columns)
             return
 
         if len(node_columns) != 0:
@@ -262,7 +232,7 @@ class DbtSqlglot:
             max_len = 0
 
         # 初回時
-        self.nodes.append({
+        self.graph.add_node({
             'id': node_id,
             'data': {
                 'name': next_source,
@@ -286,12 +256,12 @@ class DbtSqlglot:
         # if not (self.find(self.edges, 'source', str(s)) and self.find(self.edges, 'target', str(t))):
         for column in columns:
             edge_id = f'{base_edge_id}-{base_column}-{column}'
-            if self.__find(self.edges, 'id', edge_id):
+            if self.graph.has_edge(edge_id):
                 self.logger.debug(f'already exist edge: {edge_id}')
                 continue
             else:
                 self.logger.debug(f'edge:source={base_source}, target={source.lower()}, base_column={base_column}, column={column}')
-                self.edges.append({
+                self.graph.add_edge({
                     'id': edge_id,
                     'source': str(s),
                     'target': str(t),
@@ -299,22 +269,6 @@ class DbtSqlglot:
                     'targetHandle': f'{column}__target',
                 })
 
-    def __get_parent_node(self, next_source, depth):
-        for n in reversed(self.nodes):
-            prev_name = n['data']['name']
-            if prev_name != next_source and n['depth'] == depth - 1:
-                self.logger.info('parent', prev_name, next_source, depth)
-                return n
-        return None
-
-    def __get_sibling_node(self, next_source, depth):
-        for n in reversed(self.nodes):
-            prev_name = n['data']['name']
-            if prev_name != next_source and n['depth'] == depth:
-                self.logger.info('sibling', prev_name, next_source, depth)
-                return n
-        return None
-
     def __get_columns(self, dbt_columns: [], next_columns: []) -> []:
         if len(dbt_columns) == 0:
             self.logger.error('dbt_columns is empty')
@@ -331,23 +285,11 @@ class DbtSqlglot:
         return ret
 
     def __get_dbt_node(self, dbt_target: str) -> {}:
-        project_name = self.dbt_metadata['project_name']
-        for resource_type in ['model', 'seed', 'snapshot']:
-            key = f'{resource_type}.{project_name}.{dbt_target}'
-            element = self.dbt_manifest_nodes.get(key, {})
-            # self.logger.info(key, len(element))
-            if len(element) > 0:
-                break
-        return element
+        # model/seed/snapshot の name 索引(読み込み時に構築済み)
+        return self.project.nodes_by_name.get(dbt_target, {})
 
     def __get_dbt_catalog(self, dbt_target: str) -> {}:
-        project_name = self.dbt_metadata['project_name']
-        for resource_type in ['model', 'seed', 'snapshot']:
-            key = f'{resource_type}.{project_name}.{dbt_target}'
-            element = self.dbt_catalog_nodes.get(key, {})
-            if len(element) > 0:
-                break
-        return element
+        return self.project.catalog_by_name.get(dbt_target, {})
 
     def __cte_names(self, parsed_sql) -> set:
         """クエリ内で定義された CTE 名(小文字)の集合を返す。
@@ -359,21 +301,8 @@ class DbtSqlglot:
             return set()
 
     def __real_dbt_object_names(self) -> set:
-        """実在する dbt オブジェクト名(model/seed/snapshot/source)の小文字集合(遅延キャッシュ)。
-        phantom 判定で「CTE 名と一致するが実在オブジェクトでもある」ケースを除外するために使う。
-        dbt では `with dim_calendar as (select * from {{ ref('dim_calendar') }})` のように
-        CTE 名を実テーブル名と同じにするパターンが多く、CTE 名一致だけで弾くと実テーブルまで落ちる。"""
-        cache = getattr(self, '_real_object_names_cache', None)
-        if cache is None:
-            cache = set()
-            for v in self.dbt_manifest_nodes.values():
-                if v.get('resource_type') in ('model', 'seed', 'snapshot') and v.get('name'):
-                    cache.add(v['name'].lower())
-            for v in self.dbt_manifest_sources.values():
-                if v.get('name'):
-                    cache.add(v['name'].lower())
-            self._real_object_names_cache = cache
-        return cache
+        """実在する dbt オブジェクト名の小文字集合(DbtProject.real_object_names)。"""
+        return self.project.real_object_names()
 
     def __is_phantom_cte_label(self, label: str, cte_names: set, source: str) -> bool:
         """label が「解析中クエリの CTE 名」かつ「実在 dbt オブジェクトでない」場合のみ phantom とみなす。
@@ -393,11 +322,15 @@ class DbtSqlglot:
 
     def __extract_lineage_node(self, lin, source: str, need_meta=False, cte_names: set = None) -> dict:
         """1カラム分の sqlglot lineage Node を走査して {labels, columns(, meta)} を作る。
-        per-column 経路(__get_sqlglot_lineage)とバッチ経路(__build_reverse_index の
+        per-column 経路(__get_sqlglot_lineage)とバッチ経路(__build_reverse_indexes の
         lineage(None))の双方から呼ぶ共有ヘルパー。両経路で抽出ロジックを一致させるため、
         ここを単一の実装に集約している。
         cte_names: 解析中クエリの CTE 名集合。Table 末端がこれに含まれる場合は
         phantom(UNPIVOT 等で漏れた CTE)として除外する。"""
+        with self.profile.phase('extract', source):
+            return self.__extract_lineage_node_impl(lin, source, need_meta, cte_names)
+
+    def __extract_lineage_node_impl(self, lin, source: str, need_meta: bool, cte_names: t.Optional[set]) -> dict:
         labels = set()
         replace_columns = set()
         meta = []
@@ -409,17 +342,7 @@ class DbtSqlglot:
                 if len(node.downstream) == 0 and not self.__is_phantom_cte_label(label, cte_names, source):
                     labels.add(label)
             if node.name != '*' and not isinstance(node.expression, exp.Table):
-                cte = node.expression.sql(dialect=self.dialect)
-                self.logger.debug(cte)
-                try:
-                    cte_parsed = parse_one(cte, dialect=self.dialect)
-                    cl = cte_parsed.find_all(exp.Column)
-                except SqlglotError:
-                    self.logger.error(f'cte parse error. source={source}, cte={cte}')
-                    cl = []
-                for c in cl:
-                    self.logger.debug(f'alias_or_name={c.alias_or_name}')
-                    replace_columns.add(c.alias_or_name)
+                replace_columns.update(_referenced_column_names(node.expression))
             # CTEリネージ用の追加情報
             if need_meta and not isinstance(node.expression, exp.Table):
                 if node.reference_node_name == '':
@@ -431,8 +354,7 @@ class DbtSqlglot:
                 for d in node.downstream:
                     if isinstance(d.expression, exp.Table):
                         node_downstream_table_sources.append({'schema': d.expression.db.lower(),'table': d.expression.name.lower()})
-                        parsed_column = parse_one(d.name, dialect=self.dialect)
-                        node_downstream_alias_names.append(parsed_column.alias_or_name.lower())
+                        node_downstream_alias_names.append(_leaf_column_name(d.name).lower())
                     else:
                         node_downstream_alias_names.append(d.expression.alias_or_name.lower())
 
@@ -454,111 +376,148 @@ class DbtSqlglot:
         return item
 
     def __get_sqlglot_lineage(self, source: str, parsed_sql: Expression, columns: [], sqlglot_db_schema: t.Dict | Schema, need_meta=False, sql_scope:t.Optional[Scope]=None) -> dict:
-        # 注意: 走査ロジックは __extract_lineage_node とほぼ同じだが、ここでは意図的に
-        # インライン実装を保持している。下の `parsed_sql = parse_one(cte, ...)` の再代入は
-        # ループ内で parsed_sql 引数を上書きし、scope を渡さない forward リネージの
-        # 複数カラム処理の挙動に影響する(=load-bearing)。共有ヘルパーに置換すると
-        # forward の結果が変わるため、forward/CTE 経路はこの実装のまま維持する。
-        # バッチ(reverse)経路は scope を渡すため上書きは無効で、__extract_lineage_node と
-        # 結果が一致する(equality battery で担保)。
-        # 注意: 下のループ内で parsed_sql が再代入されるため、CTE 名はここ(原本)で先に取得しておく。
+        # 注意: 以前の実装はリネージ結果の式を SQL に戻して parse_one し、その結果をループ内で
+        # parsed_sql に再代入していた。そのため scope を渡さない場合は、最初にリネージが取れた
+        # カラムより後のカラムが lineage error になっていた(SELECT でない式ではリネージを作れない)。
+        # 表示を変えないよう、その挙動をここで明示的に再現する(forward の __compose_forward_lineage と
+        # 同じ)。scope を渡すバッチ(reverse)経路では全カラムを計算する。
         cte_names = self.__cte_names(parsed_sql)
         ret = {}
         for column in columns:
             column = column.upper()
-            labels = set()
-            replace_columns = set()
+            if ret and sql_scope is None:
+                self.logger.error(f'lineage error. source={source}, column={column}')
+                continue
             try:
                 start_time = time.time()
-                lin = lineage(column, parsed_sql, dialect=self.dialect, schema=sqlglot_db_schema, scope=sql_scope)
+                with self.profile.phase('lineage', source):
+                    lin = lineage(column, parsed_sql, dialect=self.dialect, schema=sqlglot_db_schema, scope=sql_scope)
                 end_time = time.time()
                 if end_time - start_time > 3:
                     self.logger.info(f'lineage time: source={source}, column={column}, time={end_time - start_time}秒')
             except SqlglotError:
                 self.logger.error(f'lineage error. source={source}, column={column}')
                 continue
-
-            meta = []
-            for node in lin.walk():
-                if isinstance(node.expression, exp.Table):
-                    label = f'{node.expression.this}'
-                    # 配下のデータがなければ最後とみなす
-                    self.logger.debug(f'label: {label}')
-                    if len(node.downstream) == 0 and not self.__is_phantom_cte_label(label, cte_names, source):
-                        labels.add(label)
-                if node.name != '*' and not isinstance(node.expression, exp.Table):
-                    cte = node.expression.sql(dialect=self.dialect)
-                    self.logger.debug(cte)
-                    try:
-                        parsed_sql = parse_one(cte, dialect=self.dialect)
-                        cl = parsed_sql.find_all(exp.Column)
-                    except SqlglotError:
-                        self.logger.error(f'cte parse error. source={source}, column={column}, cte={cte}')
-                        cl = []
-                    for c in cl:
-                        self.logger.debug(f'alias_or_name={c.alias_or_name}')
-                        replace_columns.add(c.alias_or_name)
-                # CTEリネージ用の追加情報
-                if need_meta and not isinstance(node.expression, exp.Table):
-                    if node.reference_node_name == '':
-                        # 最初のselect * from finalは無視
-                        continue
-
-                    node_downstream_alias_names = []
-                    node_downstream_table_sources = []
-                    for d in node.downstream:
-                        if isinstance(d.expression, exp.Table):
-                            node_downstream_table_sources.append({'schema': d.expression.db.lower(),'table': d.expression.name.lower()})
-                            parsed_column = parse_one(d.name, dialect=self.dialect)
-                            node_downstream_alias_names.append(parsed_column.alias_or_name.lower())
-                        else:
-                            node_downstream_alias_names.append(d.expression.alias_or_name.lower())
-
-                    # カラム名が一致したら次のカラムをリセット
-                    column_name = node.expression.alias_or_name.lower()
-                    if len(node_downstream_alias_names) > 0 and column_name == node_downstream_alias_names[0]:
-                        node_downstream_alias_names = []
-                    mt = {
-                        'column': node.expression.alias_or_name.lower(),
-                        'nextColumns': node_downstream_alias_names,
-                        'nextSources': node_downstream_table_sources,
-                        'reference': node.reference_node_name.lower()
-                    }
-                    meta.append(mt)
-
-            ret[column] = {'labels': list(labels), 'columns': list(replace_columns)}
-            if need_meta:
-                ret[column]['meta'] = meta
+            ret[column] = self.__extract_lineage_node(lin, source, need_meta=need_meta, cte_names=cte_names)
         self.logger.info(f'{source}, {ret}')
         return ret
 
-    def __get_sqlglot_db_schema(self, depends_on_table_info):
-        sqlglot_db_schema = MappingSchema(dialect=self.dialect, normalize=False)
-        for s in depends_on_table_info:
-            source_table = s['table']
-            source_columns = s['columns']
+    def __compose_forward_lineage(self, source: str, columns: [], lookup_column) -> dict:
+        """カラム単位のリネージ結果(lookup_column(カラム) -> {'labels', 'columns'} or None)から、
+        __get_sqlglot_lineage(scope なし)と同じ forward の結果を組み立てる。
+        __get_sqlglot_lineage ではリネージが取れた最初のカラムより後のカラムは lineage error に
+        なって結果に含まれない(以前の実装の再パースによる上書きの名残り)。
+        表示を変えないよう、ここでも最初に取れた1カラムだけを採用する(後続カラムは計算もしない)。"""
+        ret = {}
+        for column in columns:
+            column = column.upper()
+            result = lookup_column(column) if not ret else None
+            if result is None:
+                self.logger.error(f'lineage error. source={source}, column={column}')
+                continue
+            ret[column] = {'labels': list(result['labels']), 'columns': list(result['columns'])}
+        self.logger.info(f'{source}, {ret}')
+        return ret
 
-            table_schema = {}
-            for key, item in source_columns.items():
-                table_schema[key] = item.get('type', 'STRING')
+    def __forward_column_result(self, dbt_node: dict, column: str) -> dict | None:
+        """モデルの1カラムの上流 {'labels', 'columns'}(リネージが取れなければ None)。
+        build-index の索引にあればそれを、無ければ (モデルのキャッシュキー, カラム) 単位の
+        プロセス内キャッシュを引き、どちらにも無いときだけ sqlglot で計算する。"""
+        unique_id = dbt_node.get('unique_id')
+        entry = self.project.indexed_model_entry(unique_id)
+        self.profile.cache_hit('column_index', entry is not None)
+        if entry is not None:
+            labels_columns = entry['columns'].get(column)
+            return {'labels': labels_columns[0], 'columns': labels_columns[1]} if labels_columns else None
+
+        key = (self.project.model_cache_key(unique_id), column)
+        result = self.project.column_lineage_cache.get(key)
+        self.profile.cache_hit('column_lineage', result is not None)
+        if result is None:
+            result = False
+            parsed_model = self.__get_parsed_model(dbt_node)
+            if parsed_model.parsed is None:
+                self.logger.error(f'parse sql. source={dbt_node.get("name")}')
+            else:
+                source = dbt_node.get('name')
+                try:
+                    # qualify 済みの式はモデル単位でキャッシュされ、同じモデルの別カラムでも再利用される
+                    with self.profile.phase('qualify', source):
+                        parsed_sql, sql_scope = parsed_model.qualified_scope(self.dialect)
+                    start_time = time.time()
+                    with self.profile.phase('lineage', source):
+                        lin = lineage(column, parsed_sql, dialect=self.dialect, schema=parsed_model.schema, scope=sql_scope)
+                    end_time = time.time()
+                    if end_time - start_time > 3:
+                        self.logger.info(f'lineage time: source={source}, column={column}, time={end_time - start_time}秒')
+                    result = self.__extract_lineage_node(lin, source, cte_names=self.__cte_names(parsed_sql))
+                except SqlglotError:
+                    pass
+            self.project.column_lineage_cache.put(key, result)
+        return result or None
+
+    def model_column_lineage(self, unique_id: str) -> dict:
+        """モデルの全出力カラムのリネージ {カラム: {'labels', 'columns'}} をまとめて計算する
+        (build-index 用)。__build_reverse_indexes と同じバッチ経路で、パースや qualify に
+        失敗したモデル・compiled_code の無いモデルは {}。"""
+        dbt_node = self.project.dbt_manifest_nodes.get(unique_id, {})
+        parsed_model = self.__get_parsed_model(dbt_node)
+        if parsed_model is None:
+            return {}
+        source = dbt_node.get('name')
+        try:
+            if parsed_model.parsed is None:
+                raise SqlglotError('parse error')
+            with self.profile.phase('qualify', source):
+                parsed_sql, sql_scope = parsed_model.qualified_scope(self.dialect)
+        except SqlglotError:
+            self.logger.error(f'parse sql. source={source}')
+            return {}
+        cte_names = self.__cte_names(parsed_sql)
+        try:
+            with self.profile.phase('lineage', source):
+                batch_dict = lineage(None, parsed_sql, dialect=self.dialect, schema=parsed_model.schema, scope=sql_scope)
+        except SqlglotError:
+            self.logger.error(f'batch lineage error. source={source}')
+            # 従来の per-column に切り替える(出力カラムは qualify 済みの select から取る)
+            columns = [select.alias_or_name.upper() for select in parsed_sql.selects]
+            return self.__get_sqlglot_lineage(source, parsed_sql, columns, parsed_model.schema, sql_scope=sql_scope)
+        return {
+            column.upper(): self.__extract_lineage_node(node, source, cte_names=cte_names)
+            for column, node in batch_dict.items()
+        }
 
-            sqlglot_db_schema.add_table(
-                source_table,
-                column_mapping=table_schema,
-            )
-        return sqlglot_db_schema
+    def __get_parsed_model(self, dbt_node: dict) -> t.Optional[ParsedModel]:
+        """モデルのパース結果(AST / 依存テーブルの MappingSchema / Scope)を返す。
+        キーは unique_id と compiled_code・依存スキーマのハッシュ(DbtProject.model_cache_key)。
+        同じモデルを同一リクエスト内・リクエスト間で何度訪問してもパースとスキーマ構築は1回で済む。
+        compiled_code が無ければ None。compiled_code 自体はキャッシュに無いときだけ読む。"""
+        if 'compiled_code' not in dbt_node:
+            return None
+        unique_id = dbt_node.get('unique_id')
+        key = self.project.model_cache_key(unique_id)
+        parsed_model = self.project.parse_cache.get(key)
+        self.profile.cache_hit('parse', parsed_model is not None)
+        if parsed_model is None:
+            name = dbt_node.get('name')
+            compiled_code = dbt_node.get('compiled_code')
+            try:
+                with self.profile.phase('parse', name):
+                    parsed = parse_one(compiled_code, dialect=self.dialect)
+            except SqlglotError:
+                parsed = None
+            # 依存ノードの組が同じモデル同士は同じ MappingSchema を共有する
+            with self.profile.phase('schema', name):
+                depends_on_table_info, sqlglot_db_schema = self.project.dependency_schemas.schema(
+                    self.project, dbt_node.get('depends_on', {}).get('nodes', []))
+            parsed_model = ParsedModel(unique_id, key[1], parsed, depends_on_table_info, sqlglot_db_schema)
+            self.project.parse_cache.put(key, parsed_model, len(compiled_code) * PARSED_BYTES_PER_CHAR)
+        return parsed_model
 
     def __str_to_base_10_int_str(self, s:str) -> str:
-        hash_value = 0
-        for char in s:
-            hash_value = (hash_value << 5) - hash_value + ord(char)
-            hash_value = hash_value & 0xFFFFFFFF  # Convert to 32-bit integer
-        return str(abs(hash_value))
-
-    def __find(self, arr: [], key: str, value: str):
-        for x in arr:
-            if x[key] == value:
-                return x
+        # dbt ノード・source・ダッシュボードの名前は読み込み時に計算済み(DbtProject.node_ids)
+        ret = self.project.node_ids.get(s)
+        return ret if ret is not None else node_id(s)
 
     def __find_all(self, arr: [], key: str, value: str):
         ret = []
@@ -567,51 +526,50 @@ class DbtSqlglot:
                 ret.append(x)
         return ret
 
-    def __find_with_subkey(self, arr: [], key: str, subkey: str, value: str):
-        for x in arr:
-            if x[key][subkey] == value:
-                return x
-
     def __get_table_dependencies(self, reverse, unique_id):
         if reverse:
-            refs = self.dbt_manifest_child_map.get(unique_id, [])
+            refs = self.project.dbt_manifest_child_map.get(unique_id, [])
         else:
-            refs = self.dbt_manifest_parent_map.get(unique_id, [])
+            refs = self.project.dbt_manifest_parent_map.get(unique_id, [])
         return refs
 
     def __table_dependencies_recursive(self, unique_id, reverse, depth):
         if self._budget_exceeded():
             return
         self.logger.info(f'request_depth={self.request_depth}, depth={depth}')
-        ref_dbt_node = self.dbt_manifest_nodes.get(unique_id)
+        ref_dbt_node = self.project.dbt_manifest_nodes.get(unique_id)
         if ref_dbt_node is None:
             self.logger.error(f'unique_id={unique_id} is not found')
             return
+        self.max_depth = max(self.max_depth, depth)
         ref_unique_id = ref_dbt_node.get('unique_id')
         ref_name = ref_dbt_node.get('name')
         ref_schema = ref_dbt_node.get('schema')
         ref_materialized = ref_dbt_node.get('config', {}).get('materialized')
         deps_refs= self.__get_table_dependencies(reverse, ref_unique_id)
         node_id = self.__str_to_base_10_int_str(ref_name)
+        self.profile.visit(ref_name)
 
-        if not self.__find(self.nodes, 'id', node_id):
-            self.nodes.append({
-                'id': node_id,
-                'data': {
-                    'name': ref_name,
-                    'columns': [],
-                    'schema': ref_schema,
-                    'materialized': ref_materialized,
-                    'first': False, 'last': False,
-                    'docsUrl': self.__dbt_docs_url(ref_dbt_node),
-                },
-                'position': {'x': 0,'y': 0},
-                'type': 'tableNode'
-            })
+        with self.profile.phase('graph', ref_name):
+            if not self.graph.has_node(node_id):
+                self.graph.add_node({
+                    'id': node_id,
+                    'data': {
+                        'name': ref_name,
+                        'columns': [],
+                        'schema': ref_schema,
+                        'materialized': ref_materialized,
+                        'first': False, 'last': False,
+                        'docsUrl': self.__dbt_docs_url(ref_dbt_node),
+                    },
+                    'position': {'x': 0,'y': 0},
+                    'type': 'tableNode'
+                })
 
         # ダッシュボード依存関係の追加処理
         if self.looker and depth == 0:
-            self.__add_dashboard_dependencies(ref_name)
+            with self.profile.phase('graph', ref_name):
+                self.__add_dashboard_dependencies(ref_name)
 
         depth = depth + 1
         if self.request_depth != -1 and depth > self.request_depth:
@@ -621,7 +579,7 @@ class DbtSqlglot:
 
         for deps_unique_id in deps_refs:
             self.logger.info(deps_unique_id)
-            deps_ref_dbt_node = self.dbt_manifest_nodes.get(deps_unique_id)
+            deps_ref_dbt_node = self.project.dbt_manifest_nodes.get(deps_unique_id)
             if deps_ref_dbt_node is None:
                 # exposure / source / semantic_model などは manifest['nodes'] に
                 # 含まれないため、ループ全体を中断せずスキップする
@@ -629,26 +587,27 @@ class DbtSqlglot:
                 continue
             target_name = deps_ref_dbt_node.get('name')
             target_node_id = self.__str_to_base_10_int_str(target_name)
-            if reverse:
-                edge_id = f'{target_node_id}-{node_id}'
-                if not self.__find(self.edges, 'id', edge_id):
-                    self.edges.append({
-                        'id': edge_id,
-                        'source': target_node_id,
-                        'target': node_id,
-                        'sourceHandle': f'{target_node_id}__source',
-                        'targetHandle': f'{node_id}__target'
-                    })
-            else:
-                edge_id = f'{node_id}-{target_node_id}'
-                if not self.__find(self.edges, 'id', edge_id):
-                    self.edges.append({
-                        'id': edge_id,
-                        'source': node_id,
-                        'target': target_node_id,
-                        'sourceHandle': f'{node_id}__source',
-                        'targetHandle': f'{target_node_id}__target'
-                    })
+            with self.profile.phase('graph', ref_name):
+                if reverse:
+                    edge_id = f'{target_node_id}-{node_id}'
+                    if not self.graph.has_edge(edge_id):
+                        self.graph.add_edge({
+                            'id': edge_id,
+                            'source': target_node_id,
+                            'target': node_id,
+                            'sourceHandle': f'{target_node_id}__source',
+                            'targetHandle': f'{node_id}__target'
+                        })
+                else:
+                    edge_id = f'{node_id}-{target_node_id}'
+                    if not self.graph.has_edge(edge_id):
+                        self.graph.add_edge({
+                            'id': edge_id,
+                            'source': node_id,
+                            'target': target_node_id,
+                            'sourceHandle': f'{node_id}__source',
+                            'targetHandle': f'{target_node_id}__target'
+                        })
             self.__table_dependencies_recursive(deps_unique_id, reverse, depth)
         self.logger.info(f'end')
         return
@@ -656,44 +615,35 @@ class DbtSqlglot:
     def __column_lineage_recursive(self, base_source: str, next_source: str, base_column: str, next_columns: [], depth: int) -> None:
         if self._budget_exceeded():
             return
+        self.profile.visit(next_source)
+        self.max_depth = max(self.max_depth, depth)
         dbt_catalog = self.__get_dbt_catalog(next_source)
         dbt_node = self.__get_dbt_node(next_source)
-        dbt_compiled_code = dbt_node.get('compiled_code')
+        has_compiled_code = 'compiled_code' in dbt_node
         dbt_schema = dbt_node.get('schema')
-        dbt_depends_on_nodes = dbt_node.get('depends_on', {}).get('nodes', [])
         dbt_columns = list(dbt_catalog.get('columns', dbt_node.get('columns', {})).keys())
         dbt_materialized = dbt_node.get('config', {}).get('materialized')
 
         # dbt の定義に該当するカラムだけに絞り込む
         filtered_columns = self.__get_columns(dbt_columns, next_columns)
 
-        # ノード作成
-        self.__add_node(next_source, dbt_schema, filtered_columns, dbt_materialized, depth)
-        # エッジ作成
-        self.__add_edge(base_column, filtered_columns, base_source, next_source)
+        with self.profile.phase('graph', next_source):
+            # ノード作成
+            self.__add_node(next_source, dbt_schema, filtered_columns, dbt_materialized, depth)
+            # エッジ作成
+            self.__add_edge(base_column, filtered_columns, base_source, next_source)
 
-        # ダッシュボード依存関係の追加処理を挿入
-        if self.looker and depth == 0:
-            for filtered_column in filtered_columns:
-                self.__add_dashboard_dependencies(next_source, filtered_column)
+            # ダッシュボード依存関係の追加処理を挿入
+            if self.looker and depth == 0:
+                for filtered_column in filtered_columns:
+                    self.__add_dashboard_dependencies(next_source, filtered_column)
 
-        if dbt_compiled_code is None:
+        if not has_compiled_code:
             self.logger.info('dbt_compiled_code is None')
             after_next_sources_columns_dict = {}
         else:
-            try:
-                parsed_sql = parse_one(dbt_compiled_code, dialect=self.dialect)
-            except SqlglotError:
-                self.logger.error(f'parse sql. source={next_source}')
-                parsed_sql = None
-
-            if parsed_sql:
-                # リネージの手がかりとして依存テーブルのカラムやテーブル情報を作成
-                additional_dbt_sources = self.__get_depends_on_table_info(dbt_depends_on_nodes)
-                sqlglot_db_schema = self.__get_sqlglot_db_schema(additional_dbt_sources)
-                after_next_sources_columns_dict = self.__get_sqlglot_lineage(next_source, parsed_sql, filtered_columns, sqlglot_db_schema)
-            else:
-                after_next_sources_columns_dict = {}
+            after_next_sources_columns_dict = self.__compose_forward_lineage(
+                next_source, filtered_columns, lambda column: self.__forward_column_result(dbt_node, column))
 
         depth = depth + 1
         after_base_source = next_source
@@ -704,170 +654,291 @@ class DbtSqlglot:
                 continue
             after_next_sources = after_next_sources_columns['labels']
             after_next_columns = after_next_sources_columns['columns']
-            for after_next_source in after_next_sources:
+            if after_next_sources:
                 next_found = True
+            # 同じ (モデル, カラム) をこのリクエストで同じかより浅い depth から展開済みなら、配下の
+            # ノード/エッジはすべて追加済み(展開の結果は (モデル, カラム, depth) だけで決まり、
+            # 深い位置からの展開は浅い位置からの展開の部分集合)。ダイヤモンド型の DAG で同じ上流を
+            # 経路の数だけ辿り直さない。
+            expanded_depth = self._expanded_columns.get((after_base_source, after_base_column))
+            if expanded_depth is not None and expanded_depth <= depth:
+                continue
+            self._expanded_columns[(after_base_source, after_base_column)] = depth
+            for after_next_source in after_next_sources:
                 after_next_source = after_next_source.lower()
 
                 self.logger.debug(f'base_source={after_base_source}, next_source={after_next_source}, base_column={after_base_column}, next_columns={after_next_columns}, depth={depth}')
                 self.__column_lineage_recursive(after_base_source, after_next_source, after_base_column, after_next_columns, depth)
         if not next_found:
             # 再起の最後だったらedgeの起点がない
-            prev_node = self.__find_with_subkey(self.nodes, 'data', 'name', after_base_source)
-            if prev_node and self.request_depth == -1:
+            prev_node_id = self.graph.find_node_id_by_name(after_base_source)
+            if prev_node_id is not None and self.request_depth == -1:
                 self.logger.debug(f'last node: {after_base_source}')
-                prev_node['data']['last'] = True
+                self.graph.set_flag(prev_node_id, 'last')
 
-    def __build_reverse_index(self, source: str) -> list:
-        """source を直接の親に持つ全子モデルについて、各出力カラムの sqlglot リネージを
+    def __build_reverse_indexes(self, sources: list) -> t.Tuple[dict, set]:
+        """各 source を直接の親に持つ全子モデルについて、各出力カラムの sqlglot リネージを
         一度だけ計算し、source 由来のエッジ候補を索引化する(重い処理。per-source でキャッシュ)。
+        複数の source を渡すと、共通の子モデルのリネージは1回だけ計算して各 source で使い回す
+        (リバースの BFS で同じ階層の source をまとめて構築する)。
 
-        返り値: [{'child','schema','materialized','ref_column','columns'} ...]
+        返り値: ({source: [{'child','schema','materialized','ref_column','columns'} ...]},
+        最後まで構築できた source の集合)
         source.upper() がリネージの labels に含まれるエントリのみ格納する。
         これは __reverse_column_lineage の従来計算の出力をそのまま記録しているだけなので、
         ある column のクエリ結果(従来: source in labels かつ column in columns)は
         この索引を column で絞り込んだものと完全に一致する。"""
-        dbt_node = self.__get_dbt_node(source)
-        unique_id = dbt_node.get('unique_id')
-        refs = self.dbt_manifest_child_map.get(unique_id, [])
-
-        entries = []
-        complete = True
-        for ref in refs:
-            # 子モデルごとに parse_one+lineage() を回す重いループ。時間予算を超えたら
-            # ここで打ち切る(コストは反復そのものなので entries 数では縛れない)。
-            # 部分的な索引はキャッシュ汚染を招くため complete=False で返し、呼び出し側で
-            # キャッシュしない。
-            if self._budget_exceeded():
-                complete = False
-                break
-            ref_dbt_node = self.dbt_manifest_nodes.get(ref)
-            if ref_dbt_node is None:
-                self.logger.info('ref_dbt_node is None')
-                continue
-            ref_node_name = ref_dbt_node.get('name')
-            ref_schema = ref_dbt_node.get('schema')
-            ref_compiled_code = ref_dbt_node.get('compiled_code')
-            ref_dbt_depends_on_nodes = ref_dbt_node.get('depends_on', {}).get('nodes', [])
-            ref_materialized = ref_dbt_node.get('config', {}).get('materialized')
-
-            depends_on_table_info = self.__get_depends_on_table_info(ref_dbt_depends_on_nodes)
-            found = False
-            for info in depends_on_table_info:
-                tbl : exp.Table = info['table']
-                if tbl.name.lower() == source:
-                    found = True
-            if not found:
-                continue
+        indexes = {}
+        complete_sources = set()
+        # 子モデル -> カラム名 -> {'labels', 'columns'} を引く関数(None はパース失敗)
+        lookups = {}
+        for source in sources:
+            dbt_node = self.__get_dbt_node(source)
+            unique_id = dbt_node.get('unique_id')
+            refs = self.project.dbt_manifest_child_map.get(unique_id, [])
+
+            entries = []
+            indexes[source] = entries
+            complete = True
+            for ref in refs:
+                # 子モデルごとに parse_one+lineage() を回す重いループ。時間予算を超えたら
+                # ここで打ち切る(コストは反復そのものなので entries 数では縛れない)。
+                # 部分的な索引はキャッシュ汚染を招くため complete に含めず、呼び出し側で
+                # キャッシュしない。
+                if self._budget_exceeded():
+                    complete = False
+                    break
+                ref_dbt_node = self.project.dbt_manifest_nodes.get(ref)
+                if ref_dbt_node is None:
+                    self.logger.info('ref_dbt_node is None')
+                    continue
+                ref_node_name = ref_dbt_node.get('name')
+                ref_schema = ref_dbt_node.get('schema')
+                ref_materialized = ref_dbt_node.get('config', {}).get('materialized')
 
-            sqlglot_db_schema = self.__get_sqlglot_db_schema(depends_on_table_info)
-            try:
-                parsed_sql = parse_one(ref_compiled_code, dialect=self.dialect)
-                sql_scope = self.__build_scope(parsed_sql, sqlglot_db_schema)
-            except SqlglotError:
-                self.logger.error(f'parse sql. source={source}')
-                continue
-            # 子モデルのクエリ内 CTE 名(phantom 除外用)
-            ref_cte_names = self.__cte_names(parsed_sql)
-
-            # catalog.json にカラム情報があればそれを使い、なければ manifest.json のカラム情報を使う
-            ref_columns = ref_dbt_node.get('columns', self.__get_dbt_catalog(ref).get('columns', {}))
-
-            # バッチ: この子モデルの全出力カラムのリネージを 1 回で取得する。
-            # sqlglot 30 の lineage(column=None) は内部の共有キャッシュでカラム横断の
-            # 重複walk(共通CTEの再走査)を省くため、出力カラムごとに lineage() を呼ぶ
-            # 従来方式より速い。万一バッチが失敗したら従来の per-column に切り替え、
-            # 結果の同一性を保つ。
-            batch_nodes = None
-            try:
-                batch_dict = lineage(None, parsed_sql, dialect=self.dialect, schema=sqlglot_db_schema, scope=sql_scope)
-                batch_nodes = {k.upper(): v for k, v in batch_dict.items()}
-            except SqlglotError:
-                self.logger.error(f'batch lineage error. source={source}, ref={ref}')
-                batch_nodes = None
-
-            # バッチで全カラムを計算済みなので、従来の __find_column_references プレフィルタ
-            # (lineage 呼び出しを間引く役目)は不要。`source in labels` での絞り込みだけで
-            # 従来と同一結果になることを検証済み(equality battery)。
-            for ref_column in ref_columns:
-                self.logger.info(f'table={ref}, column={ref_column}')
-                ref_column_name = ref_column.upper()
-                if batch_nodes is not None:
-                    node = batch_nodes.get(ref_column_name)
-                    item_labels_columns = self.__extract_lineage_node(node, source, cte_names=ref_cte_names) if node is not None else {}
-                else:
-                    items = self.__get_sqlglot_lineage(source, parsed_sql, [ref_column_name], sqlglot_db_schema, sql_scope=sql_scope)
-                    item_labels_columns = items.get(ref_column_name, {})
-                item_labels = item_labels_columns.get('labels', [])
-                item_columns = item_labels_columns.get('columns', [])
-                if source.upper() in item_labels:
-                    entries.append({
-                        'child': ref_node_name,
-                        'schema': ref_schema,
-                        'materialized': ref_materialized,
-                        'ref_column': ref_column_name,
-                        'columns': item_columns,
-                    })
-        return entries, complete
+                if 'compiled_code' not in ref_dbt_node:
+                    self.logger.info('ref compiled_code is None')
+                    continue
+                if not self.__depends_on_source(ref_dbt_node, source):
+                    continue
+                # catalog.json にカラム情報があればそれを使い、なければ manifest.json のカラム情報を使う
+                ref_columns = ref_dbt_node.get('columns', self.__get_dbt_catalog(ref).get('columns', {}))
+                if not ref_columns:
+                    # カラム定義の無い子(テスト等)からはエントリが作られないのでパースしない
+                    continue
 
-    def __reverse_column_lineage(self, source: str, column: str):
-        # source 単位で索引を構築・キャッシュする。キャッシュは per-request リセット
-        # (__init__ の nodes/edges クリア)の外で保持されるため、同一プロセス内の
-        # 2回目以降のクエリ(同 source の任意 column)は再計算なしの即時参照になる。
+                if ref not in lookups:
+                    self.profile.visit(ref_node_name)
+                    indexed = self.project.indexed_model_columns(ref)
+                    self.profile.cache_hit('column_index', indexed is not None)
+                    if indexed is not None:
+                        # build-index の事前計算結果があればパースも lineage() も不要
+                        def lookup_column(ref_column_name, indexed=indexed):
+                            return indexed.get(ref_column_name, {})
+                        lookups[ref] = lookup_column
+                    else:
+                        lookups[ref] = self.__live_column_lookup(ref, ref_dbt_node, source)
+                lookup_column = lookups[ref]
+                if lookup_column is None:
+                    continue
+
+                for ref_column in ref_columns:
+                    self.logger.info(f'table={ref}, column={ref_column}')
+                    ref_column_name = ref_column.upper()
+                    item_labels_columns = lookup_column(ref_column_name)
+                    item_labels = item_labels_columns.get('labels', [])
+                    item_columns = item_labels_columns.get('columns', [])
+                    if source.upper() in item_labels:
+                        entries.append({
+                            'child': ref_node_name,
+                            'schema': ref_schema,
+                            'materialized': ref_materialized,
+                            'ref_column': ref_column_name,
+                            'columns': item_columns,
+                        })
+            if complete:
+                complete_sources.add(source)
+        return indexes, complete_sources
+
+    def __load_reverse_indexes(self, sources: list) -> dict:
+        """sources それぞれのリバース索引を返す。キャッシュ(メモリ → REVERSE_INDEX_DB)に無い
+        source だけをまとめて構築し、最後まで構築できたものを保存する。"""
+        # キャッシュは共有の DbtProject が保持するため、同一プロセス内の2回目以降のクエリ
+        # (同 source の任意 column)は再計算なしの即時参照になる。REVERSE_INDEX_DB を設定して
+        # いれば、他ワーカーや再起動前のプロセスが構築した索引も(dbt の成果物が変わって
+        # いなければ)そのまま使う。
         # 注: 索引は列非依存(source の全子カラムを索引化)なので、時間予算で途中打ち切り
         # した不完全な索引をキャッシュすると、別カラムの照会に流用されて黙って不完全に
         # なる。よって complete な索引のみキャッシュする(打ち切り時は今回分だけ使う)。
-        entries = self.__reverse_index_cache.get(source)
-        if entries is None:
-            entries, complete = self.__build_reverse_index(source)
-            if complete:
-                self.__reverse_index_cache[source] = entries
+        indexes = {}
+        missing = []
+        for source in sources:
+            entries = self.project.load_reverse_index(source)
+            self.profile.cache_hit('reverse_index', entries is not None)
+            if entries is None:
+                missing.append(source)
+            else:
+                indexes[source] = entries
+        if not missing:
+            return indexes
+        # 同じプロセスの他のリクエストが構築中の source は、並行に構築せずその完了を待つ
+        flight = self.project.reverse_index_flight
+        mine, waiting = [], {}
+        for source in missing:
+            event = flight.claim(source)
+            if event is None:
+                mine.append(source)
+            else:
+                waiting[source] = event
+        try:
+            if mine:
+                self.__build_and_save_reverse_indexes(mine, indexes)
+        finally:
+            for source in mine:
+                flight.release(source)
+        retry = []
+        for source, event in waiting.items():
+            timeout = max(0.0, self._deadline - time.monotonic()) if self._deadline is not None else None
+            if not event.wait(timeout):
+                self.budget_truncated = True
+                self.profile.budget_truncated()
+                break
+            entries = self.project.load_reverse_index(source)
+            if entries is None:
+                # 相手の構築が時間予算で打ち切られた(保存されていない)ので自分で構築する
+                retry.append(source)
+            else:
+                indexes[source] = entries
+        if retry:
+            self.__build_and_save_reverse_indexes(retry, indexes)
+        return indexes
+
+    def __build_and_save_reverse_indexes(self, sources: list, indexes: dict):
+        built, complete_sources = self.__build_reverse_indexes(sources)
+        for source, entries in built.items():
+            if source in complete_sources:
+                self.project.save_reverse_index(source, entries)
+            indexes[source] = entries
+
+    def __depends_on_source(self, dbt_node: dict, source: str) -> bool:
+        """dbt_node が source を直接の依存(depends_on)に持つか。"""
+        for depends_on_node in dbt_node.get('depends_on', {}).get('nodes', []):
+            element = self.project.dbt_manifest_nodes.get(depends_on_node, self.project.dbt_manifest_sources.get(depends_on_node))
+            if element and element['name'].lower() == source:
+                return True
+        return False
 
+    def __live_column_lookup(self, ref: str, ref_dbt_node: dict, source: str):
+        """子モデル ref の出力カラム名 -> {'labels', 'columns'} を sqlglot で引く関数を返す。
+        パースや qualify に失敗したら None。"""
+        # パース結果・依存スキーマ・qualify 済み Scope はモデル単位でキャッシュされ、
+        # 別 source の索引構築や別リクエストでも再利用される
+        parsed_model = self.__get_parsed_model(ref_dbt_node)
+        sqlglot_db_schema = parsed_model.schema
+        try:
+            if parsed_model.parsed is None:
+                raise SqlglotError('parse error')
+            with self.profile.phase('qualify', ref_dbt_node.get('name')):
+                parsed_sql, sql_scope = parsed_model.qualified_scope(self.dialect)
+        except SqlglotError:
+            self.logger.error(f'parse sql. source={source}')
+            return None
+        # 子モデルのクエリ内 CTE 名(phantom 除外用)
+        ref_cte_names = self.__cte_names(parsed_sql)
+
+        # バッチ: この子モデルの全出力カラムのリネージを 1 回で取得する。
+        # sqlglot 30 の lineage(column=None) は内部の共有キャッシュでカラム横断の
+        # 重複walk(共通CTEの再走査)を省くため、出力カラムごとに lineage() を呼ぶ
+        # 従来方式より速い。万一バッチが失敗したら従来の per-column に切り替え、
+        # 結果の同一性を保つ。
+        # バッチで全カラムを計算済みなので、従来の __find_column_references プレフィルタ
+        # (lineage 呼び出しを間引く役目)は不要。`source in labels` での絞り込みだけで
+        # 従来と同一結果になることを検証済み(equality battery)。
+        try:
+            with self.profile.phase('lineage', ref_dbt_node.get('name')):
+                batch_dict = lineage(None, parsed_sql, dialect=self.dialect, schema=sqlglot_db_schema, scope=sql_scope)
+        except SqlglotError:
+            self.logger.error(f'batch lineage error. source={source}, ref={ref}')
+
+            def per_column(ref_column_name):
+                items = self.__get_sqlglot_lineage(source, parsed_sql, [ref_column_name], sqlglot_db_schema, sql_scope=sql_scope)
+                return items.get(ref_column_name, {})
+            return per_column
+        batch_nodes = {k.upper(): v for k, v in batch_dict.items()}
+
+        def from_batch(ref_column_name):
+            node = batch_nodes.get(ref_column_name)
+            return self.__extract_lineage_node(node, source, cte_names=ref_cte_names) if node is not None else {}
+        return from_batch
+
+    def __reverse_column_lineage(self, source: str, column: str):
+        """source.column を参照する下流のカラムを幅優先で辿る(要求 depth の段数まで。-1 は末端まで)。
+        同じ段の source の索引はまとめて読み込み・構築する。"""
         dbt_node = self.__get_dbt_node(source)
         source_schema = dbt_node.get('schema')
         source_materialized = dbt_node.get('config', {}).get('materialized')
-        target_id = self.__str_to_base_10_int_str(source)
 
         # 起点ノード(問い合わせ対象)を追加する。
         # エッジの targetHandle が `{column}__target` を参照するため、
         # 起点ノードには問い合わせカラムを必ず持たせる(無いとエッジが宙に浮く)。
         # __add_node は id 重複時にカラムをマージするため、複数カラム/複数回の
-        # 呼び出しでも上書きされず累積する(self.nodes/self.edges を直接代入しない)。
-        self.__add_node(source, source_schema, [column], source_materialized, 0)
+        # 呼び出しでも上書きされず累積する。
+        indexes = self.__load_reverse_indexes([source]) if self.request_depth != 0 else {}
+        self.profile.visit(source)
+        with self.profile.phase('graph', source):
+            self.__add_node(source, source_schema, [column], source_materialized, 0)
+        self._reverse_expanded[(source, column)] = 0
+
+        frontier = [(source, column)]
+        hop = 1
+        while frontier:
+            next_frontier = []
+            for frontier_source, frontier_column in frontier:
+                target_id = self.__str_to_base_10_int_str(frontier_source)
+                for entry in indexes.get(frontier_source, []):
+                    if frontier_column not in entry['columns']:
+                        continue
+                    node_name = entry['child']
+                    ref_column_name = entry['ref_column']
+                    node_id = self.__str_to_base_10_int_str(node_name)
+                    self.profile.visit(node_name)
+                    self.max_depth = max(self.max_depth, hop)
+                    with self.profile.phase('graph', node_name):
+                        # 後段ノードを追加(既存ならカラムをマージ)
+                        self.__add_node(node_name, entry['schema'], [ref_column_name], entry['materialized'], 0)
+                        edge_id = f'{node_id}-{target_id}-{ref_column_name}-{frontier_column}'
+                        # id 重複時は add_edge 側で無視される
+                        self.graph.add_edge({
+                            'id': edge_id,
+                            'source': node_id,
+                            'target': target_id,
+                            'sourceHandle': f'{ref_column_name}__source',
+                            'targetHandle': f'{frontier_column}__target'
+                        })
+                    # 同じかより浅い段で展開済み(または展開予定)の (モデル, カラム) は辿り直さない
+                    expanded_hop = self._reverse_expanded.get((node_name, ref_column_name))
+                    if expanded_hop is None or expanded_hop > hop:
+                        self._reverse_expanded[(node_name, ref_column_name)] = hop
+                        next_frontier.append((node_name, ref_column_name))
+            hop += 1
+            frontier = next_frontier
+            if not frontier or (self.request_depth != -1 and hop > self.request_depth) or self._budget_exceeded():
+                break
+            # 次の段の source の索引をまとめて用意する
+            indexes = self.__load_reverse_indexes(list(dict.fromkeys(s for s, _ in frontier)))
 
-        for entry in entries:
-            if column not in entry['columns']:
-                continue
-            node_name = entry['child']
-            ref_column_name = entry['ref_column']
-            node_id = self.__str_to_base_10_int_str(node_name)
-            # 後段ノードを追加(既存ならカラムをマージ)
-            self.__add_node(node_name, entry['schema'], [ref_column_name], entry['materialized'], 0)
-            edge_id = f'{node_id}-{target_id}-{ref_column_name}-{column}'
-            if self.__find(self.edges, 'id', edge_id):
-                continue
-            self.edges.append({
-                'id': edge_id,
-                'source': node_id,
-                'target': target_id,
-                'sourceHandle': f'{ref_column_name}__source',
-                'targetHandle': f'{column}__target'
-            })
-
-    def __cte_dependency_impl(self, dbt_depends_on_nodes: [], compiled_code: str, source: str, columns: []) -> list:
+    def __cte_dependency_impl(self, dbt_node: dict, compiled_code: str, source: str, columns: []) -> list:
         dependencies = {}
         lineage_tables = []
         lineage_meta = []
-        parsed_sql = None
 
-        try:
-            parsed_sql = parse_one(compiled_code, dialect=self.dialect)
-        except SqlglotError:
+        parsed_model = self.__get_parsed_model(dbt_node)
+        parsed_sql = parsed_model.parsed
+        if parsed_sql is None:
             self.logger.error(f'parse sql. source={source}')
 
         if parsed_sql and len(columns) > 0:
-            depends_on_table_info = self.__get_depends_on_table_info(dbt_depends_on_nodes)
-            sqlglot_db_schema = self.__get_sqlglot_db_schema(depends_on_table_info)
-            items = self.__get_sqlglot_lineage(source, parsed_sql, columns, sqlglot_db_schema, need_meta=True)
+            items = self.__get_sqlglot_lineage(source, parsed_sql, columns, parsed_model.schema, need_meta=True)
 
             # 現状columns は1つのみ
             item = items.get(columns[0].upper(), {'labels': [], 'meta': {}})
@@ -875,67 +946,51 @@ class DbtSqlglot:
                 lineage_tables.append(label.lower())
             lineage_meta = item['meta']
 
-        parsed_sql = parse_one(compiled_code, dialect=self.dialect)
-        ctes = parsed_sql.find_all(exp.CTE)
-        for cte in ctes:
-            dependencies[cte.alias_or_name] = []
-            # reference が一致するすべての meta 情報を取得
-            meta = self.__find_all(lineage_meta, 'reference', cte.alias_or_name)
-
-            # CTE の各要素を抽出
-            elements = {
-                'groups': [ele.sql() for ele in cte.find_all(exp.Group)],
-                'havings': [ele.sql() for ele in cte.find_all(exp.Having)],
-                'wheres': [ele.sql() for ele in cte.find_all(exp.Where)],
-                'unions': [ele.sql() for ele in cte.find_all(exp.Union)],
-                'joins': [ele.sql() for ele in cte.find_all(exp.Join)]
-            }
-
-            # ノードデータの作成
-            node_data = {
-                'id': cte.alias_or_name,
-                'type': 'cte',
-                'data': {
-                    'label': cte.alias_or_name,
-                    'nodeType': 'CTE',
-                    'meta': meta,
-                    **elements
-                },
-                'position': {'x': 0, 'y': 0},
-            }
-
-            self.nodes.append(node_data)
-
-            query = cte.this.sql()
-            try:
-                parsed_cte_query = parse_one(query, dialect=self.dialect)
-                tables = parsed_cte_query.find_all(exp.Table)
-            except SqlglotError:
-                self.logger.error(f'parse cte sql error. source={source}, query={query}')
-                tables = []
+        if parsed_sql is None:
+            # 従来どおりパース失敗はここで例外として伝える
+            parsed_sql = parse_one(compiled_code, dialect=self.dialect)
+        with self.profile.phase('graph', source):
+            ctes = parsed_sql.find_all(exp.CTE)
+            for cte in ctes:
+                dependencies[cte.alias_or_name] = []
+                # reference が一致するすべての meta 情報を取得
+                meta = self.__find_all(lineage_meta, 'reference', cte.alias_or_name)
+
+                # CTE の各要素を抽出
+                elements = {
+                    'groups': [ele.sql() for ele in cte.find_all(exp.Group)],
+                    'havings': [ele.sql() for ele in cte.find_all(exp.Having)],
+                    'wheres': [ele.sql() for ele in cte.find_all(exp.Where)],
+                    'unions': [ele.sql() for ele in cte.find_all(exp.Union)],
+                    'joins': [ele.sql() for ele in cte.find_all(exp.Join)]
+                }
 
-            for table in tables:
-                dependencies[cte.alias_or_name].append({'name': table.name})
+                # ノードデータの作成
+                node_data = {
+                    'id': cte.alias_or_name,
+                    'type': 'cte',
+                    'data': {
+                        'label': cte.alias_or_name,
+                        'nodeType': 'CTE',
+                        'meta': meta,
+                        **elements
+                    },
+                    'position': {'x': 0, 'y': 0},
+                }
 
-        for node in dependencies:
-            for dependency in dependencies[node]:
-                dep = dependency['name']
-                edge_id = f'{node}-{dep}'
-                if not self.__find(self.edges, 'id', edge_id) and node and dep and node != dep:
-                    self.edges.append({'id': edge_id, 'source': dep,'target': node, 'markerStart': {'type': 'arrowclosed', 'width': 16, 'height': 16}})
+                self.graph.add_node(node_data)
 
-        return lineage_meta
+                for table in cte.this.find_all(exp.Table):
+                    dependencies[cte.alias_or_name].append({'name': table.name})
 
-    def __build_scope(self, expression: Expression, schema: Schema) -> Scope:
-        expression = qualify.qualify(
-            expression,
-            dialect=self.dialect,
-            schema=schema,
-            **{"validate_qualify_columns": False, "identify": False},  # type: ignore
-        )
+            for node in dependencies:
+                for dependency in dependencies[node]:
+                    dep = dependency['name']
+                    edge_id = f'{node}-{dep}'
+                    if not self.graph.has_edge(edge_id) and node and dep and node != dep:
+                        self.graph.add_edge({'id': edge_id, 'source': dep,'target': node, 'markerStart': {'type': 'arrowclosed', 'width': 16, 'height': 16}})
 
-        sql_scope = build_scope(expression)
-        return sql_scope
+        return lineage_meta
 
     def __add_dashboard_dependencies(self, next_source, next_column=None):
         dashboard_deps = self.looker.get_dashboard_dependencies(
@@ -948,8 +1003,8 @@ class DbtSqlglot:
             dashboard = self.looker.get_dashboard(dash_id)
             node_id = self.__str_to_base_10_int_str(f"dashboard_{dash_id}")
 
-            if not self.__find(self.nodes, 'id', node_id):
-                self.nodes.append({
+            if not self.graph.has_node(node_id):
+                self.graph.add_node({
                     'id': node_id,
                     'data': {
                         'id': dash_id,
@@ -962,11 +1017,7 @@ class DbtSqlglot:
                 })
             else:
                 # すでにノードがあれば elements を更新
-                node = self.__find(self.nodes, 'id', node_id)
-                for dash_element in dash_elements_deps:
-                    dash_element_id = dash_element['id']
-                    if not self.__find(node['data']['elements'], 'id', dash_element_id):
-                        node['data']['elements'].append(dash_element)
+                self.graph.merge_dashboard_elements(node_id, dash_elements_deps)
 
             target_id = self.__str_to_base_10_int_str(next_source)
 
@@ -978,8 +1029,8 @@ class DbtSqlglot:
                     edge_id = f"{node_id}-{target_id}-{dash_element_id}-{next_column}"
                     target_handle = f"{next_column}__target"
 
-                if not self.__find(self.edges, 'id', edge_id):
-                    self.edges.append({
+                if not self.graph.has_edge(edge_id):
+                    self.graph.add_edge({
                         'id': edge_id,
                         'mode': 'dashboard',
                         'source': node_id,
@@ -1,7 +1,9 @@
+import asyncio
 import base64
 import hashlib
 import json
 import os
+import time
 import urllib
 from contextlib import asynccontextmanager
 from pathlib import Path
@@ -12,16 +14,29 @@ import requests
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.params import Query
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse
+from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field
 from requests.auth import HTTPBasicAuth
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from dbt_column_lineage.constants import USE_OAUTH, GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, BASE_ROUTE, SESSION_SECRET
+from dbt_column_lineage import jobs
+from dbt_column_lineage.constants import USE_OAUTH, GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, BASE_ROUTE, SESSION_SECRET, \
+    LINEAGE_POOL_MODE, LINEAGE_POOL_WORKERS, LINEAGE_POOL_QUEUE_DEPTH, BATCH_LINEAGE_MAX_SEEDS, \
+    LINEAGE_RESULT_CACHE_MAX_ENTRIES, LINEAGE_RESULT_CACHE_MAX_MB, LINEAGE_RESULT_CACHE_TTL_SECONDS, LINEAGE_RESULT_CACHE_DB
 from dbt_column_lineage.lineage import DbtSqlglot
 from dbt_column_lineage.looker import Looker
+from dbt_column_lineage.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, LineageMetrics, MetricsMiddleware, \
+    endpoint_label
+from dbt_column_lineage.pool import LineagePool, PoolSaturated
+from dbt_column_lineage.project import DbtProject, ProjectReloader
+from dbt_column_lineage.responses import ResponseStats, accepted_encoding, cached_json_response, encoded_response, \
+    json_response
+from dbt_column_lineage.result_cache import ResultCache, lineage_query_key
+from dbt_column_lineage.singleflight import AsyncSingleFlight
+from dbt_column_lineage.stream import format_ndjson, format_sse
 from dbt_column_lineage.utils import get_logger, get_redirect_url, get_diff_to_params, startup_dialect_check
 
 import typer
@@ -30,8 +45,19 @@ cli = typer.Typer()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global event_loop
     startup_dialect_check()
+    event_loop = asyncio.get_running_loop()
+    # 最初のリクエストを読み込み待ちにしないよう、起動時に読み込んでおく(スナップショットがあればそちらから)
+    try:
+        project = await asyncio.to_thread(DbtProject.get, logger)
+        logger.info(f'dbt project loaded in {project.load_seconds:.1f}s (snapshot={project.loaded_from_snapshot})')
+    except Exception as e:
+        logger.error(f'dbt project load error. error={e}')
+    project_reloader.start_watching()
     yield
+    project_reloader.stop()
+    lineage_pool.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -43,8 +69,55 @@ app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_credentials=True,
 # 無ければ従来通りプロセス毎のランダム鍵。
 app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET or os.urandom(32).hex())
 
+# /metrics のメトリクス(エンドポイントごとのレイテンシはミドルウェアで数える)
+lineage_metrics = LineageMetrics()
+app.add_middleware(MetricsMiddleware, metrics=lineage_metrics)
+
 logger = get_logger(app, __name__)
 
+# リネージ計算用のワーカープール(イベントループを塞がないため)。process モードの子プロセスは
+# 起動時にプロジェクトを読み込む
+lineage_pool = LineagePool(LINEAGE_POOL_MODE, LINEAGE_POOL_WORKERS, LINEAGE_POOL_QUEUE_DEPTH,
+                           initializer=jobs.load_project, initargs=(logger,))
+
+# /lineage・/cte の結果キャッシュ(キーに成果物の版を含むので、読み直し後の古い結果は使われない)
+result_cache = ResultCache(
+    logger,
+    LINEAGE_RESULT_CACHE_MAX_ENTRIES,
+    int(LINEAGE_RESULT_CACHE_MAX_MB * 1024 * 1024),
+    LINEAGE_RESULT_CACHE_TTL_SECONDS,
+    LINEAGE_RESULT_CACHE_DB,
+)
+
+
+# キャッシュに無い同じクエリの同時リクエストを1回の計算にまとめる
+lineage_flight = AsyncSingleFlight()
+
+
+# サーバーのイベントループ(lifespan で設定する)
+event_loop: asyncio.AbstractEventLoop | None = None
+
+
+def on_project_reload():
+    """ProjectReloader のスレッドから呼ばれる。プールの executor の差し替えと結果キャッシュの
+    クリアはリクエストの処理と競合しないよう、イベントループのスレッドで行う。"""
+    if event_loop is not None and not event_loop.is_closed():
+        event_loop.call_soon_threadsafe(after_project_reload)
+    else:
+        after_project_reload()
+
+
+def after_project_reload():
+    # process モードのプールは子プロセス毎にプロジェクトを持つので、読み直し後はプロセスを入れ替えて
+    # 新しい成果物を読ませる(処理中のジョブは古いプロセスで完了する)
+    if lineage_pool.mode == 'process':
+        lineage_pool.recycle()
+    # 古い版の結果はもう参照されないのでメモリを空ける
+    result_cache.clear()
+
+
+project_reloader = ProjectReloader(logger, on_reload=on_project_reload)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
 @app.exception_handler(StarletteHTTPException)
@@ -64,11 +137,82 @@ async def get_current_user(request: Request):
     return None
 
 
+async def current_project() -> DbtProject:
+    """読み込み済みのプロジェクト。起動時の読み込みに失敗していた場合などまだ無ければ、
+    manifest の読み込みでイベントループを塞がないようスレッドで読み込む。"""
+    project = DbtProject.loaded()
+    if project is None:
+        project = await asyncio.to_thread(DbtProject.get, logger)
+    return project
+
+
+async def run_in_pool(request: Request, fn, *args):
+    """重いリネージ計算をプールで実行する。プールが飽和していれば 503 を返す。"""
+    try:
+        return await lineage_pool.run(fn, *args)
+    except PoolSaturated:
+        logger.warning(f'lineage pool saturated: {fn.__name__}')
+        lineage_metrics.pool_rejected.inc(endpoint_label(request.scope))
+        raise HTTPException(status_code=503, detail='Lineage workers are busy. Please retry later.')
+
+
+async def run_encoded_in_pool(request: Request, fn, *args):
+    """run_in_pool と同じだが、レスポンスの直列化と圧縮(Accept-Encoding に応じる)もワーカーで
+    行う。fn が None を返したときは None。"""
+    encoding = accepted_encoding(request.headers.get('accept-encoding'))
+    encoded = await run_in_pool(request, jobs.encoded_job, fn, encoding, *args)
+    if encoded is None:
+        return None
+    lineage_metrics.observe_response(endpoint_label(request.scope), encoded.stats)
+    return encoded_response(encoded)
+
+
+async def run_cached_in_pool(request: Request, query: tuple, fn, *args):
+    """run_encoded_in_pool の結果を、クエリ(正規化済み)と成果物の版ごとに結果キャッシュへ入れる。
+    時間予算で打ち切った結果はキャッシュしない。X-Cache ヘッダーで HIT/MISS を返す。
+    キャッシュに無い同じクエリが同時に来た場合は、プールでの計算を1回にまとめて結果を共有する。"""
+    encoding = accepted_encoding(request.headers.get('accept-encoding'))
+    fingerprint = (await current_project()).fingerprint
+    key = (*query, encoding)
+    if result_cache.enabled:
+        if result_cache.persistent:
+            cached = await asyncio.to_thread(result_cache.get, fingerprint, key)
+        else:
+            cached = result_cache.get(fingerprint, key)
+        if cached is not None:
+            return encoded_response(cached, headers={'X-Cache': 'HIT'})
+
+    async def compute():
+        encoded = await run_in_pool(request, jobs.encoded_job, fn, encoding, *args)
+        if encoded is not None:
+            lineage_metrics.observe_response(endpoint_label(request.scope), encoded.stats)
+        # 計算中に読み直しがあった場合、どちらの版の結果か分からないのでキャッシュしない
+        if (result_cache.enabled and encoded is not None and not encoded.truncated
+                and (await current_project()).fingerprint == fingerprint):
+            if result_cache.persistent:
+                await asyncio.to_thread(result_cache.put, fingerprint, key, encoded)
+            else:
+                result_cache.put(fingerprint, key, encoded)
+        return encoded
+
+    encoded = await lineage_flight.run((fingerprint, key), compute)
+    if encoded is None:
+        return None
+    return encoded_response(encoded, headers={'X-Cache': 'MISS'} if result_cache.enabled else None)
+
+
 @app.get('/healthcheck')
 async def readiness_probe():
     return 'ok!'
 
 
+@app.get('/metrics')
+async def metrics():
+    """Prometheus 形式のメトリクス(/healthcheck と同じく認証なし。モデル名などは含まない)。"""
+    body = lineage_metrics.render(lineage_pool, result_cache, DbtProject.loaded())
+    return Response(body, media_type=METRICS_CONTENT_TYPE)
+
+
 @app.exception_handler(404)
 async def not_found(request: Request, exc: HTTPException):
     return FileResponse(f'frontend_out/404.html')
@@ -154,71 +298,160 @@ async def callback(request: Request, state: str, code: str):
 
 
 @app.get(f'{BASE_ROUTE}/schemas')
-async def list_schemas(current_user: str = Depends(get_current_user)):
-    dbt_sqlglot = DbtSqlglot(logger)
-    schemas = dbt_sqlglot.list_schemas()
-    return JSONResponse(content=schemas)
+async def list_schemas(request: Request, current_user: str = Depends(get_current_user)):
+    project = await current_project()
+    return cached_json_response(request, project.response_cache, ('schemas',), lambda: project.schema_options)
 
 
 @app.get(f'{BASE_ROUTE}/sources')
-async def list_sources(schema: str, current_user: str = Depends(get_current_user)):
-    dbt_sqlglot = DbtSqlglot(logger)
-    models = dbt_sqlglot.list_sources(schema)
-    return JSONResponse(content=models)
+async def list_sources(request: Request, schema: str, current_user: str = Depends(get_current_user)):
+    project = await current_project()
+    models = project.source_options_by_schema.get(schema)
+    if models is None:
+        # 存在しないスキーマはキャッシュしない(任意の文字列でキャッシュが膨らまないように)
+        return JSONResponse(content=[])
+    return cached_json_response(request, project.response_cache, ('sources', schema), lambda: models)
 
 
 @app.get(f'{BASE_ROUTE}/columns')
 async def list_columns(source: str, current_user: str = Depends(get_current_user)):
-    dbt_sqlglot = DbtSqlglot(logger)
+    dbt_sqlglot = DbtSqlglot(logger, project=await current_project())
     columns = dbt_sqlglot.list_columns(source)
     return JSONResponse(content=columns)
 
 
 @app.get(f'{BASE_ROUTE}/lineage')
 async def find_lineage(
+    request: Request,
     sources: str = Query(..., description='source table names'),
     columns: str = Query(..., description='columns name'),
     show_column: bool = Query(False, description='show column lineage'),
     reverse: bool = Query(False, description='reverse lineage'),
     depth: int = Query(-1, description='depth of lineage', ge=-1),
+    debug: str = Query(None, description='debug=timing returns per-phase timings', pattern='^timing$'),
     current_user: str = Depends(get_current_user)
 ):
-    dbt_sqlglot = DbtSqlglot(logger, request_depth=depth)
-    if show_column:
-        parsed_columns = json.loads(columns)
-        for source in sources.split(','):
-            for column in parsed_columns.get(source, ['']):
-                dbt_sqlglot.column_lineage(source, column.upper(), reverse)
-    else:
-        for source in sources.split(','):
-            dbt_sqlglot.table_lineage(source, reverse)
-    res = dbt_sqlglot.ret_edges_nodes()
-    return JSONResponse(content=res)
+    if debug == 'timing':
+        # 計測のために毎回計算する(結果キャッシュは引かず、入れもしない)
+        return await run_encoded_in_pool(request, jobs.lineage_job, logger, sources, columns, show_column, reverse, depth,
+                                         True)
+    query = lineage_query_key(sources, columns, show_column, reverse, depth)
+    return await run_cached_in_pool(request, query, jobs.lineage_job, logger, sources, columns, show_column, reverse, depth)
+
+
+@app.get(f'{BASE_ROUTE}/lineage/stream')
+async def stream_lineage(
+    request: Request,
+    sources: str = Query(..., description='source table names'),
+    columns: str = Query(..., description='columns name'),
+    show_column: bool = Query(False, description='show column lineage'),
+    reverse: bool = Query(False, description='reverse lineage'),
+    depth: int = Query(-1, description='depth of lineage', ge=-1),
+    format: str = Query('ndjson', description='ndjson or sse', pattern='^(ndjson|sse)$'),
+    debug: str = Query(None, description='debug=timing returns per-phase timings', pattern='^timing$'),
+    current_user: str = Depends(get_current_user)
+):
+    """/lineage と同じリネージを、見つかった順にノード/エッジのイベントとして返す。
+    最後のイベントは summary(truncated とノード/エッジ数・辿った深さ。debug=timing なら timing も)。"""
+    chunks = lineage_pool.stream(jobs.lineage_stream_job, logger, sources, columns, show_column, reverse, depth,
+                                 debug == 'timing')
+    # 飽和時に 503 を返せるよう、レスポンスを始める前に最初の塊まで待つ
+    try:
+        first = await chunks.__anext__()
+    except PoolSaturated:
+        logger.warning('lineage pool saturated: lineage_stream_job')
+        lineage_metrics.pool_rejected.inc(endpoint_label(request.scope))
+        raise HTTPException(status_code=503, detail='Lineage workers are busy. Please retry later.')
+    except StopAsyncIteration:
+        first = []
+    formatter = format_sse if format == 'sse' else format_ndjson
+    endpoint = endpoint_label(request.scope)
+
+    def observe(event):
+        if event.get('event') == 'summary':
+            lineage_metrics.observe_response(endpoint, ResponseStats(
+                event['nodes'], event['edges'], event['depth'], event['truncated']))
+
+    async def body():
+        try:
+            for event in first:
+                observe(event)
+                yield formatter(event)
+            async for chunk in chunks:
+                for event in chunk:
+                    observe(event)
+                    yield formatter(event)
+        finally:
+            await chunks.aclose()
+    media_type = 'text/event-stream' if format == 'sse' else 'application/x-ndjson'
+    return StreamingResponse(body(), media_type=media_type)
+
+class LineageSeed(BaseModel):
+    source: str = Field(..., description='source table name')
+    column: str | None = Field(None, description='column name (table lineage if omitted)')
+    reverse: bool = Field(False, description='reverse lineage')
+    depth: int = Field(-1, description='depth of lineage', ge=-1)
+
+
+class BatchLineageRequest(BaseModel):
+    seeds: list[LineageSeed] = Field(..., min_length=1, max_length=BATCH_LINEAGE_MAX_SEEDS)
+    merge: bool = Field(True, description='return one merged graph instead of a graph per seed')
+
+
+@app.post(f'{BASE_ROUTE}/lineage/batch')
+async def find_lineage_batch(
+    request: Request,
+    req: BatchLineageRequest,
+    debug: str = Query(None, description='debug=timing returns per-phase timings', pattern='^timing$'),
+    current_user: str = Depends(get_current_user)
+):
+    seeds = [seed.model_dump() for seed in req.seeds]
+    return await run_encoded_in_pool(request, jobs.batch_lineage_job, logger, seeds, req.merge, debug == 'timing')
 
 @app.get(f'{BASE_ROUTE}/dashboard_lineage')
 async def find_dashboard_lineage(
+    request: Request,
     dashboard_id: str = Query(None, description='dashboard id'),
     depth: int = Query(-1, description='depth of lineage', ge=-1),
+    debug: str = Query(None, description='debug=timing returns per-phase timings', pattern='^timing$'),
     current_user: str = Depends(get_current_user)
 ):
-    dbt_sqlglot = DbtSqlglot(logger, request_depth=depth)
-    dbt_sqlglot.dashboard_lineage(dashboard_id)
-    res = dbt_sqlglot.ret_edges_nodes()
-    return JSONResponse(content=res)
+    return await run_encoded_in_pool(request, jobs.dashboard_lineage_job, logger, dashboard_id, depth, debug == 'timing')
 
 @app.get(f'{BASE_ROUTE}/cte')
-async def find_cte(source: str, column: str = None, current_user: str = Depends(get_current_user)):
+async def find_cte(request: Request, source: str, column: str = None,
+                   debug: str = Query(None, description='debug=timing returns per-phase timings', pattern='^timing$'),
+                   current_user: str = Depends(get_current_user)):
     columns = column.split(',') if column and column != 'null' else []
     logger.info(columns)
-    dbt_sqlglot = DbtSqlglot(logger)
-    res = dbt_sqlglot.cte_dependency(source, columns)
+    if debug == 'timing':
+        res = await run_encoded_in_pool(request, jobs.cte_job, logger, source, columns, True)
+    else:
+        res = await run_cached_in_pool(request, ('cte', source, tuple(columns)), jobs.cte_job, logger, source, columns)
     if res is None:
         return JSONResponse(status_code=404, content={'detail': 'Not found query'})
-    return JSONResponse(content=res)
+    return res
+
+
+@app.get(f'{BASE_ROUTE}/admin/cache')
+async def cache_stats(current_user: str = Depends(get_current_user)):
+    """結果キャッシュのヒット/ミス数と現在の件数・バイト数、まとめられた同時リクエストの数。"""
+    return JSONResponse(content={
+        'result': result_cache.stats(),
+        'coalesced': {'requests': lineage_flight.coalesced, 'in_flight': lineage_flight.in_flight},
+    })
+
+
+@app.post(f'{BASE_ROUTE}/admin/reload')
+async def reload_project(current_user: str = Depends(get_current_user)):
+    """manifest.json / catalog.json をバックグラウンドで読み直す。処理中のリクエストは
+    古いスナップショットのまま完了し、読み込み完了後のリクエストから新しいものが使われる。"""
+    started = project_reloader.request_reload()
+    return JSONResponse(status_code=202, content={'status': 'reloading' if started else 'already_reloading'})
 
 
 @app.get(f'{BASE_ROUTE}/dashboards')
-async def list_dashboards(current_user: str = Depends(get_current_user)):
+async def list_dashboards(request: Request, current_user: str = Depends(get_current_user)):
     looker = Looker(logger)
     result = looker.get_dashboards()
 
@@ -228,7 +461,7 @@ async def list_dashboards(current_user: str = Depends(get_current_user)):
             detail=result.get('message', 'Internal server error')
         )
 
-    return JSONResponse(content=result)
+    return json_response(request, result)
 
 
 # 静的ファイルの設定
@@ -260,6 +493,44 @@ def run(host: str = '127.0.0.1', port: int = 5000):
     import uvicorn
     uvicorn.run('dbt_column_lineage.main:app', host=host, port=port)
 
+@cli.command()
+def build_index(output: str = None, workers: int = os.cpu_count() or 1, full: bool = False):
+    """全モデルの列リネージを事前計算して target/column_lineage_index.json に書き出す。
+    サーバーは起動時(と成果物の読み直し時)にこれを読み込み、リクエスト時に sqlglot を呼ばずに答える。
+    既存の索引があれば、compiled_code や依存テーブルのカラムが変わったモデルだけを計算し直す
+    (--full で全件計算)。--workers 1 なら並列化せずこのプロセスで計算する。"""
+    from dbt_column_lineage.column_index import ColumnLineageIndex, build_column_index
+
+    dbt_sql_glot = DbtSqlglot(logger)
+    output = output or dbt_sql_glot.project.column_index_path()
+    previous = None if full else ColumnLineageIndex.load(output, dbt_sql_glot.dialect, logger)
+    started = time.monotonic()
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            elapsed = time.monotonic() - started
+            typer.echo(f'{done}/{total} models ({elapsed:.1f}s, {done / elapsed if elapsed else 0:.1f} models/s)')
+
+    index = build_column_index(dbt_sql_glot, progress, workers=workers, previous=previous)
+    index.save(output)
+    build = index.metadata['build']
+    typer.echo(f'wrote {output} ({build["rebuilt"]} models computed, {build["reused"]} unchanged, '
+               f'{workers} workers, {time.monotonic() - started:.1f}s)')
+
+@cli.command()
+def snapshot(output: str = None):
+    """manifest.json / catalog.json を読み込んだ状態(コンパクトなノード・依存関係・catalog のカラム・
+    名前引きの索引)を target/column_lineage_snapshot.bin に書き出す。サーバーは成果物と同じ版の
+    スナップショットがあれば JSON を解析せずにそちらを読み込む。"""
+    from dbt_column_lineage.snapshot import ProjectSnapshot
+
+    started = time.monotonic()
+    project = DbtProject(logger, use_snapshot=False)
+    output = output or project.snapshot_path()
+    ProjectSnapshot.save(project, output)
+    typer.echo(f'wrote {output} ({len(project.dbt_manifest_nodes)} nodes, {os.path.getsize(output) / 1024 / 1024:.1f} MB, '
+               f'{time.monotonic() - started:.1f}s)')
+
 @cli.command()
 def version():
     from dbt_column_lineage._version import __version__
@@ -0,0 +1,301 @@
+"""manifest.json / catalog.json を、リネージで使う項目だけのコンパクトな形で持つ。
+
+manifest のノードには raw_code・docs・config 全体・テストの定義などリネージで使わない項目が
+大量に含まれ、dict のまま持つとファイルサイズの数倍のメモリになる。ここでは使う項目だけを
+__slots__ のオブジェクトに移し、文字列を intern し、同じ内容の小さな dict(config・カラム定義)を
+共有する。コンパイル済み SQL は一時ファイルに書き出して必要なときに読む(LAZY_COMPILED_SQL)。
+load_manifest / load_catalog はファイルを逐次読み、ノードを1つずつこの形に変換する。
+
+CompactNode は読み取り専用の Mapping として振る舞うので、従来の dict 前提のコード
+(node.get('columns', {}) など)はそのまま動く。"""
+import hashlib
+import mmap
+import shutil
+import sys
+import tempfile
+import threading
+import typing as t
+from collections.abc import Mapping
+
+from dbt_column_lineage.json_stream import JsonStreamReader
+
+# CompactNode が持つ manifest のノードの項目(compiled_code は別扱い)
+NODE_FIELDS = (
+    'unique_id', 'resource_type', 'name', 'alias', 'database', 'schema', 'package_name', 'fqn',
+    'config', 'depends_on', 'columns', 'description', 'sources',
+)
+_NODE_FIELD_SET = frozenset(NODE_FIELDS)
+# manifest のカラム定義のうち使う項目(list_columns と、catalog が無いときの型)
+MANIFEST_COLUMN_FIELDS = ('name', 'description', 'type')
+
+
+class CompiledCodeStore:
+    """コンパイル済み SQL を一時ファイルに追記していき、(offset, length) で読み出す。
+    読み込みはスレッドセーフ。一時ファイルはこのオブジェクトが回収されると消える。"""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix='dbt_column_lineage_sql_')
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, code: str) -> t.Tuple[int, int]:
+        data = code.encode('utf-8')
+        with self._lock:
+            offset = self._size
+            self._file.write(data)
+            self._size += len(data)
+        return offset, len(data)
+
+    def finish(self):
+        with self._lock:
+            self._file.flush()
+
+    def get(self, ref: t.Tuple[int, int]) -> str:
+        offset, length = ref
+        with self._lock:
+            self._file.seek(offset)
+            data = self._file.read(length)
+        return data.decode('utf-8')
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def copy_to(self, f: t.BinaryIO):
+        """書き出した SQL をそのまま f に追記する(参照の offset は f 側の書き始め位置からの相対)。"""
+        with self._lock:
+            self._file.flush()
+            self._file.seek(0)
+            shutil.copyfileobj(self._file, f)
+
+
+class MappedCodeStore:
+    """スナップショットファイル内のコンパイル済み SQL を mmap して読む(CompiledCodeStore と同じ get)。
+    ページはファイルのページキャッシュなので、同じファイルを開いた全ワーカーで共有される。"""
+
+    def __init__(self, f: t.BinaryIO, offset: int):
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offset = offset
+
+    def get(self, ref: t.Tuple[int, int]) -> str:
+        start = self._offset + ref[0]
+        return self._map[start:start + ref[1]].decode('utf-8')
+
+    @property
+    def size(self) -> int:
+        return len(self._map) - self._offset
+
+
+class CompactNode(Mapping):
+    """manifest のノード1つ。NODE_FIELDS と compiled_code だけを持つ読み取り専用の Mapping
+    (値が None の項目は無いものとして扱う)。compiled_code は store があれば一時ファイルから
+    読む。テストやデバッグ用に node['compiled_code'] = ... の上書きだけはできる。"""
+    __slots__ = NODE_FIELDS + ('_code', '_code_ref', '_code_hash', '_store')
+
+    def __init__(self, fields: dict, code: str | None = None, code_ref=None, store: CompiledCodeStore | None = None):
+        for field in NODE_FIELDS:
+            setattr(self, field, fields.get(field))
+        self._code = code
+        self._code_ref = code_ref
+        self._code_hash = None
+        self._store = store
+
+    def has_compiled_code(self) -> bool:
+        return self._code is not None or self._code_ref is not None
+
+    @property
+    def compiled_code(self) -> str | None:
+        if self._code is not None:
+            return self._code
+        if self._code_ref is not None:
+            return self._store.get(self._code_ref)
+        return None
+
+    @property
+    def compiled_code_hash(self) -> str | None:
+        """compiled_code の sha1(無ければ None)。初回だけ計算する。"""
+        if self._code_hash is None and self.has_compiled_code():
+            self._code_hash = hashlib.sha1(self.compiled_code.encode('utf-8')).hexdigest()
+        return self._code_hash
+
+    def get(self, key, default=None):
+        if key == 'compiled_code':
+            code = self.compiled_code
+            return default if code is None else code
+        if key in _NODE_FIELD_SET:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'compiled_code':
+            self._code, self._code_ref, self._code_hash = value, None, None
+        elif key in _NODE_FIELD_SET:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key == 'compiled_code':
+            return self.has_compiled_code()
+        return key in _NODE_FIELD_SET and getattr(self, key) is not None
+
+    def __iter__(self):
+        for field in NODE_FIELDS:
+            if getattr(self, field) is not None:
+                yield field
+        if self.has_compiled_code():
+            yield 'compiled_code'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        fields = {field: getattr(self, field) for field in NODE_FIELDS if getattr(self, field) is not None}
+        return f'CompactNode({fields})'
+
+    def __reduce__(self):
+        # スナップショット用。store は書き出し側の Pickler が persistent_id で置き換える
+        values = tuple(getattr(self, field) for field in NODE_FIELDS)
+        store = self._store if self._code_ref is not None else None
+        return _restore_node, (values, self._code, self._code_ref, store)
+
+
+def _restore_node(values: tuple, code, code_ref, store) -> CompactNode:
+    return CompactNode(dict(zip(NODE_FIELDS, values)), code=code, code_ref=code_ref, store=store)
+
+
+class Interner:
+    """読み込み中に、同じ文字列・同じ内容の小さな dict を1つのオブジェクトにまとめる。
+    共有した dict は読み取り専用として扱うこと。"""
+
+    def __init__(self):
+        self._shared = {}
+
+    @staticmethod
+    def string(value):
+        return sys.intern(value) if isinstance(value, str) else value
+
+    def shared(self, items: tuple) -> dict:
+        """items(キーと値の組のタプル)と同じ内容の共有 dict。"""
+        shared = self._shared.get(items)
+        if shared is None:
+            shared = self._shared[items] = dict(items)
+        return shared
+
+    def columns(self, columns: dict, fields: t.Optional[tuple] = None) -> dict:
+        """カラム名 -> カラム定義。fields を指定するとその項目だけを残す。"""
+        compact = {}
+        for name, column in columns.items():
+            items = tuple(
+                (self.string(key), self.string(value) if isinstance(value, str) else value)
+                for key, value in column.items()
+                if (fields is None or key in fields) and _hashable(value)
+            )
+            compact[self.string(name)] = self.shared(items)
+        return compact
+
+    def ids(self, unique_ids) -> tuple:
+        return tuple(sys.intern(unique_id) for unique_id in unique_ids)
+
+
+def _hashable(value) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def compact_node(node: dict, interner: Interner, store: CompiledCodeStore | None) -> CompactNode:
+    """manifest のノード(またはソース)を CompactNode にする。store があれば compiled_code は
+    そこへ書き出し、無ければそのまま持つ。"""
+    fields = {field: interner.string(node.get(field)) for field in
+              ('unique_id', 'resource_type', 'name', 'alias', 'database', 'schema', 'package_name', 'description')}
+    if 'fqn' in node:
+        fields['fqn'] = tuple(interner.string(part) for part in node['fqn'])
+    if 'config' in node:
+        materialized = (node['config'] or {}).get('materialized')
+        fields['config'] = interner.shared((('materialized', interner.string(materialized)),) if materialized else ())
+    if 'depends_on' in node:
+        fields['depends_on'] = {'nodes': interner.ids((node['depends_on'] or {}).get('nodes', []))}
+    if 'columns' in node:
+        fields['columns'] = interner.columns(node['columns'] or {}, MANIFEST_COLUMN_FIELDS)
+    if 'sources' in node:
+        fields['sources'] = [list(source) for source in node['sources']]
+    code = node.get('compiled_code')
+    if code is not None and store is not None:
+        return CompactNode(fields, code_ref=store.put(code), store=store)
+    return CompactNode(fields, code=code)
+
+
+def compact_catalog_node(node: dict, interner: Interner) -> dict:
+    """catalog のノード。使うのは columns だけ(カラム定義は /cte でそのまま返すので項目は削らない)。"""
+    compact = {}
+    if 'unique_id' in node:
+        compact['unique_id'] = interner.string(node['unique_id'])
+    if 'columns' in node:
+        compact['columns'] = interner.columns(node['columns'] or {})
+    return compact
+
+
+def read_metadata(path: str) -> dict:
+    """成果物の metadata だけを読む(dbt は先頭に書くので、通常は最初のチャンクだけで済む)。"""
+    with open(path, 'rb') as f:
+        reader = JsonStreamReader(f)
+        for key in reader.items():
+            if key == 'metadata':
+                return reader.value()
+            reader.skip()
+    return {}
+
+
+def artifact_fingerprint(manifest_metadata: dict, catalog_metadata: dict, mtimes: t.Sequence[int]) -> str:
+    """成果物の版。dbt が実行ごとに振る invocation_id、無ければ manifest / catalog の更新時刻。"""
+    invocation_ids = [manifest_metadata.get('invocation_id'), (catalog_metadata or {}).get('invocation_id')]
+    if all(invocation_ids):
+        return ':'.join(invocation_ids)
+    return ':'.join(str(mtime) for mtime in mtimes[:2])
+
+
+def load_manifest(path: str, interner: Interner, store: CompiledCodeStore | None) -> dict:
+    """manifest.json を逐次読み、metadata と nodes / sources / child_map / parent_map だけを
+    コンパクトな形で返す。ノードは1つ読むたびに変換して元の dict を捨て、それ以外の項目
+    (macros・docs・disabled など)は読み飛ばす。"""
+    manifest = {}
+    with open(path, 'rb') as f:
+        reader = JsonStreamReader(f)
+        for key in reader.items():
+            if key == 'metadata':
+                manifest[key] = reader.value()
+            elif key in ('nodes', 'sources'):
+                node_store = store if key == 'nodes' else None
+                manifest[key] = {
+                    sys.intern(unique_id): compact_node(reader.value(), interner, node_store) for unique_id in reader.items()
+                }
+            elif key in ('child_map', 'parent_map'):
+                manifest[key] = {
+                    sys.intern(unique_id): interner.ids(reader.value()) for unique_id in reader.items()
+                }
+            else:
+                reader.skip()
+    return manifest
+
+
+def load_catalog(path: str, interner: Interner) -> dict:
+    """catalog.json を逐次読み、metadata と nodes だけを返す。"""
+    catalog = {}
+    with open(path, 'rb') as f:
+        reader = JsonStreamReader(f)
+        for key in reader.items():
+            if key == 'metadata':
+                catalog[key] = reader.value()
+            elif key == 'nodes':
+                catalog[key] = {
+                    sys.intern(unique_id): compact_catalog_node(reader.value(), interner) for unique_id in reader.items()
+                }
+            else:
+                reader.skip()
+    return catalog
@@ -0,0 +1,253 @@
+"""/metrics で返す Prometheus 形式(テキスト形式 0.0.4)のメトリクス。
+
+prometheus_client には依存せず、必要なヒストグラムとカウンタだけをここで持つ。
+ワーカー数や MAX_LINEAGE_SECONDS を勘でなくデータで決めるためのもので、次を返す。
+
+- エンドポイントごとのレイテンシ(MetricsMiddleware。ストリームは最後のバイトまで)
+- リネージのレスポンスごとのノード数・エッジ数・辿った深さ、時間予算による打ち切り数
+- パース済みモデル・カラムリネージ・依存スキーマ・リバース索引・結果キャッシュの件数とヒット率
+- ワーカープールの実行中・待機中の件数と 503 で断った数
+- プロジェクトの読み込み時間
+
+ヒストグラムとカウンタはイベントループのスレッドからのみ更新・出力するためロックは不要。
+キャッシュやプールの値は出力のたびにその時点の値を読む。process モードのプールでは、
+キャッシュの値は API のプロセスのもの(ワーカーの子プロセスのものではない)になる。"""
+import math
+import time
+import typing as t
+
+from dbt_column_lineage.responses import ResponseStats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ヒストグラムのバケット(上限)。+Inf は自動で足す
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+DEPTH_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50)
+
+# ルートに一致しなかったリクエストの endpoint ラベル(パスをそのままラベルにすると系列が増え続ける)
+UNMATCHED_ENDPOINT = 'other'
+
+
+class Histogram:
+    """ラベルの値の組ごとのヒストグラム。"""
+
+    def __init__(self, name: str, documentation: str, buckets: t.Sequence[float], labelnames: t.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(float(bucket) for bucket in buckets) + (math.inf,)
+        self.labelnames = tuple(labelnames)
+        # ラベルの値の組 -> [バケットごとの件数(累積しない), 合計]
+        self._series = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0]
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                series[0][i] += 1
+                break
+        series[1] += value
+
+    def samples(self) -> t.Iterator[t.Tuple[str, dict, float]]:
+        for labelvalues, (counts, total) in sorted(self._series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(bucket)}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+    def render(self) -> str:
+        return _render_family(self.name, 'histogram', self.documentation, self.samples())
+
+
+class Counter:
+    """ラベルの値の組ごとの単調増加カウンタ。"""
+
+    def __init__(self, name: str, documentation: str, labelnames: t.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> str:
+        samples = ((self.name, dict(zip(self.labelnames, labelvalues)), value)
+                   for labelvalues, value in sorted(self._values.items()))
+        return _render_family(self.name, 'counter', self.documentation, samples)
+
+
+class LineageMetrics:
+    """サーバーのメトリクス一式。main.py でプロセスに1つ作る。"""
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'lineage_http_request_duration_seconds', 'Time to answer a request, until the last byte of the body.',
+            LATENCY_BUCKETS, ('endpoint',))
+        self.requests = Counter(
+            'lineage_http_requests_total', 'Requests by endpoint and status code.', ('endpoint', 'status'))
+        self.response_nodes = Histogram(
+            'lineage_response_nodes', 'Nodes per computed lineage response.', SIZE_BUCKETS, ('endpoint',))
+        self.response_edges = Histogram(
+            'lineage_response_edges', 'Edges per computed lineage response.', SIZE_BUCKETS, ('endpoint',))
+        self.traversal_depth = Histogram(
+            'lineage_traversal_depth', 'Deepest level reached per computed lineage response.', DEPTH_BUCKETS,
+            ('endpoint',))
+        self.budget_truncated = Counter(
+            'lineage_budget_truncated_total', 'Lineage responses cut short by MAX_LINEAGE_SECONDS.', ('endpoint',))
+        self.pool_rejected = Counter(
+            'lineage_pool_rejected_total', 'Requests answered 503 because the lineage pool was saturated.',
+            ('endpoint',))
+
+    def observe_request(self, endpoint: str, status: int, seconds: float):
+        self.request_seconds.observe(seconds, endpoint)
+        self.requests.inc(endpoint, str(status))
+
+    def observe_response(self, endpoint: str, stats: ResponseStats | None):
+        """ワーカーで計算したリネージのレスポンス1件(結果キャッシュのヒットは数えない)。"""
+        if stats is None:
+            return
+        self.response_nodes.observe(stats.nodes, endpoint)
+        self.response_edges.observe(stats.edges, endpoint)
+        self.traversal_depth.observe(stats.depth, endpoint)
+        if stats.truncated:
+            self.budget_truncated.inc(endpoint)
+
+    def render(self, pool=None, result_cache=None, project=None) -> str:
+        """全メトリクスをテキスト形式で返す。pool は LineagePool、result_cache は ResultCache、
+        project は読み込み済みの DbtProject(まだなら None)。"""
+        parts = [
+            self.request_seconds.render(),
+            self.requests.render(),
+            self.response_nodes.render(),
+            self.response_edges.render(),
+            self.traversal_depth.render(),
+            self.budget_truncated.render(),
+            self.pool_rejected.render(),
+        ]
+        if pool is not None:
+            parts.append(_gauge('lineage_pool_workers', 'Lineage pool workers.', pool.max_workers))
+            parts.append(_gauge('lineage_pool_max_queue', 'Requests allowed to wait for a lineage worker.',
+                                pool.max_queue))
+            parts.append(_gauge('lineage_pool_in_flight', 'Lineage jobs running or waiting.', pool.in_flight))
+            parts.append(_gauge('lineage_pool_queue_depth', 'Lineage jobs waiting for a worker.', pool.queue_depth))
+        parts.append(_render_caches(_cache_stats(result_cache, project)))
+        if project is not None:
+            parts.append(_gauge('lineage_project_load_seconds', 'Time it took to load the current dbt project.',
+                                project.load_seconds))
+            parts.append(_gauge('lineage_project_loaded_from_snapshot',
+                                '1 if the current dbt project was loaded from a snapshot.',
+                                int(project.loaded_from_snapshot)))
+        return ''.join(part for part in parts if part)
+
+
+class MetricsMiddleware:
+    """エンドポイントごとのレイテンシとステータスを数える ASGI ミドルウェア。
+    時間は本文の最後のバイトを送るまで(ストリームなら探索の終わりまで)。endpoint ラベルは
+    一致したルートのパス(/api/v1/lineage など)。"""
+
+    def __init__(self, app, metrics: LineageMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.observe_request(endpoint_label(scope), status, time.perf_counter() - started)
+
+
+def endpoint_label(scope) -> str:
+    """リクエストに一致したルートのパス。ルーティング前や一致しなかった場合は UNMATCHED_ENDPOINT。"""
+    route = scope.get('route')
+    path = getattr(route, 'path', None)
+    return path if path else UNMATCHED_ENDPOINT
+
+
+def _cache_stats(result_cache, project) -> t.List[t.Tuple[str, int, int | None, int, int]]:
+    """(キャッシュ名, 件数, バイト数(分からなければ None), ヒット数, ミス数) の一覧。"""
+    caches = []
+    if project is not None:
+        for name, cache in (('parse', project.parse_cache), ('column_lineage', project.column_lineage_cache),
+                            ('dependency_schema', project.dependency_schemas.schemas)):
+            caches.append((name, len(cache), cache.total_bytes if cache.max_bytes is not None else None,
+                           cache.hits, cache.misses))
+        caches.append(('reverse_index', len(project.reverse_index_cache), None,
+                       project.reverse_index_hits, project.reverse_index_misses))
+    if result_cache is not None and result_cache.enabled:
+        stats = result_cache.stats()
+        caches.append(('result', stats['entries'], stats['bytes'], stats['hits'] + stats['disk_hits'], stats['misses']))
+    return caches
+
+
+def _render_caches(caches: list) -> str:
+    if not caches:
+        return ''
+    return ''.join([
+        _render_family('lineage_cache_entries', 'gauge', 'Entries in each cache.',
+                       (('lineage_cache_entries', {'cache': name}, entries) for name, entries, _, _, _ in caches)),
+        _render_family('lineage_cache_bytes', 'gauge', 'Approximate bytes held by each size-bounded cache.',
+                       (('lineage_cache_bytes', {'cache': name}, size)
+                        for name, _, size, _, _ in caches if size is not None)),
+        _render_family('lineage_cache_hits_total', 'counter', 'Cache lookups that found an entry.',
+                       (('lineage_cache_hits_total', {'cache': name}, hits) for name, _, _, hits, _ in caches)),
+        _render_family('lineage_cache_misses_total', 'counter', 'Cache lookups that found nothing.',
+                       (('lineage_cache_misses_total', {'cache': name}, misses) for name, _, _, _, misses in caches)),
+        # 参照が1回も無ければ NaN
+        _render_family('lineage_cache_hit_ratio', 'gauge', 'Hits over lookups since the cache was created.',
+                       (('lineage_cache_hit_ratio', {'cache': name}, hits / (hits + misses) if hits + misses else math.nan)
+                        for name, _, _, hits, misses in caches)),
+    ])
+
+
+def _gauge(name: str, documentation: str, value: float) -> str:
+    return _render_family(name, 'gauge', documentation, [(name, {}, value)])
+
+
+def _render_family(name: str, metric_type: str, documentation: str, samples: t.Iterable) -> str:
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for sample_name, labels, value in samples:
+        lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
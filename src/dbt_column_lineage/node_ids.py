@@ -0,0 +1,53 @@
+"""React Flow のノード id(名前の 32bit ハッシュの10進文字列)。
+
+フロントエンドはノード・エッジ・ダッシュボードの id をこの値で突き合わせるので、計算方法は
+変えないこと: h = (h * 31 + ord(文字)) mod 2**32 を先頭の文字から順に畳み込む(Java の
+String.hashCode を符号なしにしたもの)。
+
+dbt ノード名などは DbtProject の読み込み時に node_ids() でまとめて計算しておき、探索中は
+辞書を引くだけにする。node_ids() は文字列ごとの Python ループではなく、全文字列の
+ハッシュを1つの多倍長整数の 64bit レーンに並べ、桁(文字位置)ごとに全レーンをまとめて
+畳み込む(ループ回数は最長の文字列の長さだけ)。先頭をコードポイント 0 で埋めても
+ハッシュは変わらないので、長さの違う文字列は先頭を 0 で埋めて揃える。"""
+import sys
+import typing as t
+from array import array
+
+_MASK = 0xFFFFFFFF
+# 1レーン 8 バイトのうち下位 4 バイトだけを残すマスク
+_LANE_MASK = b'\xff\xff\xff\xff\x00\x00\x00\x00'
+_LANE_BYTES = 8
+_CODE_BYTES = 4
+
+
+def node_id(s: str) -> str:
+    """1つの文字列の id。途中で mod を取らずに畳み込み、最後に下位 32bit を取る(結果は同じ)。"""
+    hash_value = 0
+    for code in map(ord, s):
+        hash_value = hash_value * 31 + code
+    return str(hash_value & _MASK)
+
+
+def node_ids(strings: t.Iterable[str]) -> t.List[str]:
+    """strings の各文字列の id を同じ順で返す(node_id と同じ値)。"""
+    strings = list(strings)
+    if not strings:
+        return []
+    count = len(strings)
+    length = max(map(len, strings))
+    # 文字列 i の位置 p のコードポイントが (i * length + p) 番目の 4 バイトに来るように並べる
+    codes = b''.join(s.encode('utf-32-le', 'surrogatepass').rjust(length * _CODE_BYTES, b'\x00') for s in strings)
+    mask = int.from_bytes(_LANE_MASK * count, 'little')
+    lane = bytearray(count * _LANE_BYTES)
+    stride = length * _CODE_BYTES
+    hash_values = 0
+    for position in range(length):
+        # 全文字列の position 番目のコードポイントを各レーンの下位 4 バイトに写す
+        for byte in range(_CODE_BYTES):
+            lane[byte::_LANE_BYTES] = codes[position * _CODE_BYTES + byte::stride]
+        # レーンの値は 2**32 * 31 + 0x10FFFF 未満なので隣のレーンに繰り上がらない
+        hash_values = (hash_values * 31 + int.from_bytes(lane, 'little')) & mask
+    values = array('Q', hash_values.to_bytes(count * _LANE_BYTES, 'little'))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return [str(value) for value in values]
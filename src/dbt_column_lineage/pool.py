@@ -0,0 +1,144 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """ワーカーもキューも埋まっていて、これ以上リクエストを受け付けられない。"""
+
+
+class _LoopQueue:
+    """thread モードの stream() で使うキュー。ワーカーの put を call_soon_threadsafe で
+    イベントループ上の asyncio.Queue に渡すので、受け取る側はスレッドを塞がずに await できる。"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            # 受け取る側のループが既に閉じている(切断後にワーカーが終端を送った)
+            pass
+
+
+class LineagePool:
+    """リネージ計算をイベントループの外(スレッド or プロセス)で実行する有界プール。
+
+    実行中 + 待機中の件数が max_workers + max_queue を超える投入は PoolSaturated で
+    即座に拒否する(呼び出し側で 503 に変換する)。カウンタはイベントループのスレッドからのみ
+    更新するためロックは不要。executor は初回投入時に生成する(import だけではプロセスを
+    起動しない)。"""
+
+    def __init__(self, mode: str = 'thread', max_workers: int = 1, max_queue: int = 0, initializer=None,
+                 initargs: tuple = ()):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f'unknown lineage pool mode: {mode}')
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        # process モードの子プロセスの起動時に1回だけ呼ぶ(プロジェクトの先読みなど)
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor: Executor | None = None
+        # stream() で子プロセスとキューを共有するためのマネージャ(process モードで初回に起動)
+        self._manager = None
+        # process モードの stream() でマネージャのキューの get を待つスレッド。同時に開くストリームは
+        # max_workers + max_queue までなので、その数だけ用意すれば既定の executor を使わずに済む
+        self._stream_waiters: Executor | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        """ワーカー待ちの件数(実行中の分は含まない)。"""
+        return max(0, self.in_flight - self.max_workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == 'process':
+                # uvicorn のスレッドを抱えたまま fork しないよう spawn で起動する
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='lineage',
+                )
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) をプールで実行して結果を返す。
+        process モードでは fn と引数は pickle 可能(モジュールレベル関数)である必要がある。"""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            raise PoolSaturated(f'in_flight={self.in_flight}')
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), functools.partial(fn, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def _stream_channel(self, loop: asyncio.AbstractEventLoop):
+        """ワーカーからイベントを受け取るキューと、打ち切りを伝えるイベントと、キューから次の塊を
+        受け取るコルーチン関数を作る。"""
+        if self.mode == 'process':
+            if self._manager is None:
+                self._manager = multiprocessing.get_context('spawn').Manager()
+                self._stream_waiters = ThreadPoolExecutor(
+                    max_workers=self.max_workers + self.max_queue,
+                    thread_name_prefix='lineage-stream',
+                )
+            events = self._manager.Queue()
+            waiters = self._stream_waiters
+            return events, self._manager.Event(), lambda: loop.run_in_executor(waiters, events.get)
+        events = _LoopQueue(loop)
+        return events, threading.Event(), events.queue.get
+
+    async def stream(self, fn, *args):
+        """fn(events, cancel, *args) をプールで実行し、fn が events に入れたイベントの塊(list)を
+        順に返す非同期ジェネレータ。fn は最後に必ず None を入れること(stream.EventEmitter.close)。
+        飽和していれば最初の塊を待つ時点で PoolSaturated。呼び出し側が途中でやめた(クライアント
+        切断)場合は cancel を立て、fn は次にイベントを送ろうとした時点で打ち切る。"""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            raise PoolSaturated(f'in_flight={self.in_flight}')
+        loop = asyncio.get_running_loop()
+        events, cancel, next_chunk = self._stream_channel(loop)
+        self.in_flight += 1
+        try:
+            future = loop.run_in_executor(self._get_executor(), functools.partial(fn, events, cancel, *args))
+            while True:
+                chunk = await next_chunk()
+                if chunk is None:
+                    break
+                yield chunk
+            await future
+        finally:
+            cancel.set()
+            self.in_flight -= 1
+
+    def recycle(self):
+        """以降の投入を新しい executor で実行する。既に投入済みのものは古い executor で最後まで
+        実行される。process モードでプロジェクトを読み直させる(ホットリロード)ために使う。
+        run() / stream() と同じくイベントループのスレッドから呼ぶこと(別スレッドから差し替えると、
+        投入が終了済みの executor に渡って RuntimeError になりうる)。"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+        if self._stream_waiters is not None:
+            self._stream_waiters.shutdown(wait=False, cancel_futures=True)
+            self._stream_waiters = None
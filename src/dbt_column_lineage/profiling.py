@@ -0,0 +1,143 @@
+"""リクエスト単位のリネージ探索のプロファイル(debug=timing)。
+
+DbtSqlglot は探索の各段階(パース・依存スキーマ・qualify/Scope・sqlglot の lineage()・
+結果の抽出・グラフの構築)を RequestProfile.phase() で囲み、訪問したモデル・キャッシュの
+ヒット/ミス・時間予算による打ち切りを数える。どのモデルで時間がかかったかを本番で
+py-spy 無しに見るためのもの。
+
+段階の時間は排他的に数える(段階の中で別の段階に入ると、外側の段階の時計は止まる)ので、
+段階ごとの時間の合計は total を超えない。プロファイルを要求されていないセッションは
+NULL_PROFILE を使い、計測のコストはほぼ無い。"""
+import time
+import typing as t
+from collections import Counter, defaultdict
+
+# 段階(表示順)。Server-Timing のメトリクス名にもなる
+PHASES = ('parse', 'schema', 'qualify', 'lineage', 'extract', 'graph')
+# 遅いモデルを何件まで返すか
+SLOWEST_MODELS = 20
+
+
+class _Phase:
+    __slots__ = ('profile', 'name', 'model', 'started')
+
+    def __init__(self, profile: 'RequestProfile', name: str, model: t.Optional[str]):
+        self.profile = profile
+        self.name = name
+        self.model = model
+        self.started = 0.0
+
+    def __enter__(self):
+        self.profile._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile._exit(self)
+        return False
+
+
+class RequestProfile:
+    """1リクエスト分の計測結果。ワーカーの1スレッドからだけ使う(スレッドセーフではない)。"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.model_seconds = defaultdict(float)
+        self.model_visits = Counter()
+        # キャッシュ名 -> {'hits': n, 'misses': n}
+        self.cache = defaultdict(Counter)
+        self.budget_truncations = 0
+        self._stack = []
+
+    def phase(self, name: str, model: t.Optional[str] = None) -> _Phase:
+        """with で囲んだ区間を段階 name(と、あればモデル model)の時間に数える。"""
+        return _Phase(self, name, model)
+
+    def visit(self, model: str):
+        self.model_visits[model] += 1
+
+    def cache_hit(self, cache: str, hit: bool):
+        self.cache[cache]['hits' if hit else 'misses'] += 1
+
+    def budget_truncated(self):
+        self.budget_truncations += 1
+
+    def _enter(self, phase: _Phase):
+        now = time.perf_counter()
+        if self._stack:
+            self._charge(self._stack[-1], now)
+        phase.started = now
+        self._stack.append(phase)
+
+    def _exit(self, phase: _Phase):
+        now = time.perf_counter()
+        self._charge(phase, now)
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1].started = now
+
+    def _charge(self, phase: _Phase, now: float):
+        elapsed = now - phase.started
+        self.phase_seconds[phase.name] += elapsed
+        if phase.model is not None:
+            self.model_seconds[phase.model] += elapsed
+
+    def as_dict(self) -> dict:
+        """レスポンスの timing(ミリ秒)。other は段階のどれにも入らなかった時間。"""
+        total = time.perf_counter() - self.started
+        phases_ms = {name: _ms(seconds) for name, seconds in self.phase_seconds.items()}
+        phases_ms['other'] = _ms(max(0.0, total - sum(self.phase_seconds.values())))
+        models = set(self.model_visits) | set(self.model_seconds)
+        slowest = sorted(models, key=lambda model: (-self.model_seconds.get(model, 0.0), model))[:SLOWEST_MODELS]
+        return {
+            'total_ms': _ms(total),
+            'phases_ms': phases_ms,
+            'models_visited': len(models),
+            'slowest_models': [
+                {'model': model, 'ms': _ms(self.model_seconds.get(model, 0.0)), 'visits': self.model_visits.get(model, 0)}
+                for model in slowest
+            ],
+            'cache': {name: {'hits': counts['hits'], 'misses': counts['misses']} for name, counts in sorted(self.cache.items())},
+            'budget_truncations': self.budget_truncations,
+        }
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _NullProfile:
+    """プロファイルを要求されていないセッション用。何も記録しない。"""
+    _PHASE = _NullPhase()
+
+    def phase(self, name: str, model: t.Optional[str] = None) -> _NullPhase:
+        return self._PHASE
+
+    def visit(self, model: str):
+        pass
+
+    def cache_hit(self, cache: str, hit: bool):
+        pass
+
+    def budget_truncated(self):
+        pass
+
+
+NULL_PROFILE = _NullProfile()
+
+
+def server_timing(timing: dict) -> str:
+    """as_dict() の結果を Server-Timing ヘッダーの値にする(段階ごとの dur と total)。"""
+    metrics = [f'{name};dur={ms}' for name, ms in timing['phases_ms'].items()]
+    metrics.append(f'total;dur={timing["total_ms"]}')
+    return ', '.join(metrics)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import typing as t
+from collections import defaultdict
+
+from dbt_column_lineage.cache import DependencySchemas, LruCache
+from dbt_column_lineage.column_index import ColumnLineageIndex, COLUMN_INDEX_FILE
+from dbt_column_lineage.constants import SQLGLOT_DIALECT, USE_LOOKER, PARSE_CACHE_MAX_ENTRIES, PARSE_CACHE_MAX_MB, \
+    MANIFEST_WATCH_SECONDS, REVERSE_INDEX_DB, COLUMN_LINEAGE_CACHE_MAX_ENTRIES, LAZY_COMPILED_SQL
+from dbt_column_lineage.index_store import ReverseIndexStore
+from dbt_column_lineage.looker import Looker
+from dbt_column_lineage.manifest import CompiledCodeStore, Interner, artifact_fingerprint, load_catalog, load_manifest, \
+    read_metadata
+from dbt_column_lineage.node_ids import node_ids
+from dbt_column_lineage.singleflight import SingleFlight
+from dbt_column_lineage.snapshot import SNAPSHOT_FILE, ProjectSnapshot
+from dbt_column_lineage.utils import get_dbt_project_dir
+
+
+class DbtProject:
+    """読み込み済みの dbt プロジェクト状態(manifest.json / catalog.json)と、
+    リクエストを跨いで共有するキャッシュを保持する。
+
+    プロセス内で1つだけ読み込み、全リクエストから読み取り専用で参照する。
+    リクエスト毎に作るグラフ(nodes/edges)や時間予算は DbtSqlglot(リネージセッション)
+    側が持つため、同一ワーカーで並行するリクエスト同士が互いの結果を上書きしない。
+
+    新しい dbt の成果物は reload() で別インスタンスとして読み込んで差し替える。セッションは
+    生成時のインスタンスを握るので、処理中のリクエストは古いスナップショットのまま完了する。"""
+    _instance = None
+    _lock = threading.Lock()
+    # reload の直列化用(読み込み中も get() はブロックしない)
+    _reload_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, logger) -> 'DbtProject':
+        """プロセス共有のプロジェクトを返す(初回のみ読み込む)。
+        並行する初回リクエストで manifest を二重に読まないようロックで守る。"""
+        instance = cls._instance
+        if instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls(logger)
+                instance = cls._instance
+        return instance
+
+    @classmethod
+    def loaded(cls) -> t.Optional['DbtProject']:
+        """読み込み済みのプロジェクト。まだ読み込んでいなければ None(読み込みはしない。/metrics 用)。"""
+        return cls._instance
+
+    @classmethod
+    def reload(cls, logger) -> 'DbtProject':
+        """成果物を読み直した新しいプロジェクトを作り、変わっていないモデルのキャッシュを
+        引き継いでから差し替える。読み込みに失敗した場合は例外を送出し、現行のまま残す。"""
+        with cls._reload_lock:
+            new = cls(logger)
+            old = cls._instance
+            if old is not None:
+                new.carry_over_caches(old)
+            with cls._lock:
+                cls._instance = new
+        logger.info(f'dbt project reloaded in {new.load_seconds:.1f}s')
+        return new
+
+    @staticmethod
+    def artifact_paths() -> t.Tuple[str, str]:
+        dbt_project_dir = get_dbt_project_dir()
+        return f'{dbt_project_dir}/target/manifest.json', f'{dbt_project_dir}/target/catalog.json'
+
+    @staticmethod
+    def column_index_path() -> str:
+        return f'{get_dbt_project_dir()}/target/{COLUMN_INDEX_FILE}'
+
+    @staticmethod
+    def snapshot_path() -> str:
+        return f'{get_dbt_project_dir()}/target/{SNAPSHOT_FILE}'
+
+    @classmethod
+    def artifact_mtimes(cls) -> t.Tuple[int, ...]:
+        mtimes = [os.stat(path).st_mtime_ns for path in cls.artifact_paths()]
+        # 列リネージ索引は任意(無ければ 0)。build-index が書き出したら読み直す
+        column_index_path = cls.column_index_path()
+        mtimes.append(os.stat(column_index_path).st_mtime_ns if os.path.exists(column_index_path) else 0)
+        return tuple(mtimes)
+
+    def __init__(self, logger, use_snapshot: bool = True):
+        self.logger = logger
+        self.dialect = SQLGLOT_DIALECT
+
+        # リバースカラムリネージの source 単位索引キャッシュ。
+        # プロジェクトに紐づけることで、パースした dbt ファイル同様プロセス内で一度だけ保持され、
+        # 全リクエストで共有される。
+        self.reverse_index_cache = {}
+        # load_reverse_index のヒット/ミス数(メトリクス用。挙動には影響しない)
+        self.reverse_index_hits = 0
+        self.reverse_index_misses = 0
+        self._reverse_index_counter_lock = threading.Lock()
+        # 索引の永続化先(REVERSE_INDEX_DB 未設定なら None)。ワーカー・再起動を跨いで共有する
+        self.reverse_index_store = ReverseIndexStore(REVERSE_INDEX_DB, self.dialect, logger) if REVERSE_INDEX_DB else None
+        # 構築中のリバース索引(同じ source を複数のリクエストが同時に構築しないように)
+        self.reverse_index_flight = SingleFlight()
+        # phantom 判定用の実在 dbt オブジェクト名(遅延キャッシュ)
+        self.real_object_names_cache = None
+        # model_cache_key(unique_id) -> ParsedModel
+        self.parse_cache = LruCache(PARSE_CACHE_MAX_ENTRIES, int(PARSE_CACHE_MAX_MB * 1024 * 1024))
+        # 依存テーブルごとの解決済みカラムと、依存ノードの組ごとの MappingSchema
+        self.dependency_schemas = DependencySchemas(self.dialect, PARSE_CACHE_MAX_ENTRIES)
+        # (model_cache_key(unique_id), カラム) -> forward の上流 {'labels', 'columns'}(リネージが
+        # 取れなかったカラムは False)
+        self.column_lineage_cache = LruCache(COLUMN_LINEAGE_CACHE_MAX_ENTRIES)
+        # /schemas・/sources の直列化済みレスポンス(と ETag)。スナップショットごとに作り直す
+        self.response_cache = {}
+        # unique_id -> compiled_code のハッシュ / キャッシュキー(遅延キャッシュ)
+        self.compiled_code_hashes = {}
+        self.model_cache_keys = {}
+
+        started = time.monotonic()
+        manifest_path, catalog_path = self.artifact_paths()
+        # 読み込み前に取るので、読み込み中に書き換えられても次のポーリングで検知できる
+        self.artifact_mtimes_at_load = self.artifact_mtimes()
+        # 成果物より新しいスナップショット(dbt-column-lineage snapshot)があればそちらから読む
+        snapshot = None
+        if use_snapshot and os.path.exists(self.snapshot_path()):
+            fingerprint = artifact_fingerprint(read_metadata(manifest_path), read_metadata(catalog_path),
+                                               self.artifact_mtimes_at_load)
+            snapshot = ProjectSnapshot.load(self.snapshot_path(), fingerprint, logger)
+        if snapshot is not None:
+            self.__dict__.update(snapshot.attributes)
+            self.compiled_code_store = snapshot.code_store
+            self.loaded_from_snapshot = True
+        else:
+            self._load_artifacts(manifest_path, catalog_path)
+            self._build_indexes()
+            self.loaded_from_snapshot = False
+
+        self.looker = None
+        if USE_LOOKER:
+            self.looker = Looker(logger)
+            dashboards = (self.looker.dashboard_json or {}).get('dashboards', [])
+            dashboard_names = [f'dashboard_{dashboard["id"]}' for dashboard in dashboards]
+            self.node_ids.update(zip(dashboard_names, node_ids(dashboard_names)))
+
+        # build-index の事前計算結果(無ければ None で、従来どおり sqlglot で計算する)
+        self.column_index = ColumnLineageIndex.load(self.column_index_path(), self.dialect, logger)
+        self.load_seconds = time.monotonic() - started
+
+    def _load_artifacts(self, manifest_path: str, catalog_path: str):
+        # リネージで使う項目だけを残したコンパクトな形で、ファイルを逐次読みながら変換する
+        interner = Interner()
+        self.compiled_code_store = CompiledCodeStore() if LAZY_COMPILED_SQL else None
+        manifest = load_manifest(manifest_path, interner, self.compiled_code_store)
+        catalog = load_catalog(catalog_path, interner)
+
+        self.dbt_metadata = manifest['metadata']
+        # 成果物の版(結果キャッシュのキー)。dbt が実行ごとに振る invocation_id、無ければ更新時刻
+        self.fingerprint = artifact_fingerprint(manifest['metadata'], catalog.get('metadata'), self.artifact_mtimes_at_load)
+        self.dbt_manifest_nodes = manifest['nodes']
+        self.dbt_manifest_sources = manifest['sources']
+        self.dbt_catalog_nodes = catalog['nodes']
+        self.dbt_manifest_child_map = manifest['child_map']
+        self.dbt_manifest_parent_map = manifest['parent_map']
+        if self.compiled_code_store is not None:
+            self.compiled_code_store.finish()
+
+    def _build_indexes(self):
+        """名前引き・サイドバー用の索引を読み込み時に一度だけ作る。
+        以降の名前解決や /schemas, /sources, /columns は manifest 全走査ではなく辞書引きになる。"""
+        project_name = self.dbt_metadata['project_name']
+
+        # '{resource_type}.{project}.{name}' の name -> ノード。同名なら model > seed > snapshot を優先
+        # (従来の「この順に f-string キーを引いて最初に見つかったもの」と同じ解決結果)。
+        self.nodes_by_name = self._index_by_name(self.dbt_manifest_nodes, project_name)
+        self.catalog_by_name = self._index_by_name(self.dbt_catalog_nodes, project_name)
+
+        # alias -> ノード(manifest 順で最初のもの)
+        self.nodes_by_alias = {}
+        for dbt_node in self.dbt_manifest_nodes.values():
+            alias = dbt_node.get('alias')
+            if alias is not None:
+                self.nodes_by_alias.setdefault(alias, dbt_node)
+
+        # 名前 -> React Flow のノード id(node_ids.node_id)。探索中に同じ名前を何度もハッシュしない。
+        # エッジは小文字化した名前でも引くので、大文字を含む名前は小文字版も入れる
+        names = set()
+        for dbt_node in (*self.dbt_manifest_nodes.values(), *self.dbt_manifest_sources.values()):
+            name = dbt_node.get('name')
+            if name is not None:
+                names.update((name, name.lower()))
+        names = sorted(names)
+        self.node_ids = dict(zip(names, node_ids(names)))
+
+        # スキーマ選択肢: 自プロジェクトのカラム定義を持つモデルのスキーマ(ソート済み)
+        schemas = set()
+        # スキーマ -> fqn のディレクトリ部分 -> モデル alias
+        fqn_aliases_by_schema = defaultdict(lambda: defaultdict(list))
+        for dbt_node in self.dbt_manifest_nodes.values():
+            if dbt_node.get('resource_type') != 'model':
+                continue
+            dbt_schema = dbt_node.get('schema')
+            if bool(dbt_node.get('columns')) and dbt_node.get('package_name') == project_name:
+                schemas.add(dbt_schema)
+            if dbt_node.get('alias') is None:
+                continue
+            # (例) fqn = ['data_cuisine_dbt', 'raw_coredb_hourly', 'xxx', 'yyy', 'model_name']
+            # ↑の 'xxx/yyy' の部分がほしい
+            dbt_fqn = '/'.join(dbt_node.get('fqn', [])[2:-1])
+            fqn_aliases_by_schema[dbt_schema][dbt_fqn].append(dbt_node['alias'])
+        self.schema_options = [{'value': schema, 'label': schema} for schema in sorted(schemas)]
+
+        self.source_options_by_schema = {}
+        for dbt_schema, fqn_aliases in fqn_aliases_by_schema.items():
+            self.source_options_by_schema[dbt_schema] = [
+                {'label': fqn, 'options': [{'value': alias, 'label': alias} for alias in sorted(aliases)]}
+                for fqn, aliases in sorted(fqn_aliases.items())
+            ]
+
+    @staticmethod
+    def _index_by_name(nodes: dict, project_name: str) -> dict:
+        index = {}
+        for resource_type in ['snapshot', 'seed', 'model']:
+            prefix = f'{resource_type}.{project_name}.'
+            for key, element in nodes.items():
+                if key.startswith(prefix) and len(element) > 0:
+                    index[key[len(prefix):]] = element
+        return index
+
+    def real_object_names(self) -> set:
+        """実在する dbt オブジェクト名(model/seed/snapshot/source)の小文字集合(遅延キャッシュ)。
+        phantom 判定で「CTE 名と一致するが実在オブジェクトでもある」ケースを除外するために使う。
+        dbt では `with dim_calendar as (select * from {{ ref('dim_calendar') }})` のように
+        CTE 名を実テーブル名と同じにするパターンが多く、CTE 名一致だけで弾くと実テーブルまで落ちる。"""
+        cache = self.real_object_names_cache
+        if cache is None:
+            cache = set()
+            for v in self.dbt_manifest_nodes.values():
+                if v.get('resource_type') in ('model', 'seed', 'snapshot') and v.get('name'):
+                    cache.add(v['name'].lower())
+            for v in self.dbt_manifest_sources.values():
+                if v.get('name'):
+                    cache.add(v['name'].lower())
+            self.real_object_names_cache = cache
+        return cache
+
+    def compiled_code_hash(self, unique_id: str) -> t.Optional[str]:
+        """ノードの compiled_code のハッシュ(compiled_code が無ければ None)。"""
+        code_hash = self.compiled_code_hashes.get(unique_id)
+        if code_hash is None:
+            dbt_node = self.dbt_manifest_nodes.get(unique_id)
+            code_hash = dbt_node.compiled_code_hash if dbt_node is not None else None
+            if code_hash is None:
+                return None
+            self.compiled_code_hashes[unique_id] = code_hash
+        return code_hash
+
+    def model_cache_key(self, unique_id: str) -> tuple:
+        """ParsedModel のキャッシュキー: (unique_id, compiled_code のハッシュ, 依存スキーマのハッシュ)。
+        依存テーブルのカラム(catalog.json)が変わると MappingSchema も変わるため、SQL が同じでも
+        別キーになる。ホットリロード時はキーが一致するエントリだけを引き継ぐ。"""
+        key = self.model_cache_keys.get(unique_id)
+        if key is None:
+            dbt_node = self.dbt_manifest_nodes.get(unique_id, {})
+            # DbtSqlglot が MappingSchema を作るのと同じ依存テーブルの解決(DependencySchemas)
+            depends_on_hash = self.dependency_schemas.depends_on_hash(
+                self, dbt_node.get('depends_on', {}).get('nodes', []))
+            key = (unique_id, self.compiled_code_hash(unique_id), depends_on_hash)
+            self.model_cache_keys[unique_id] = key
+        return key
+
+    def indexed_model_entry(self, unique_id: str) -> dict | None:
+        """build-index の索引内のモデルのエントリ(ColumnLineageIndex.fresh_entry)。
+        索引が無い、またはモデルの SQL・依存スキーマが索引の作成後に変わっていれば None。"""
+        if self.column_index is None:
+            return None
+        return self.column_index.fresh_entry(unique_id, self.model_cache_key(unique_id))
+
+    def indexed_model_columns(self, unique_id: str) -> dict | None:
+        """build-index で事前計算したモデルの {カラム: {'labels', 'columns'}}。
+        索引が無い、またはモデルの SQL・依存スキーマが索引の作成後に変わっていれば None。"""
+        if self.column_index is None:
+            return None
+        return self.column_index.model_columns(unique_id, self.model_cache_key(unique_id))
+
+    def reverse_index_fingerprint(self, source: str) -> str:
+        """source のリバース索引の入力(子モデル一覧と、各子のキャッシュキー・出力カラム・表示属性)の
+        ハッシュ。これが同じなら索引の内容も同じ。"""
+        dbt_node = self.nodes_by_name.get(source, {})
+        parts = [source]
+        for ref in self.dbt_manifest_child_map.get(dbt_node.get('unique_id'), []):
+            ref_dbt_node = self.dbt_manifest_nodes.get(ref)
+            if ref_dbt_node is None:
+                parts.append(ref)
+                continue
+            ref_columns = ref_dbt_node.get('columns', self.catalog_by_name.get(ref, {}).get('columns', {}))
+            parts.append([
+                self.model_cache_key(ref),
+                ref_dbt_node.get('name'), ref_dbt_node.get('schema'),
+                ref_dbt_node.get('config', {}).get('materialized'),
+                list(ref_columns),
+            ])
+        return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def load_reverse_index(self, source: str) -> list | None:
+        """source のリバース索引をメモリ → 永続化ストアの順に探す。無ければ None。"""
+        entries = self.reverse_index_cache.get(source)
+        if entries is None and self.reverse_index_store is not None:
+            entries = self.reverse_index_store.get(source, self.reverse_index_fingerprint(source))
+            if entries is not None:
+                self.reverse_index_cache[source] = entries
+        with self._reverse_index_counter_lock:
+            if entries is None:
+                self.reverse_index_misses += 1
+            else:
+                self.reverse_index_hits += 1
+        return entries
+
+    def save_reverse_index(self, source: str, entries: list):
+        """完全に構築できた索引だけを渡すこと(途中打ち切りの索引は別カラムの照会に流用されて
+        黙って不完全になるため)。"""
+        self.reverse_index_cache[source] = entries
+        if self.reverse_index_store is not None:
+            self.reverse_index_store.put(source, self.reverse_index_fingerprint(source), entries)
+
+    def carry_over_caches(self, old: 'DbtProject'):
+        """旧スナップショットのキャッシュのうち、入力が変わっていないものを引き継ぐ。"""
+        carried = 0
+        for key, parsed_model, size in old.parse_cache.items():
+            if self.model_cache_key(key[0]) == key:
+                self.parse_cache.put(key, parsed_model, size)
+                carried += 1
+        column_carried = 0
+        for key, result, size in old.column_lineage_cache.items():
+            if self.model_cache_key(key[0][0]) == key[0]:
+                self.column_lineage_cache.put(key, result, size)
+                column_carried += 1
+        reverse_carried = 0
+        for source, entries in list(old.reverse_index_cache.items()):
+            if self.reverse_index_fingerprint(source) == old.reverse_index_fingerprint(source):
+                self.reverse_index_cache[source] = entries
+                reverse_carried += 1
+        self.logger.info(
+            f'carried over caches: parsed models={carried}/{len(old.parse_cache)}, '
+            f'column lineages={column_carried}/{len(old.column_lineage_cache)}, '
+            f'reverse indexes={reverse_carried}/{len(old.reverse_index_cache)}'
+        )
+
+
+class ProjectReloader:
+    """dbt の成果物(manifest.json / catalog.json)の更新をワーカーを再起動せずに取り込む。
+
+    request_reload() は管理エンドポイントから呼ばれ、バックグラウンドのスレッドで DbtProject.reload()
+    を実行する(同時に1つだけ)。MANIFEST_WATCH_SECONDS > 0 なら start_watching() で成果物の
+    mtime を定期的に確認し、変わっていれば同じように読み直す。on_reload は差し替え後に呼ばれる。"""
+
+    def __init__(self, logger, interval: float = MANIFEST_WATCH_SECONDS, on_reload=None):
+        self.logger = logger
+        self.interval = interval
+        self.on_reload = on_reload
+        self._reloading = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def reload(self) -> bool:
+        """同期的に読み直す。他の読み直しが進行中なら何もせず False。"""
+        if not self._reloading.acquire(blocking=False):
+            return False
+        try:
+            DbtProject.reload(self.logger)
+        except Exception as e:
+            # dbt が成果物を書き込み途中だった場合など。現行スナップショットのまま次の機会を待つ
+            self.logger.error(f'dbt project reload failed: {e}')
+            return False
+        finally:
+            self._reloading.release()
+        if self.on_reload:
+            self.on_reload()
+        return True
+
+    def request_reload(self) -> bool:
+        """バックグラウンドで読み直しを開始する。既に進行中なら False。"""
+        if self._reloading.locked():
+            return False
+        threading.Thread(target=self.reload, name='dbt-project-reload', daemon=True).start()
+        return True
+
+    def start_watching(self):
+        if self.interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='dbt-project-watch', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            project = DbtProject._instance
+            # 未読み込みなら初回リクエストで読まれるので何もしない
+            if project is None:
+                continue
+            try:
+                changed = DbtProject.artifact_mtimes() != project.artifact_mtimes_at_load
+            except OSError:
+                continue
+            if changed:
+                self.logger.info('dbt artifacts changed, reloading')
+                self.reload()
@@ -0,0 +1,140 @@
+"""API レスポンスの JSON 直列化と圧縮。
+
+orjson と brotli は任意の依存(pip install 'dbt_column_lineage[fast]')。orjson が無ければ
+標準の json で JSONResponse と同じ(空白なし・非 ASCII はそのまま)バイト列を作り、brotli が
+無ければ br は受け付けず gzip だけで圧縮する。"""
+import gzip
+import hashlib
+import json
+import typing as t
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from dbt_column_lineage.constants import RESPONSE_COMPRESS_MIN_BYTES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def accepted_encoding(accept_encoding: str | None) -> str | None:
+    """Accept-Encoding から使う圧縮方式(br > gzip)を選ぶ。どちらも使えなければ None。"""
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if qualities.get(coding, qualities.get('*', 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class ResponseStats(t.NamedTuple):
+    """リネージのレスポンス1件の大きさ(/metrics のヒストグラム用。レスポンスには含めない)。"""
+    nodes: int
+    edges: int
+    # 実際に辿った最も深い段数
+    depth: int
+    # 時間予算で打ち切ったか(バッチで起点ごとに返す場合も、どれか1つでも打ち切れば True)
+    truncated: bool
+
+
+class EncodedBody(t.NamedTuple):
+    body: bytes
+    # Content-Encoding(圧縮しなかった場合は None)
+    encoding: str | None
+    # 圧縮の対象になる大きさだったか(Vary: Accept-Encoding を付ける)
+    negotiated: bool
+    # 時間予算で打ち切った結果か(結果キャッシュには入れない)
+    truncated: bool = False
+    # debug=timing のときの Server-Timing ヘッダーの値
+    server_timing: str | None = None
+    # ワーカーで計算したレスポンスの大きさ(encoded_job が付ける。メトリクス用)
+    stats: ResponseStats | None = None
+
+
+def encode_json(content, encoding: str | None) -> EncodedBody:
+    """content を直列化し、RESPONSE_COMPRESS_MIN_BYTES 以上なら encoding で圧縮する。
+    リネージのジョブではワーカー側で呼び、イベントループには bytes だけを返す。"""
+    truncated = isinstance(content, dict) and bool(content.get('truncated'))
+    return encode_bytes(dumps(content), encoding, truncated)
+
+
+def encode_bytes(body: bytes, encoding: str | None, truncated: bool = False) -> EncodedBody:
+    negotiated = 0 < RESPONSE_COMPRESS_MIN_BYTES <= len(body)
+    if negotiated and encoding is not None:
+        return EncodedBody(compress(body, encoding), encoding, True, truncated)
+    return EncodedBody(body, None, negotiated, truncated)
+
+
+def encoded_response(encoded: EncodedBody, status_code: int = 200, headers: dict | None = None) -> Response:
+    headers = dict(headers or {})
+    if encoded.negotiated:
+        headers['Vary'] = 'Accept-Encoding'
+    if encoded.encoding is not None:
+        headers['Content-Encoding'] = encoded.encoding
+    if encoded.server_timing is not None:
+        headers['Server-Timing'] = encoded.server_timing
+    return Response(encoded.body, status_code=status_code, headers=headers, media_type='application/json')
+
+
+def json_response(request: Request, content, status_code: int = 200) -> Response:
+    encoding = accepted_encoding(request.headers.get('accept-encoding'))
+    return encoded_response(encode_json(content, encoding), status_code)
+
+
+def cached_json_response(request: Request, cache: dict, key, build) -> Response:
+    """build() の結果を直列化(と圧縮)済みのまま cache に覚えておき、ETag 付きで返す。
+    If-None-Match が一致すれば 304。ETag は本文のハッシュなので、読み直しで内容が
+    変わったときだけ変わる。"""
+    entry = cache.get(key)
+    if entry is None:
+        body = dumps(build())
+        entry = cache[key] = {'etag': f'W/"{hashlib.sha1(body).hexdigest()}"', 'body': body, 'encoded': {}}
+    headers = {'ETag': entry['etag'], 'Cache-Control': 'no-cache'}
+    if _etag_matches(request.headers.get('if-none-match'), entry['etag']):
+        return Response(status_code=304, headers=headers)
+    encoding = accepted_encoding(request.headers.get('accept-encoding'))
+    encoded = entry['encoded'].get(encoding)
+    if encoded is None:
+        encoded = entry['encoded'][encoding] = encode_bytes(entry['body'], encoding)
+    return encoded_response(encoded, headers=headers)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # 弱い比較(W/ の有無を無視する)
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip() == '*' or tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import sqlglot
+
+from dbt_column_lineage.cache import LruCache
+from dbt_column_lineage.constants import DBT_DOCS_BASE_URL, SQLGLOT_DIALECT
+from dbt_column_lineage.responses import EncodedBody
+
+# 保存形式を変えたら上げる(古い形式の行は別キーになり参照されなくなる)
+RESULT_CACHE_FORMAT_VERSION = 1
+
+# SQLite に残す成果物の版(fingerprint)の数。ホットリロードやデプロイの途中は新旧の版のワーカーが
+# 同じファイルに書くので、最新の1版だけを残すと互いの行を消し合ってしまう
+KEEP_GENERATIONS = 3
+
+
+class ResultCache:
+    """/lineage・/cte のレスポンス(直列化・圧縮済みの EncodedBody)を、正規化したクエリと
+    DbtProject.fingerprint(manifest/catalog の版)をキーに覚えておく。
+
+    メモリ上は件数とバイト数で縛った LRU。ttl_seconds > 0 なら古いものは使わない(成果物が
+    変われば fingerprint ごと別キーになるので、TTL は既定では不要)。path を指定すると SQLite にも
+    保存し、再起動後のプロセスや同じマシンの他のワーカーと共有する。ディスクの読み書きは
+    ブロックするので、イベントループからは persistent のときスレッドで呼ぶこと。
+    永続化はあくまでキャッシュなので、失敗しても例外は送出せずログだけ残す。"""
+
+    def __init__(self, logger, max_entries: int, max_bytes: int, ttl_seconds: float = 0, path: str | None = None):
+        self.logger = logger
+        self.enabled = max_entries > 0
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.memory = LruCache(max(1, max_entries), max_bytes)
+        # sqlglot・方言・docs の URL が変わると同じ成果物でも結果が変わるので鍵に含める
+        self.salt = f'{RESULT_CACHE_FORMAT_VERSION}:{sqlglot.__version__}:{SQLGLOT_DIALECT}:{DBT_DOCS_BASE_URL or ""}'
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        self._initialized = False
+        # 古い版の行を消し終えた fingerprint(版ごとに最初の書き込みで1回だけ消す)
+        self._pruned = set()
+
+    @property
+    def persistent(self) -> bool:
+        return self.enabled and bool(self.path)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'entries': len(self.memory),
+            'bytes': self.memory.total_bytes,
+        }
+
+    def get(self, fingerprint: str, key: tuple) -> EncodedBody | None:
+        item = self.memory.get((fingerprint, key))
+        if item is not None and not self._expired(item[1]):
+            self._count('hits')
+            return item[0]
+        if self.path:
+            row = self._read(fingerprint, key)
+            if row is not None and not self._expired(row[1]):
+                self.memory.put((fingerprint, key), row, len(row[0].body))
+                self._count('disk_hits')
+                return row[0]
+        self._count('misses')
+        return None
+
+    def put(self, fingerprint: str, key: tuple, encoded: EncodedBody):
+        item = (encoded, time.time())
+        self.memory.put((fingerprint, key), item, len(encoded.body))
+        if self.path:
+            self._write(fingerprint, key, item)
+
+    def clear(self):
+        self.memory.clear()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS result_cache ('
+                ' fingerprint TEXT NOT NULL,'
+                ' query TEXT NOT NULL,'
+                ' body BLOB NOT NULL,'
+                ' encoding TEXT,'
+                ' negotiated INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' PRIMARY KEY (fingerprint, query))'
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _read(self, fingerprint: str, key: tuple) -> tuple | None:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT body, encoding, negotiated, created_at FROM result_cache WHERE fingerprint = ? AND query = ?',
+                    (f'{self.salt}:{fingerprint}', repr(key)),
+                ).fetchone()
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f'result cache read error. path={self.path}, error={e}')
+            return None
+        if row is None:
+            return None
+        return EncodedBody(row[0], row[1], bool(row[2])), row[3]
+
+    def _write(self, fingerprint: str, key: tuple, item: tuple):
+        encoded, stored_at = item
+        salted = f'{self.salt}:{fingerprint}'
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO result_cache (fingerprint, query, body, encoding, negotiated, created_at)'
+                        ' VALUES (?, ?, ?, ?, ?, ?)',
+                        (salted, repr(key), encoded.body, encoded.encoding, int(encoded.negotiated), stored_at),
+                    )
+                    if salted not in self._pruned:
+                        # 古い成果物の結果は(新しい方から KEEP_GENERATIONS 版を残して)消す。
+                        # 表全体を集計するので、書き込みのたびではなく版ごとに1回だけ
+                        conn.execute(
+                            'DELETE FROM result_cache WHERE fingerprint NOT IN ('
+                            ' SELECT fingerprint FROM result_cache GROUP BY fingerprint'
+                            ' ORDER BY MAX(created_at) DESC LIMIT ?)',
+                            (KEEP_GENERATIONS,),
+                        )
+                        self._pruned.add(salted)
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f'result cache write error. path={self.path}, error={e}')
+
+
+def lineage_query_key(sources: str, columns: str, show_column: bool, reverse: bool, depth: int) -> tuple:
+    """/lineage のクエリを結果が同じになるものが同じキーになるよう正規化する。
+    source の順序はグラフの並び順に効くのでそのまま。カラムは大文字にし、表示しない
+    (show_column=False)ときは無視する。"""
+    source_list = tuple(sources.split(','))
+    if not show_column:
+        return 'lineage', source_list, None, False, reverse, depth
+    try:
+        parsed_columns = json.loads(columns)
+        normalized = tuple((source, tuple(c.upper() for c in parsed_columns.get(source, ['']))) for source in source_list)
+    except (ValueError, AttributeError, TypeError):
+        # 不正な columns はそのままキーにする(計算側で同じエラーになる)
+        normalized = columns
+    return 'lineage', source_list, normalized, True, reverse, depth
@@ -0,0 +1,63 @@
+"""同じ計算が同時に何本も走らないようにする(single-flight)。
+
+共有リンクを一斉に開いた直後やデプロイ直後のようにキャッシュが冷えているとき、同じクエリや
+同じ source のリバース索引を N 本並行に計算せず、1本の計算を全員で待つ。"""
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """スレッド間の single-flight。claim() で計算する権利を取り、終わったら必ず release() する。
+    権利を取れなかった側は返されたイベントを待ってから、計算結果をキャッシュから読む
+    (計算が途中で打ち切られてキャッシュに無ければ、自分で計算する)。"""
+
+    def __init__(self):
+        self.waits = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def claim(self, key) -> threading.Event | None:
+        """key を計算する権利を取れたら None、他のスレッドが計算中ならその完了イベントを返す。"""
+        with self._lock:
+            event = self._calls.get(key)
+            if event is None:
+                self._calls[key] = threading.Event()
+                return None
+            self.waits += 1
+            return event
+
+    def release(self, key):
+        with self._lock:
+            event = self._calls.pop(key)
+        event.set()
+
+
+class AsyncSingleFlight:
+    """イベントループ上の single-flight。同じキーで実行中のコルーチンがあればその結果を共有する。
+    先に来たリクエストが切断されても、待っている他のリクエストのために計算は続ける。"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._tasks = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, key, factory):
+        """factory() が返すコルーチンを key ごとに1本だけ実行し、その結果を返す。"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 待っていた全員が切断していても「例外が取り出されていない」警告を出さない
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import pickle
+import struct
+import sys
+import time
+
+from dbt_column_lineage.manifest import NODE_FIELDS, MappedCodeStore
+
+SNAPSHOT_FILE = 'column_lineage_snapshot.bin'
+SNAPSHOT_MAGIC = b'DBTCLSNP'
+# 形式を変えたら上げる(古い形式のファイルは読み込まない)
+SNAPSHOT_FORMAT_VERSION = 2
+# スナップショットに入れる DbtProject の属性(読み込んだ成果物と、そこから作る名前引きの索引)
+SNAPSHOT_ATTRIBUTES = (
+    'dbt_metadata', 'fingerprint',
+    'dbt_manifest_nodes', 'dbt_manifest_sources', 'dbt_catalog_nodes',
+    'dbt_manifest_child_map', 'dbt_manifest_parent_map',
+    'nodes_by_name', 'catalog_by_name', 'nodes_by_alias', 'node_ids', 'schema_options', 'source_options_by_schema',
+)
+_CODE_STORE_ID = 'compiled_code'
+_HEADER_LENGTH = struct.Struct('<I')
+
+
+class ProjectSnapshot:
+    """`dbt-column-lineage snapshot` が書き出す、読み込み済み DbtProject の状態。
+
+    ファイルは [magic][ヘッダ長][ヘッダ(JSON)][属性の pickle][コンパイル済み SQL] の順。
+    属性は SNAPSHOT_ATTRIBUTES の値をまとめて pickle したもので、ノードを共有する索引も
+    そのまま復元される。コンパイル済み SQL は CompiledCodeStore の中身をそのまま並べ、
+    読み込み時は mmap して参照する(ワーカー間でページを共有する)。
+
+    ヘッダの fingerprint が今の manifest / catalog の版(DbtProject.fingerprint と同じ値)と
+    違えば古いスナップショットとして使わず、従来どおり JSON から読み込む。pickle なので、
+    自分で作ったファイル以外は置かないこと(復元できるクラスは CompactNode だけに絞っている)。"""
+
+    def __init__(self, attributes: dict, code_store: MappedCodeStore | None):
+        self.attributes = attributes
+        self.code_store = code_store
+
+    @staticmethod
+    def save(project, path: str):
+        """一時ファイルに書いてから置き換える(読み込み中のサーバーが書きかけを読まないように)。"""
+        store = project.compiled_code_store
+        payload = io.BytesIO()
+        _SnapshotPickler(payload, store).dump({name: getattr(project, name) for name in SNAPSHOT_ATTRIBUTES})
+        header = json.dumps({
+            'version': SNAPSHOT_FORMAT_VERSION,
+            'python': list(sys.version_info[:2]),
+            'node_fields': list(NODE_FIELDS),
+            'fingerprint': project.fingerprint,
+            'payload_bytes': payload.tell(),
+            'generated_at': time.time(),
+        }).encode('utf-8')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            f.write(payload.getbuffer())
+            if store is not None:
+                store.copy_to(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str, logger) -> 'ProjectSnapshot | None':
+        """path のスナップショットを読み込む。無い・形式が違う・成果物より古い・壊れている場合は None。"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                header = cls._read_header(f)
+                if header is None:
+                    logger.info(f'ignore project snapshot (not a snapshot file). path={path}')
+                    return None
+                if (header.get('version') != SNAPSHOT_FORMAT_VERSION
+                        or header.get('python') != list(sys.version_info[:2])
+                        or header.get('node_fields') != list(NODE_FIELDS)):
+                    logger.info(f'ignore project snapshot (format mismatch). path={path}, header={header}')
+                    return None
+                if header.get('fingerprint') != fingerprint:
+                    logger.info(f'ignore project snapshot (older than the dbt artifacts). path={path}, '
+                                f'snapshot={header.get("fingerprint")}, artifacts={fingerprint}')
+                    return None
+                code_store = MappedCodeStore(f, f.tell() + header['payload_bytes'])
+                payload = f.read(header['payload_bytes'])
+                attributes = _SnapshotUnpickler(io.BytesIO(payload), code_store).load()
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError) as e:
+            logger.error(f'project snapshot load error. path={path}, error={e}')
+            return None
+        return cls(attributes, code_store)
+
+    @staticmethod
+    def _read_header(f) -> dict | None:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            return None
+        (length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+        return json.loads(f.read(length))
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """CompiledCodeStore(一時ファイル)は pickle せず、読み込み側の MappedCodeStore に置き換える。"""
+
+    def __init__(self, f, code_store):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.code_store = code_store
+
+    def persistent_id(self, obj):
+        if obj is not None and obj is self.code_store:
+            return _CODE_STORE_ID
+        return None
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, f, code_store):
+        super().__init__(f)
+        self.code_store = code_store
+
+    def persistent_load(self, pid):
+        if pid != _CODE_STORE_ID:
+            raise pickle.UnpicklingError(f'unknown persistent id: {pid}')
+        return self.code_store
+
+    def find_class(self, module, name):
+        if module == 'dbt_column_lineage.manifest' and name == '_restore_node':
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f'unexpected class in project snapshot: {module}.{name}')
@@ -0,0 +1,55 @@
+"""ストリーミング API 用に、ワーカーで発生したグラフのイベントをイベントループ側へ渡す。
+
+ワーカー(スレッド or 子プロセス)は EventEmitter にイベントを渡し、EventEmitter は
+イベントを少しずつまとめてキューに入れる。イベントループ側は LineagePool.stream() で
+キューから塊を取り出してクライアントへ書き出す。"""
+import time
+
+from dbt_column_lineage.responses import dumps
+
+# 1回にキューへ入れるイベント数の上限と、まとめて待つ最大秒数
+FLUSH_EVENTS = 64
+FLUSH_SECONDS = 0.05
+
+
+class StreamCancelled(Exception):
+    """クライアントが切断したので、ワーカー側の計算を打ち切る。"""
+
+
+class EventEmitter:
+    """イベントを塊にしてキューへ入れる。キューと cancel は threading か multiprocessing.Manager の
+    どちらのものでもよい(put/get と is_set だけを使う)。最初のイベントはすぐに送り、以降は
+    FLUSH_EVENTS 件か FLUSH_SECONDS 秒ごとに送る。close() で残りを送り、終端の None を入れる。"""
+
+    def __init__(self, events, cancel):
+        self.events = events
+        self.cancel = cancel
+        self._buffer = []
+        self._flushed_at = 0.0
+
+    def emit(self, event: dict):
+        self._buffer.append(event)
+        if len(self._buffer) >= FLUSH_EVENTS or time.monotonic() - self._flushed_at >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self.cancel.is_set():
+            raise StreamCancelled()
+        if self._buffer:
+            self.events.put(self._buffer)
+            self._buffer = []
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        if not self.cancel.is_set() and self._buffer:
+            self.events.put(self._buffer)
+        self._buffer = []
+        self.events.put(None)
+
+
+def format_ndjson(event: dict) -> bytes:
+    return dumps(event) + b'\n'
+
+
+def format_sse(event: dict) -> bytes:
+    return f"event: {event['event']}\ndata: ".encode() + dumps(event) + b'\n\n'
@@ -4,8 +4,10 @@ These run without a real dbt project / warehouse: `DbtSqlglot` is pointed at the
 tiny synthetic manifest/catalog under `test/unit/fixtures/target/` via the
 `DBT_PROJECT_DIR` env var. `SQLGLOT_DIALECT` defaults to `snowflake`.
 """
+import json
 import logging
 import os
+import shutil
 import sys
 from pathlib import Path
 
@@ -21,11 +23,53 @@ FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
 @pytest.fixture
 def dbt(monkeypatch):
     """fixtures/target の合成 manifest/catalog を読み込んだ DbtSqlglot を返す。
-    DbtSqlglot は singleton なので、テストごとに _instance をリセットして再読込させる。"""
+    読み込み済みプロジェクト(DbtProject)はプロセス共有なので、テストごとに
+    _instance をリセットして再読込させる。"""
     monkeypatch.setenv("DBT_PROJECT_DIR", str(FIXTURE_DIR))
     from dbt_column_lineage.lineage import DbtSqlglot
+    from dbt_column_lineage.project import DbtProject
 
-    DbtSqlglot._instance = None
+    DbtProject._instance = None
     inst = DbtSqlglot(logging.getLogger("test"), request_depth=-1)
     yield inst
-    DbtSqlglot._instance = None
+    DbtProject._instance = None
+
+
+def _model(name, compiled_code, depends_on):
+    return {
+        "resource_type": "model", "name": name, "unique_id": f"model.test_proj.{name}",
+        "database": "db", "schema": "analytics", "config": {"materialized": "view"},
+        "depends_on": {"nodes": [f"model.test_proj.{d}" for d in depends_on]},
+        "columns": {"id": {"name": "id", "type": "INT"}},
+        "compiled_code": compiled_code,
+    }
+
+
+@pytest.fixture
+def diamond(tmp_path, monkeypatch):
+    """fixtures に、plain_model を left/right の2経路で参照する mart_model を追加したプロジェクト
+    (base_model -> plain_model -> left_model/right_model -> mart_model)。"""
+    from dbt_column_lineage.project import DbtProject
+
+    shutil.copytree(FIXTURE_DIR / "target", tmp_path / "target")
+    manifest_path = tmp_path / "target" / "manifest.json"
+    catalog_path = tmp_path / "target" / "catalog.json"
+    manifest = json.loads(manifest_path.read_text())
+    catalog = json.loads(catalog_path.read_text())
+    for node in [
+        _model("left_model", "select id from db.analytics.plain_model", ["plain_model"]),
+        _model("right_model", "select id from db.analytics.plain_model", ["plain_model"]),
+        _model("mart_model", "select l.id + r.id as id from db.analytics.left_model l "
+                             "join db.analytics.right_model r on l.id = r.id", ["left_model", "right_model"]),
+    ]:
+        manifest["nodes"][node["unique_id"]] = node
+        catalog["nodes"][node["unique_id"]] = {"columns": {"ID": {"name": "ID", "type": "INT"}}}
+        manifest["child_map"].setdefault(node["unique_id"], [])
+        for parent in node["depends_on"]["nodes"]:
+            manifest["child_map"].setdefault(parent, []).append(node["unique_id"])
+    manifest_path.write_text(json.dumps(manifest))
+    catalog_path.write_text(json.dumps(catalog))
+    monkeypatch.setenv("DBT_PROJECT_DIR", str(tmp_path))
+    DbtProject._instance = None
+    yield tmp_path
+    DbtProject._instance = None
@@ -0,0 +1,109 @@
+"""Tests for the batch lineage job behind `POST /api/v1/lineage/batch`.
+
+Many (source, column, reverse, depth) seeds are computed in one call: identical
+seeds run once, merged seeds sharing a depth share one session (so common
+subgraphs are traversed once), and the result is either one merged graph or one
+graph per seed in request order, each from its own session.
+"""
+import logging
+
+import pytest
+
+from dbt_column_lineage import jobs
+from dbt_column_lineage import lineage as lineage_mod
+from dbt_column_lineage.graph import LineageGraph
+from dbt_column_lineage.lineage import DbtSqlglot
+
+LOGGER = logging.getLogger("test")
+
+
+def _single(source, column, reverse, depth):
+    session = DbtSqlglot(LOGGER, request_depth=depth)
+    if column:
+        session.column_lineage(source, column, reverse)
+    else:
+        session.table_lineage(source, reverse)
+    return session.ret_edges_nodes()
+
+
+def _shape(result):
+    return (
+        {node["id"]: sorted(node["data"]["columns"]) for node in result["nodes"]},
+        {edge["id"] for edge in result["edges"]},
+    )
+
+
+def _union(results):
+    nodes, edges = {}, set()
+    for result in results:
+        for node_id, columns in _shape(result)[0].items():
+            nodes[node_id] = sorted(set(nodes.get(node_id, [])) | set(columns))
+        edges |= _shape(result)[1]
+    return nodes, edges
+
+
+SEEDS = [
+    {"source": "mart_model", "column": "id", "reverse": False, "depth": -1},
+    {"source": "base_model", "column": "ID", "reverse": True, "depth": -1},
+    {"source": "child_model", "column": "SCORE", "reverse": False, "depth": 1},
+    {"source": "plain_model", "column": None, "reverse": False, "depth": -1},
+]
+
+
+def test_merged_graph_is_the_union_of_single_seeds(diamond):
+    merged = jobs.batch_lineage_job(LOGGER, SEEDS, True)
+    singles = [_single(s["source"], (s["column"] or "").upper(), s["reverse"], s["depth"]) for s in SEEDS]
+    assert _shape(merged) == _union(singles)
+    assert merged["truncated"] is False
+
+
+def test_per_seed_results_keep_request_order_and_dedupe(diamond, monkeypatch):
+    calls = []
+    original = DbtSqlglot.column_lineage
+    monkeypatch.setattr(DbtSqlglot, "column_lineage",
+                        lambda self, source, column, revs: calls.append((source, column)) or original(self, source, column, revs))
+    seeds = [SEEDS[0], SEEDS[2], {**SEEDS[0], "column": "ID"}]
+    res = jobs.batch_lineage_job(LOGGER, seeds, False)
+
+    assert [(r["source"], r["column"], r["depth"]) for r in res["results"]] == [
+        ("mart_model", "ID", -1), ("child_model", "SCORE", 1), ("mart_model", "ID", -1)]
+    # 大文字小文字だけ違う同じ起点は1回だけ計算する
+    assert calls == [("mart_model", "ID"), ("child_model", "SCORE")]
+    assert _shape(res["results"][1]) == _shape(_single("child_model", "SCORE", False, 1))
+
+
+@pytest.mark.parametrize("merge", [True, False])
+def test_one_time_budget_for_the_whole_batch(diamond, monkeypatch, merge):
+    # 起点ごとに 6 秒かかる。予算 10 秒なら 3 つ目の起点は計算せずに truncated にする
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(lineage_mod, "MAX_LINEAGE_SECONDS", 10)
+    calls = []
+    original = DbtSqlglot.column_lineage
+
+    def slow_column_lineage(self, source, column, revs):
+        calls.append((source, column))
+        original(self, source, column, revs)
+        now[0] += 6
+    monkeypatch.setattr(DbtSqlglot, "column_lineage", slow_column_lineage)
+    seeds = [SEEDS[0], {**SEEDS[0], "depth": 1}, SEEDS[2]]
+    res = jobs.batch_lineage_job(LOGGER, seeds, merge)
+
+    assert calls == [("mart_model", "ID"), ("mart_model", "ID")]
+    if merge:
+        assert res["truncated"] is True
+        assert res["nodes"]
+    else:
+        assert [r["truncated"] for r in res["results"]] == [False, False, True]
+        assert res["results"][2]["nodes"] == [] and res["results"][2]["edges"] == []
+
+
+def test_graph_merge_combines_columns_and_flags():
+    a, b = LineageGraph(), LineageGraph()
+    a.add_node({"id": "1", "data": {"name": "m", "columns": ["X"], "last": False}})
+    b.add_node({"id": "1", "data": {"name": "m", "columns": ["Y", "X"], "last": True}})
+    b.add_node({"id": "2", "data": {"name": "n", "columns": []}})
+    b.add_edge({"id": "2-1"})
+    a.merge(b)
+    assert a.get_node("1")["data"] == {"name": "m", "columns": ["X", "Y"], "last": True}
+    assert a.has_node("2") and a.has_edge("2-1")
@@ -0,0 +1,168 @@
+"""Tests for the precomputed column-lineage index (`build-index`).
+
+`build_column_index` walks every model once and records the per-column sqlglot
+lineage; a server that finds `target/column_lineage_index.json` answers forward
+and reverse column lineage from it without calling sqlglot, and falls back to
+live computation for models whose SQL or upstream schema changed afterwards.
+"""
+import json
+import logging
+import shutil
+
+import pytest
+
+import dbt_column_lineage.lineage as lineage_mod
+from dbt_column_lineage.column_index import ColumnLineageIndex, ModelSlice, build_column_index
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.project import DbtProject
+
+from conftest import FIXTURE_DIR
+
+LOGGER = logging.getLogger("test")
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    shutil.copytree(FIXTURE_DIR / "target", tmp_path / "target")
+    monkeypatch.setenv("DBT_PROJECT_DIR", str(tmp_path))
+    DbtProject._instance = None
+    yield tmp_path
+    DbtProject._instance = None
+
+
+def _build(project_dir):
+    session = DbtSqlglot(LOGGER)
+    build_column_index(session).save(session.project.column_index_path())
+    # 索引を読み込んだプロジェクトで答えさせる
+    DbtProject._instance = None
+
+
+def _lineage(source, column, revs):
+    session = DbtSqlglot(LOGGER)
+    session.column_lineage(source, column, revs)
+    result = session.ret_edges_nodes()
+    # 索引内のリストは整列済みなので、順序に依らない形で比較する
+    for node in result["nodes"]:
+        node["data"]["columns"] = sorted(node["data"]["columns"])
+    return sorted(result["nodes"], key=lambda n: n["id"]), sorted(e["id"] for e in result["edges"])
+
+
+def _no_sqlglot(monkeypatch):
+    def fail(*args, **kwargs):
+        pytest.fail("lineage should come from the index")
+    monkeypatch.setattr(lineage_mod, "lineage", fail)
+    monkeypatch.setattr(lineage_mod, "parse_one", fail)
+
+
+def test_index_records_every_model_column(project_dir):
+    _build(project_dir)
+    data = json.loads((project_dir / "target" / "column_lineage_index.json").read_text())
+    assert data["metadata"]["dialect"] == "snowflake"
+    child = data["models"]["model.test_proj.child_model"]["columns"]
+    assert set(child) == {"ID", "METRIC_NAME", "SCORE"}
+    labels, columns = child["SCORE"]
+    assert labels == ["BASE_MODEL"]
+    assert columns == sorted(columns)
+
+
+@pytest.mark.parametrize("source,column,revs", [
+    ("child_model", "SCORE", False),
+    ("plain_model", "ID", False),
+    ("base_model", "ID", True),
+    ("base_model", "JAN", True),
+])
+def test_indexed_answers_match_live(project_dir, monkeypatch, source, column, revs):
+    expected = _lineage(source, column, revs)
+    _build(project_dir)
+    _no_sqlglot(monkeypatch)
+    assert _lineage(source, column, revs) == expected
+
+
+def test_changed_model_falls_back_to_live(project_dir):
+    _build(project_dir)
+    path = project_dir / "target" / "manifest.json"
+    manifest = json.loads(path.read_text())
+    manifest["nodes"]["model.test_proj.plain_model"]["compiled_code"] = "select feb as id, jan from db.analytics.base_model"
+    path.write_text(json.dumps(manifest))
+    DbtProject._instance = None
+
+    project = DbtProject.get(LOGGER)
+    assert project.indexed_model_columns("model.test_proj.plain_model") is None
+    assert project.indexed_model_columns("model.test_proj.child_model") is not None
+    nodes, _ = _lineage("plain_model", "ID", False)
+    base_model = next(node for node in nodes if node["data"]["name"] == "base_model")
+    assert base_model["data"]["columns"] == ["FEB"]
+
+
+def test_index_for_another_dialect_is_ignored(project_dir):
+    _build(project_dir)
+    path = project_dir / "target" / "column_lineage_index.json"
+    assert ColumnLineageIndex.load(str(path), "snowflake", LOGGER) is not None
+    assert ColumnLineageIndex.load(str(path), "bigquery", LOGGER) is None
+
+
+def test_parallel_build_matches_serial(project_dir):
+    session = DbtSqlglot(LOGGER)
+    progress = []
+    serial = build_column_index(session).models
+    parallel = build_column_index(session, lambda done, total: progress.append((done, total)), workers=2).models
+    assert json.dumps(parallel, sort_keys=True) == json.dumps(serial, sort_keys=True)
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_model_slice_carries_only_the_model_and_its_dependencies(dbt):
+    model_slice = ModelSlice(dbt.project, "model.test_proj.child_model")
+    assert set(model_slice.dbt_manifest_nodes) == {"model.test_proj.child_model", "model.test_proj.base_model"}
+    assert "compiled_code" not in model_slice.dbt_manifest_nodes["model.test_proj.base_model"]
+
+
+def _edit_manifest(project_dir, fn):
+    path = project_dir / "target" / "manifest.json"
+    manifest = json.loads(path.read_text())
+    fn(manifest)
+    path.write_text(json.dumps(manifest))
+    DbtProject._instance = None
+
+
+def test_incremental_build_recomputes_only_changed_models(project_dir, monkeypatch):
+    previous = build_column_index(DbtSqlglot(LOGGER))
+    _edit_manifest(project_dir, lambda m: m["nodes"]["model.test_proj.plain_model"].update(
+        compiled_code="select feb as id, jan from db.analytics.base_model"))
+
+    computed = []
+    original = DbtSqlglot.model_column_lineage
+    monkeypatch.setattr(DbtSqlglot, "model_column_lineage",
+                        lambda self, unique_id: computed.append(unique_id) or original(self, unique_id))
+    index = build_column_index(DbtSqlglot(LOGGER), previous=previous)
+
+    assert computed == ["model.test_proj.plain_model"]
+    assert index.metadata["build"] == {"reused": 2, "rebuilt": 1}
+    assert index.models["model.test_proj.child_model"] == previous.models["model.test_proj.child_model"]
+    assert index.models["model.test_proj.plain_model"]["columns"]["ID"][1] == ["FEB"]
+
+
+def test_incremental_build_follows_upstream_column_changes(project_dir):
+    previous = build_column_index(DbtSqlglot(LOGGER))
+    # base_model のカラムが変わると、それを参照する子モデルの依存スキーマも変わる
+    _edit_manifest(project_dir, lambda m: m["nodes"]["model.test_proj.base_model"]["columns"].update(
+        mar={"name": "mar", "description": ""}))
+    catalog_path = project_dir / "target" / "catalog.json"
+    catalog = json.loads(catalog_path.read_text())
+    catalog["nodes"]["model.test_proj.base_model"]["columns"]["MAR"] = {"name": "MAR", "type": "NUMBER"}
+    catalog_path.write_text(json.dumps(catalog))
+    DbtProject._instance = None
+
+    index = build_column_index(DbtSqlglot(LOGGER), previous=previous)
+    assert index.metadata["build"] == {"reused": 1, "rebuilt": 2}
+
+
+def test_incremental_build_drops_removed_models_and_ignores_other_sqlglot(project_dir):
+    previous = build_column_index(DbtSqlglot(LOGGER))
+    _edit_manifest(project_dir, lambda m: m["nodes"].pop("model.test_proj.plain_model"))
+    index = build_column_index(DbtSqlglot(LOGGER), previous=previous)
+    assert "model.test_proj.plain_model" not in index.models
+    assert index.metadata["build"]["rebuilt"] == 0
+
+    previous.metadata["sqlglot"] = "0.0.0"
+    index = build_column_index(DbtSqlglot(LOGGER), previous=previous)
+    assert index.metadata["build"]["reused"] == 0
@@ -0,0 +1,94 @@
+"""Tests for the compact, interned manifest representation.
+
+`DbtProject` keeps only the manifest fields lineage uses, in slotted
+`CompactNode` objects that behave like read-only mappings; small identical
+dicts (configs, column definitions) are shared, and compiled SQL is spilled
+to a temporary file and read back on demand.
+"""
+import logging
+
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.manifest import CompactNode, CompiledCodeStore, Interner, compact_catalog_node, compact_node
+
+LOGGER = logging.getLogger("test")
+
+RAW_NODE = {
+    "unique_id": "model.test_proj.orders",
+    "resource_type": "model",
+    "name": "orders",
+    "alias": None,
+    "database": "db",
+    "schema": "analytics",
+    "fqn": ["test_proj", "marts", "orders"],
+    "config": {"materialized": "table", "tags": ["x"], "meta": {"owner": "a"}},
+    "depends_on": {"nodes": ["model.test_proj.base_model"], "macros": ["macro.dbt.ref"]},
+    "columns": {"ID": {"name": "ID", "description": "pk", "meta": {}, "tags": []}},
+    "raw_code": "select * from {{ ref('base_model') }}",
+    "compiled_code": "select id from db.analytics.base_model",
+}
+
+
+def test_compact_node_behaves_like_a_mapping():
+    store = CompiledCodeStore()
+    node = compact_node(RAW_NODE, Interner(), store)
+    store.finish()
+    assert isinstance(node, CompactNode)
+    assert node["name"] == "orders"
+    assert node.get("config", {}).get("materialized") == "table"
+    assert node["depends_on"]["nodes"] == ("model.test_proj.base_model",)
+    assert node["columns"] == {"ID": {"name": "ID", "description": "pk"}}
+    assert node.get("fqn", [])[1:-1] == ("marts",)
+    # None の項目と使わない項目は無いものとして扱う
+    assert "alias" not in node and node.get("alias", "x") == "x"
+    assert "raw_code" not in node and node.get("raw_code") is None
+    assert "compiled_code" in node
+    assert dict(node)["compiled_code"] == RAW_NODE["compiled_code"]
+
+
+def test_compiled_code_is_read_from_the_store_and_can_be_overridden():
+    store = CompiledCodeStore()
+    first = compact_node(RAW_NODE, Interner(), store)
+    second = compact_node(dict(RAW_NODE, compiled_code="select 2"), Interner(), store)
+    store.finish()
+    assert store.size == len(RAW_NODE["compiled_code"]) + len("select 2")
+    assert first.compiled_code == RAW_NODE["compiled_code"]
+    assert second["compiled_code"] == "select 2"
+
+    code_hash = first.compiled_code_hash
+    first["compiled_code"] = "select 3"
+    assert first.compiled_code == "select 3"
+    assert first.compiled_code_hash != code_hash
+
+    without_code = compact_node(dict(RAW_NODE, compiled_code=None), Interner(), store)
+    assert "compiled_code" not in without_code and without_code.compiled_code_hash is None
+
+
+def test_identical_small_dicts_are_shared():
+    interner = Interner()
+    a = compact_node(RAW_NODE, interner, None)
+    b = compact_node(dict(RAW_NODE, unique_id="model.test_proj.other"), interner, None)
+    assert a["config"] is b["config"]
+    assert a["columns"]["ID"] is b["columns"]["ID"]
+    # store が無ければ compiled_code はメモリに持つ
+    assert a.compiled_code == RAW_NODE["compiled_code"]
+
+
+def test_catalog_nodes_keep_every_column_field():
+    catalog_node = {
+        "unique_id": "model.test_proj.orders",
+        "metadata": {"type": "BASE TABLE"},
+        "columns": {"ID": {"name": "ID", "type": "NUMBER", "index": 1, "comment": None}},
+        "stats": {},
+    }
+    compact = compact_catalog_node(catalog_node, Interner())
+    assert compact == {"unique_id": "model.test_proj.orders", "columns": catalog_node["columns"]}
+
+
+def test_loaded_project_uses_compact_nodes(diamond):
+    session = DbtSqlglot(LOGGER)
+    nodes = session.project.dbt_manifest_nodes
+    assert all(isinstance(node, CompactNode) for node in nodes.values())
+    assert session.project.compiled_code_store is not None
+    assert "base_model" in nodes["model.test_proj.child_model"].compiled_code
+    session.column_lineage("child_model", "ID", False)
+    assert {node["data"]["name"] for node in session.ret_edges_nodes()["nodes"]} == {"child_model", "base_model"}
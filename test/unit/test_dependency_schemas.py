@@ -0,0 +1,94 @@
+"""Tests for the shared dependency schemas.
+
+Each dependency table's columns are resolved and their names parsed once per
+project, and the read-only `MappingSchema` is built once per set of
+`depends_on` nodes, so models with the same upstreams share one schema and hub
+tables are not re-processed for every model. The result must stay identical
+to adding every table with `add_table`, and the `model_cache_key` hash must
+not change (it is persisted in the column index and the reverse-index store).
+"""
+import hashlib
+import json
+import logging
+from types import SimpleNamespace
+
+from sqlglot import MappingSchema, exp
+
+from dbt_column_lineage.cache import DependencySchemas
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.project import DbtProject
+
+LOGGER = logging.getLogger("test")
+
+
+def _add_table_schema(project, depends_on_nodes, dialect):
+    # 以前の実装: 依存テーブルごとに add_table する
+    schema = MappingSchema(dialect=dialect, normalize=False)
+    for depends_on_node in depends_on_nodes:
+        element = project.dbt_manifest_nodes.get(depends_on_node, project.dbt_manifest_sources.get(depends_on_node))
+        if not element:
+            continue
+        columns = project.catalog_by_name.get(element["name"], {}).get("columns", element.get("columns", {}))
+        schema.add_table(
+            exp.Table(catalog=exp.Identifier(this=element["database"].upper()),
+                      db=exp.Identifier(this=element["schema"].upper()),
+                      this=exp.Identifier(this=element["name"].upper())),
+            column_mapping={k: v.get("type", "STRING") for k, v in columns.items()},
+        )
+    return schema
+
+
+def _old_depends_on_hash(project, depends_on_nodes):
+    depends_on = []
+    for depends_on_node in depends_on_nodes:
+        element = project.dbt_manifest_nodes.get(depends_on_node, project.dbt_manifest_sources.get(depends_on_node))
+        if not element:
+            continue
+        columns = project.catalog_by_name.get(element["name"], {}).get("columns", element.get("columns", {}))
+        depends_on.append([element["database"], element["schema"], element["name"],
+                           [[k, v.get("type", "STRING")] for k, v in columns.items()]])
+    return hashlib.sha1(json.dumps(depends_on).encode("utf-8")).hexdigest()
+
+
+def test_schemas_and_cache_keys_match_add_table(diamond):
+    project = DbtProject(LOGGER)
+    for unique_id, node in project.dbt_manifest_nodes.items():
+        depends_on_nodes = node.get("depends_on", {}).get("nodes", [])
+        _, schema = project.dependency_schemas.schema(project, depends_on_nodes)
+        assert schema.mapping == _add_table_schema(project, depends_on_nodes, project.dialect).mapping
+        assert project.model_cache_key(unique_id)[2] == _old_depends_on_hash(project, depends_on_nodes)
+
+
+def test_edge_cases_match_add_table():
+    # 引用符付き・特殊文字のカラム名、同じテーブルの重複、カラムの無いテーブル、解決できない依存
+    table = {"database": "db", "schema": "s", "name": "t"}
+    project = SimpleNamespace(
+        dbt_manifest_nodes={
+            "model.p.t": {**table, "columns": {'"Mixed"': {"type": "INT"}, "plain": {}}},
+            "model.p.empty": {"database": "db", "schema": "s", "name": "empty"},
+            "model.p.dup": {**table, "columns": {"ID": {"type": "INT"}}},
+        },
+        dbt_manifest_sources={"source.p.t": {**table, "columns": {}}},
+        catalog_by_name={"empty": {"columns": {}}},
+    )
+    for depends_on_nodes in (["model.p.t", "source.p.t"], ["source.p.t", "model.p.t"], ["model.p.t", "model.p.dup"],
+                             ["model.p.empty", "model.p.missing"], []):
+        schemas = DependencySchemas("snowflake", 8)
+        _, schema = schemas.schema(project, depends_on_nodes)
+        assert schema.mapping == _add_table_schema(project, depends_on_nodes, "snowflake").mapping
+        assert schemas.depends_on_hash(project, depends_on_nodes) == _old_depends_on_hash(project, depends_on_nodes)
+
+
+def test_models_with_the_same_dependencies_share_a_schema(diamond):
+    session = DbtSqlglot(LOGGER, request_depth=-1)
+    session.column_lineage("mart_model", "ID", False)
+    project = session.project
+    left = project.parse_cache.get(project.model_cache_key("model.test_proj.left_model"))
+    right = project.parse_cache.get(project.model_cache_key("model.test_proj.right_model"))
+    mart = project.parse_cache.get(project.model_cache_key("model.test_proj.mart_model"))
+    assert left.schema is right.schema
+    # 組が違っても、同じ依存テーブルのカラムの dict は共有する
+    plain = left.schema.mapping["DB"]["ANALYTICS"]["PLAIN_MODEL"]
+    assert project.dependency_schemas.schema(project, ["model.test_proj.plain_model", "model.test_proj.base_model"])[1] \
+        .mapping["DB"]["ANALYTICS"]["PLAIN_MODEL"] is plain
+    assert set(mart.schema.mapping["DB"]["ANALYTICS"]) == {"LEFT_MODEL", "RIGHT_MODEL"}
@@ -0,0 +1,62 @@
+"""Tests for memoized forward column lineage.
+
+Within a request each (model, column) pair is expanded upstream only once, even
+when a diamond-shaped DAG reaches it along several paths; across requests the
+per-(model, column) upstream result is cached on the shared `DbtProject`.
+"""
+import logging
+
+import pytest
+
+import dbt_column_lineage.lineage as lineage_mod
+from dbt_column_lineage.lineage import DbtSqlglot
+
+LOGGER = logging.getLogger("test")
+
+
+def _count_visits(monkeypatch):
+    visits = []
+    original = DbtSqlglot._DbtSqlglot__column_lineage_recursive
+
+    def counting(self, base_source, next_source, *args):
+        visits.append(next_source)
+        return original(self, base_source, next_source, *args)
+    monkeypatch.setattr(DbtSqlglot, "_DbtSqlglot__column_lineage_recursive", counting)
+    return visits
+
+
+def test_diamond_expands_shared_upstream_once(diamond, monkeypatch):
+    visits = _count_visits(monkeypatch)
+    session = DbtSqlglot(LOGGER)
+    session.column_lineage("mart_model", "ID", False)
+
+    # plain_model には2経路から到達する(エッジのため)が、その上流 base_model は1回だけ辿る
+    assert visits.count("plain_model") == 2
+    assert visits.count("base_model") == 1
+    names = {node["data"]["name"] for node in session.ret_edges_nodes()["nodes"]}
+    assert names == {"mart_model", "left_model", "right_model", "plain_model", "base_model"}
+    edges = {edge["id"] for edge in session.ret_edges_nodes()["edges"]}
+    # mart->left, mart->right, left->plain, right->plain, plain->base
+    assert len(edges) == 5
+
+
+def test_upstream_is_cached_across_requests(diamond, monkeypatch):
+    first = DbtSqlglot(LOGGER)
+    first.column_lineage("mart_model", "ID", False)
+    expected = first.ret_edges_nodes()
+
+    def fail(*args, **kwargs):
+        pytest.fail("column lineage should come from the cache")
+    monkeypatch.setattr(lineage_mod, "lineage", fail)
+    second = DbtSqlglot(LOGGER)
+    second.column_lineage("mart_model", "ID", False)
+    assert second.ret_edges_nodes() == expected
+
+
+def test_only_first_resolved_column_is_followed(dbt):
+    # 従来の forward と同じく、1回の訪問で上流を辿るのはリネージが取れた最初のカラムだけ
+    lookup = dbt._DbtSqlglot__compose_forward_lineage
+    node = dbt.project.nodes_by_name["plain_model"]
+    ret = lookup("plain_model", ["NOPE", "JAN", "ID"],
+                 lambda column: dbt._DbtSqlglot__forward_column_result(node, column))
+    assert list(ret) == ["JAN"]
@@ -0,0 +1,52 @@
+"""Tests for the id-indexed graph builder behind every lineage response.
+
+`LineageGraph` dedups nodes/edges by id and merges node columns in O(1), while
+emitting nodes and edges in first-insertion order exactly like the previous
+list-based implementation.
+"""
+from dbt_column_lineage.graph import LineageGraph
+
+
+def _table_node(node_id, name, columns):
+    return {'id': node_id, 'data': {'name': name, 'columns': columns}, 'type': 'tableNode'}
+
+
+def test_nodes_and_edges_keep_insertion_order_and_dedup():
+    g = LineageGraph()
+    assert g.add_node(_table_node('2', 'b', []))
+    assert g.add_node(_table_node('1', 'a', []))
+    assert not g.add_node(_table_node('2', 'other', ['X']))
+    assert g.add_edge({'id': '2-1'})
+    assert not g.add_edge({'id': '2-1', 'source': 'dup'})
+    assert [n['id'] for n in g.node_list()] == ['2', '1']
+    assert g.node_list()[0]['data']['name'] == 'b'
+    assert g.edge_list() == [{'id': '2-1'}]
+
+
+def test_merge_columns_appends_only_new_columns_in_order():
+    g = LineageGraph()
+    g.add_node(_table_node('1', 'a', ['ID']))
+    g.merge_columns('1', ['NAME', 'ID', 'AGE', 'NAME'])
+    assert g.get_node('1')['data']['columns'] == ['ID', 'NAME', 'AGE']
+
+
+def test_find_node_by_name_returns_first_match():
+    g = LineageGraph()
+    g.add_node(_table_node('1', 'a', []))
+    g.add_node(_table_node('2', 'a', []))
+    assert g.find_node_by_name('a')['id'] == '1'
+    assert g.find_node_by_name('missing') is None
+
+
+def test_merge_dashboard_elements_dedups_by_element_id():
+    g = LineageGraph()
+    g.add_node({'id': 'd', 'data': {'name': 'dash', 'elements': [{'id': 'e1'}]}})
+    g.merge_dashboard_elements('d', [{'id': 'e1'}, {'id': 'e2'}, {'id': 'e2'}])
+    assert [e['id'] for e in g.get_node('d')['data']['elements']] == ['e1', 'e2']
+
+
+def test_reverse_column_lineage_accumulates_columns_on_origin(dbt):
+    dbt.column_lineage("base_model", "ID", True)
+    dbt.column_lineage("base_model", "JAN", True)
+    origin = next(n for n in dbt.ret_edges_nodes()["nodes"] if n["data"]["name"] == "base_model")
+    assert origin["data"]["columns"] == ["ID", "JAN"]
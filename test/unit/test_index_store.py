@@ -0,0 +1,86 @@
+"""Tests for the SQLite-backed reverse-index store (`REVERSE_INDEX_DB`).
+
+A per-source reverse index built by one worker/process is persisted keyed by
+the source's fingerprint (children's compiled_code + dependency schema hashes),
+so other workers and restarted processes reuse it instead of rebuilding.
+"""
+import logging
+
+import pytest
+
+import dbt_column_lineage.project as project_mod
+from dbt_column_lineage.index_store import KEEP_GENERATIONS, ReverseIndexStore
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.project import DbtProject
+
+LOGGER = logging.getLogger("test")
+
+
+def test_store_round_trip_and_prunes_old_generations(tmp_path):
+    store = ReverseIndexStore(str(tmp_path / "idx" / "reverse.sqlite"), "snowflake", LOGGER)
+    store.put("src", "fp1", [{"child": "a"}])
+    assert store.get("src", "fp1") == [{"child": "a"}]
+    assert store.get("src", "fp2") is None
+    for generation in range(2, KEEP_GENERATIONS + 2):
+        store.put("src", f"fp{generation}", [{"child": generation}])
+    # 最も古い世代だけが消える
+    assert store.get("src", "fp1") is None
+    assert store.get("src", "fp2") == [{"child": 2}]
+    assert store.get("src", f"fp{KEEP_GENERATIONS + 1}") == [{"child": KEEP_GENERATIONS + 1}]
+
+
+def test_workers_on_different_versions_keep_each_others_rows(tmp_path):
+    # リロード中は新旧の版のワーカーが同じファイルに書く
+    path = str(tmp_path / "reverse.sqlite")
+    old, new = ReverseIndexStore(path, "snowflake", LOGGER), ReverseIndexStore(path, "snowflake", LOGGER)
+    for _ in range(3):
+        old.put("src", "fp-old", [{"child": "old"}])
+        new.put("src", "fp-new", [{"child": "new"}])
+    assert old.get("src", "fp-old") == [{"child": "old"}]
+    assert new.get("src", "fp-new") == [{"child": "new"}]
+
+
+def test_store_is_keyed_by_dialect(tmp_path):
+    path = str(tmp_path / "reverse.sqlite")
+    ReverseIndexStore(path, "snowflake", LOGGER).put("src", "fp", [])
+    assert ReverseIndexStore(path, "bigquery", LOGGER).get("src", "fp") is None
+
+
+def test_store_errors_do_not_raise(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    store = ReverseIndexStore(str(blocker / "reverse.sqlite"), "snowflake", LOGGER)
+    store.put("src", "fp", [])
+    assert store.get("src", "fp") is None
+
+
+@pytest.fixture
+def persisted(dbt, tmp_path, monkeypatch):
+    monkeypatch.setattr(project_mod, "REVERSE_INDEX_DB", str(tmp_path / "reverse.sqlite"))
+    DbtProject._instance = None
+    return DbtSqlglot(LOGGER)
+
+
+def _restart():
+    # プロセス再起動相当: メモリ上のプロジェクト(とキャッシュ)を捨てて読み直す
+    DbtProject._instance = None
+    return DbtSqlglot(LOGGER)
+
+
+def test_restarted_process_reuses_persisted_index(persisted, monkeypatch):
+    persisted.column_lineage("base_model", "ID", True)
+    expected = persisted.ret_edges_nodes()
+
+    restarted = _restart()
+    monkeypatch.setattr(DbtSqlglot, "_DbtSqlglot__build_reverse_indexes",
+                        lambda self, sources: pytest.fail("index should come from the store"))
+    restarted.column_lineage("base_model", "ID", True)
+    assert restarted.ret_edges_nodes() == expected
+
+
+def test_changed_child_sql_misses_the_store(persisted):
+    persisted.column_lineage("base_model", "ID", True)
+    restarted = _restart()
+    node = restarted.project.dbt_manifest_nodes["model.test_proj.plain_model"]
+    node["compiled_code"] = "select jan as id from db.analytics.base_model"
+    assert restarted.project.load_reverse_index("base_model") is None
@@ -0,0 +1,101 @@
+"""Tests for the incremental JSON loader used for manifest.json / catalog.json.
+
+`JsonStreamReader` walks objects key by key with a bounded buffer, so the
+loader converts one node at a time and skips unused top-level sections
+instead of materializing the whole document.
+"""
+import io
+import json
+
+import pytest
+
+from dbt_column_lineage.json_stream import JsonStreamReader
+from dbt_column_lineage.manifest import Interner, compact_catalog_node, compact_node, load_catalog, load_manifest
+
+from conftest import FIXTURE_DIR
+
+DOCUMENT = {
+    "metadata": {"project_name": "p", "invocation_id": "日本語-✓"},
+    "nodes": {"a": {"n": 12345678901234567890, "f": -1.5e-3, "ok": True, "no": None, "s": "x\"y\\z\n",
+                    "c": "\x01\x1f"}, "b": {}},
+    "macros": {"m": {"sql": "{{ x }}" * 50, "args": [[], {}, [1, [2, {"3": 4}]]]}},
+    "list": [1, 2, 3],
+    "empty": {},
+    "last": 7,
+}
+
+
+def _reader(text, chunk_bytes):
+    return JsonStreamReader(io.BytesIO(text.encode("utf-8")), chunk_bytes=chunk_bytes)
+
+
+def _read_all(reader):
+    # オブジェクトはキーごとに、それ以外は丸ごと読む
+    return {key: _read_all(reader) if reader._peek() == "{" else reader.value() for key in reader.items()}
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 3, 7, 64, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_reads_the_same_values_as_json_loads(chunk_bytes, indent):
+    # チャンクの境目が文字列・数値・マルチバイト文字の途中に来ても同じ結果になる
+    text = json.dumps(DOCUMENT, indent=indent, ensure_ascii=False)
+    assert _read_all(_reader(text, chunk_bytes)) == DOCUMENT
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 5, 1 << 20])
+def test_skip_and_value_can_be_mixed(chunk_bytes):
+    reader = _reader(json.dumps(DOCUMENT), chunk_bytes)
+    seen = {}
+    for key in reader.items():
+        if key == "nodes":
+            seen[key] = {node_id: reader.value() for node_id in reader.items()}
+        elif key in ("last", "metadata"):
+            seen[key] = reader.value()
+        else:
+            reader.skip()
+    assert seen == {"metadata": DOCUMENT["metadata"], "nodes": DOCUMENT["nodes"], "last": 7}
+
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a" 1}', '{"a": 1 "b": 2}', '{"a": tru}', '[1]', ''])
+def test_malformed_json_raises(text):
+    with pytest.raises(json.JSONDecodeError):
+        _read_all(_reader(text, 2))
+
+
+class _CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+@pytest.mark.parametrize("broken", ['{"a": tru}', '{"a": [1, 2 3]}', '{"a": "x\\q"}', '{"a": "x\\u12zz"}'])
+def test_malformed_value_raises_without_reading_the_rest(broken):
+    # 壊れた値の後ろに大きな残りがあっても、そこまで読まずに送出する
+    data = (broken[:-1] + ', "tail": "' + "x" * (1 << 20) + '"}').encode("utf-8")
+    f = _CountingFile(data)
+    with pytest.raises(json.JSONDecodeError):
+        _read_all(JsonStreamReader(f, chunk_bytes=16))
+    assert f.bytes_read < 1024
+
+
+def test_loaders_match_a_full_json_load():
+    manifest_path = FIXTURE_DIR / "target" / "manifest.json"
+    catalog_path = FIXTURE_DIR / "target" / "catalog.json"
+    raw_manifest = json.loads(manifest_path.read_text())
+    raw_catalog = json.loads(catalog_path.read_text())
+
+    manifest = load_manifest(str(manifest_path), Interner(), None)
+    assert set(manifest) == {"metadata", "nodes", "sources", "child_map", "parent_map"}
+    assert manifest["metadata"] == raw_manifest["metadata"]
+    for section in ("nodes", "sources"):
+        assert {k: dict(v) for k, v in manifest[section].items()} == \
+               {k: dict(compact_node(v, Interner(), None)) for k, v in raw_manifest[section].items()}
+    assert manifest["child_map"] == {k: tuple(v) for k, v in raw_manifest["child_map"].items()}
+
+    catalog = load_catalog(str(catalog_path), Interner())
+    assert catalog["nodes"] == {k: compact_catalog_node(v, Interner()) for k, v in raw_catalog["nodes"].items()}
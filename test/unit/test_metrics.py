@@ -0,0 +1,135 @@
+"""Tests for the Prometheus metrics (`GET /metrics`).
+
+Lineage jobs report each computed response's node and edge counts, the
+deepest level reached and whether `MAX_LINEAGE_SECONDS` cut it short.
+`LineageMetrics` turns these into histograms and counters. At scrape time it
+reads cache sizes and hit ratios, pool queue depth and project load time, and
+renders everything in the Prometheus text format. `MetricsMiddleware` times
+every request by its route template.
+"""
+import asyncio
+import json
+import logging
+import math
+from types import SimpleNamespace
+
+from dbt_column_lineage import jobs
+from dbt_column_lineage import lineage as lineage_mod
+from dbt_column_lineage.metrics import Counter, Histogram, LineageMetrics, MetricsMiddleware
+from dbt_column_lineage.pool import LineagePool
+from dbt_column_lineage.project import DbtProject
+from dbt_column_lineage.responses import ResponseStats
+
+LOGGER = logging.getLogger("test")
+
+
+def _samples(text):
+    # "name{labels} value" -> {"name{labels}": value}
+    return {line.rsplit(" ", 1)[0]: line.rsplit(" ", 1)[1] for line in text.splitlines() if not line.startswith("#")}
+
+
+def test_histogram_and_counter_text_format():
+    histogram = Histogram("h", "A histogram.", (1, 5), ("endpoint",))
+    for value in (0.5, 1, 3, 7):
+        histogram.observe(value, "/a")
+    counter = Counter("c_total", "A counter.", ("endpoint",))
+    counter.inc('/x"y\\z\n')
+    text = histogram.render() + counter.render()
+
+    assert text.splitlines()[:2] == ["# HELP h A histogram.", "# TYPE h histogram"]
+    samples = _samples(text)
+    # バケットは累積
+    assert samples['h_bucket{endpoint="/a",le="1.0"}'] == "2"
+    assert samples['h_bucket{endpoint="/a",le="5.0"}'] == "3"
+    assert samples['h_bucket{endpoint="/a",le="+Inf"}'] == "4"
+    assert samples['h_sum{endpoint="/a"}'] == "11.5"
+    assert samples['h_count{endpoint="/a"}'] == "4"
+    assert samples['c_total{endpoint="/x\\"y\\\\z\\n"}'] == "1"
+
+
+def test_encoded_job_reports_response_stats(diamond):
+    forward = jobs.encoded_job(jobs.lineage_job, None, LOGGER, "mart_model", json.dumps({"mart_model": ["ID"]}),
+                               True, False, -1)
+    body = json.loads(forward.body)
+    # mart -> left/right -> plain -> base
+    assert forward.stats == ResponseStats(len(body["nodes"]), len(body["edges"]), 3, False)
+
+    table = jobs.encoded_job(jobs.lineage_job, None, LOGGER, "base_model", "", False, True, 1)
+    assert table.stats.depth == 1
+
+    reverse = jobs.encoded_job(jobs.lineage_job, None, LOGGER, "base_model", json.dumps({"base_model": ["ID"]}),
+                               True, True, -1)
+    assert reverse.stats.depth == 3
+
+    seeds = [{"source": "mart_model", "column": "ID"}, {"source": "plain_model", "column": "ID", "depth": 1}]
+    batch = jobs.encoded_job(jobs.batch_lineage_job, None, LOGGER, seeds, False)
+    results = json.loads(batch.body)["results"]
+    assert batch.stats.nodes == sum(len(result["nodes"]) for result in results)
+    assert batch.stats.depth == 3
+
+
+def test_budget_truncation_is_reported(diamond, monkeypatch):
+    monkeypatch.setattr(lineage_mod, "MAX_LINEAGE_SECONDS", 1e-9)
+    seeds = [{"source": "mart_model", "column": "ID"}]
+    # merge=False の結果には最上位の truncated が無いが、stats には入る
+    encoded = jobs.encoded_job(jobs.batch_lineage_job, None, LOGGER, seeds, False)
+    assert encoded.stats.truncated
+
+    metrics = LineageMetrics()
+    metrics.observe_response("/api/v1/lineage/batch", encoded.stats)
+    metrics.observe_response("/api/v1/lineage/batch", None)
+    assert metrics.budget_truncated.get("/api/v1/lineage/batch") == 1
+    assert _samples(metrics.render())['lineage_response_nodes_count{endpoint="/api/v1/lineage/batch"}'] == "1"
+
+
+def test_render_reads_caches_pool_and_project(diamond):
+    columns = json.dumps({"base_model": ["ID"]})
+    jobs.lineage_job(LOGGER, "base_model", columns, True, True, -1)
+    jobs.lineage_job(LOGGER, "base_model", columns, True, True, -1)
+    project = DbtProject.loaded()
+    pool = LineagePool("thread", max_workers=2, max_queue=3)
+    pool.in_flight = 4
+    result_cache = SimpleNamespace(enabled=True, stats=lambda: {
+        "hits": 2, "disk_hits": 1, "misses": 1, "entries": 3, "bytes": 100})
+
+    samples = _samples(LineageMetrics().render(pool, result_cache, project))
+    assert samples["lineage_pool_queue_depth"] == "2"
+    assert samples["lineage_pool_max_queue"] == "3"
+    assert samples['lineage_cache_entries{cache="reverse_index"}'] == str(len(project.reverse_index_cache))
+    assert int(samples['lineage_cache_hits_total{cache="reverse_index"}']) > 0
+    assert samples['lineage_cache_hits_total{cache="parse"}'] == str(project.parse_cache.hits)
+    assert samples['lineage_cache_hit_ratio{cache="result"}'] == "0.75"
+    assert samples['lineage_cache_bytes{cache="result"}'] == "100"
+    assert 'lineage_cache_bytes{cache="reverse_index"}' not in samples
+    assert float(samples["lineage_project_load_seconds"]) == project.load_seconds
+
+
+def test_render_before_the_project_is_loaded():
+    samples = _samples(LineageMetrics().render(None, SimpleNamespace(enabled=False), None))
+    assert not any(name.startswith(("lineage_cache", "lineage_project")) for name in samples)
+    cache = _samples(LineageMetrics().render(None, SimpleNamespace(enabled=True, stats=lambda: {
+        "hits": 0, "disk_hits": 0, "misses": 0, "entries": 0, "bytes": 0}), None))
+    assert math.isnan(float(cache['lineage_cache_hit_ratio{cache="result"}']))
+
+
+def test_middleware_times_requests_by_route_template():
+    metrics = LineageMetrics()
+
+    async def app(scope, receive, send):
+        # ルーティング済みならルートが scope に入る
+        if scope["path"].startswith("/api/"):
+            scope["route"] = SimpleNamespace(path="/api/v1/items/{item_id}")
+        await send({"type": "http.response.start", "status": 404 if scope["path"] == "/missing" else 200})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(app, metrics)
+    for path in ("/api/v1/items/1", "/api/v1/items/2", "/missing"):
+        asyncio.run(middleware({"type": "http", "path": path}, None, send))
+
+    assert metrics.requests.get("/api/v1/items/{item_id}", "200") == 2
+    assert metrics.requests.get("other", "404") == 1
+    samples = _samples(metrics.render())
+    assert samples['lineage_http_request_duration_seconds_count{endpoint="/api/v1/items/{item_id}"}'] == "2"
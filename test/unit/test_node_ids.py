@@ -0,0 +1,57 @@
+"""Tests for React Flow node ids.
+
+Node, edge and dashboard ids are the unsigned 32-bit Java-style string hash
+of the name in decimal, and the frontend matches on them, so they must stay
+bit-identical. Names from the manifest are hashed once at load time with the
+batch implementation; other strings fall back to the single-string version.
+"""
+import logging
+import random
+
+import pytest
+
+from dbt_column_lineage.node_ids import node_id, node_ids
+from dbt_column_lineage.project import DbtProject
+
+LOGGER = logging.getLogger("test")
+
+NAMES = ["", "x", "base_model", "child_model", "Mixed_Case", "stg_" * 40, "日本語のモデル", "emoji_\U0001F600",
+         "lone_\ud800_surrogate", "\x00lead", "trail\x00"]
+
+
+def _reference(s):
+    # 以前の実装(文字ごとに 32bit に丸める)
+    hash_value = 0
+    for char in s:
+        hash_value = (hash_value << 5) - hash_value + ord(char)
+        hash_value = hash_value & 0xFFFFFFFF
+    return str(abs(hash_value))
+
+
+def test_known_ids():
+    assert [node_id(s) for s in ["base_model", "child_model", "x"]] == ["3814212667", "3348565574", "120"]
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_single_matches_the_reference(name):
+    assert node_id(name) == _reference(name)
+
+
+def test_batch_matches_the_reference():
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz_0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ日本\U0001F600"
+    names = NAMES + ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80))) for _ in range(500)]
+    assert node_ids(names) == [_reference(name) for name in names]
+    assert node_ids([]) == []
+    assert node_ids(iter(["x"])) == ["120"]
+
+
+def test_project_precomputes_ids_for_manifest_names(dbt):
+    project = DbtProject.get(LOGGER)
+    for dbt_node in (*project.dbt_manifest_nodes.values(), *project.dbt_manifest_sources.values()):
+        assert project.node_ids[dbt_node["name"]] == _reference(dbt_node["name"])
+        assert project.node_ids[dbt_node["name"].lower()] == _reference(dbt_node["name"].lower())
+    dbt.column_lineage("child_model", "ID", False)
+    nodes = dbt.ret_edges_nodes()["nodes"]
+    assert nodes
+    assert {node["id"] for node in nodes} == {_reference(node["data"]["name"]) for node in nodes}
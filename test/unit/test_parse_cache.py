@@ -0,0 +1,103 @@
+"""Tests for the cross-request parsed-model cache.
+
+Each model's compiled SQL is parsed once per (unique_id, compiled_code hash);
+the AST, the dependency MappingSchema and the qualified AST are reused by
+forward, reverse and CTE lineage across requests.
+"""
+import logging
+import threading
+
+from sqlglot import MappingSchema, parse_one
+from sqlglot.lineage import lineage
+
+import dbt_column_lineage.lineage as lineage_mod
+from dbt_column_lineage.cache import LruCache, ParsedModel
+from dbt_column_lineage.lineage import DbtSqlglot
+
+
+def _count_parses(monkeypatch):
+    calls = []
+    real = lineage_mod.parse_one
+
+    def counting(sql, *args, **kwargs):
+        calls.append(sql)
+        return real(sql, *args, **kwargs)
+
+    monkeypatch.setattr(lineage_mod, "parse_one", counting)
+    return calls
+
+
+def test_model_is_parsed_once_across_requests(dbt, monkeypatch):
+    calls = _count_parses(monkeypatch)
+    dbt.column_lineage("plain_model", "ID", False)
+    other = DbtSqlglot(logging.getLogger("test"))
+    other.column_lineage("plain_model", "JAN", False)
+    other.cte_dependency("plain_model", ["ID"])
+    code = dbt.project.dbt_manifest_nodes["model.test_proj.plain_model"]["compiled_code"]
+    assert calls.count(code) == 1
+
+
+def test_reverse_index_reuses_cached_scope_without_touching_ast(dbt):
+    dbt.column_lineage("base_model", "ID", True)
+    parsed_model = dbt.project.parse_cache.get(dbt.project.model_cache_key("model.test_proj.plain_model"))
+    assert parsed_model is not None
+    # qualify は破壊的なので、Scope はコピーから作られ元の AST は未修飾のまま
+    qualified, _ = parsed_model.qualified_scope("snowflake")
+    assert qualified is not parsed_model.parsed
+    assert parsed_model.parsed.sql() == "SELECT id, jan FROM db.analytics.base_model"
+
+
+def test_qualified_model_is_shared_safely_between_threads():
+    # 同じモデルを複数のスレッドから同時に引いても、Scope の遅延収集が混ざらない
+    sql = """
+        with a as (select o.id, o.amount, c.name from db.s.orders o join db.s.customers c on o.cid = c.id),
+             b as (select id, sum(amount) as total from a group by id)
+        select a.id, a.name, b.total, (select max(amount) from a) as top from a join b on a.id = b.id
+    """
+    schema = MappingSchema({"db": {"s": {"orders": {"id": "INT", "cid": "INT", "amount": "INT"},
+                                         "customers": {"id": "INT", "name": "STRING"}}}}, dialect="snowflake")
+    parsed_model = ParsedModel("model.p.m", "hash", parse_one(sql, dialect="snowflake"), [], schema)
+
+    def resolve():
+        qualified, scope = parsed_model.qualified_scope("snowflake")
+        nodes = lineage(None, qualified, dialect="snowflake", schema=schema, scope=scope)
+        return scope, {column: sorted(n.name for n in node.walk()) for column, node in nodes.items()}
+
+    _, expected = resolve()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        for _ in range(20):
+            results.append(resolve())
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 160
+    assert all(result == expected for _, result in results)
+    assert len({id(scope) for scope, _ in results}) == len(results)
+
+
+def test_cache_key_follows_compiled_code(dbt):
+    uid = "model.test_proj.plain_model"
+    before = dbt.project.compiled_code_hash(uid)
+    dbt.project.dbt_manifest_nodes[uid]["compiled_code"] = "select id from db.analytics.base_model"
+    dbt.project.compiled_code_hashes.clear()
+    assert dbt.project.compiled_code_hash(uid) != before
+
+
+def test_lru_evicts_by_entries_and_bytes():
+    cache = LruCache(max_entries=2, max_bytes=100)
+    cache.put("a", 1, 10)
+    cache.put("b", 2, 10)
+    assert cache.get("a") == 1  # a を最近使ったので b が先に追い出される
+    cache.put("c", 3, 10)
+    assert cache.get("b") is None
+    cache.put("d", 4, 95)
+    assert len(cache) == 1 and cache.get("d") == 4
+    assert cache.total_bytes == 95
+    assert cache.hits == 2 and cache.misses == 1
@@ -0,0 +1,61 @@
+"""Tests for the bounded lineage worker pool and the jobs it runs.
+
+Handlers dispatch lineage work to `LineagePool` so the event loop stays free.
+Once running + queued work reaches max_workers + max_queue, further submissions
+are rejected with `PoolSaturated` (turned into a 503 by main.py).
+"""
+import asyncio
+import logging
+import threading
+
+import pytest
+
+from dbt_column_lineage import jobs
+from dbt_column_lineage.pool import LineagePool, PoolSaturated
+
+
+def test_run_returns_result_off_the_loop_thread():
+    pool = LineagePool('thread', max_workers=2, max_queue=0)
+    loop_thread = threading.get_ident()
+    try:
+        ident = asyncio.run(pool.run(threading.get_ident))
+    finally:
+        pool.shutdown()
+    assert ident != loop_thread
+    assert pool.in_flight == 0
+
+
+def test_rejects_when_workers_and_queue_are_full():
+    pool = LineagePool('thread', max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert pool.queue_depth == 1
+        with pytest.raises(PoolSaturated):
+            await pool.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert pool.in_flight == 0
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        LineagePool('fiber')
+
+
+def test_lineage_job_matches_direct_session(dbt):
+    # ハンドラから移したジョブが従来のハンドラ本体と同じ結果を返すこと
+    res = jobs.lineage_job(logging.getLogger("test"), "base_model", "{}", False, True, -1)
+    dbt.table_lineage("base_model", True)
+    assert res == dbt.ret_edges_nodes()
+
+
+def test_cte_job_returns_none_without_compiled_code(dbt):
+    assert jobs.cte_job(logging.getLogger("test"), "does_not_exist", []) is None
@@ -0,0 +1,95 @@
+"""Tests for request-scoped profiling (`debug=timing`).
+
+A profiled session records exclusive time per traversal phase, per-model
+time, the models it visited, cache hits and budget truncations. The jobs
+return this as a `timing` object and a `Server-Timing` header. Unprofiled
+sessions use a no-op profile and return the same graph as before.
+"""
+import json
+import logging
+
+import dbt_column_lineage.profiling as profiling_mod
+from dbt_column_lineage import jobs
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.profiling import PHASES, RequestProfile, server_timing
+from dbt_column_lineage.responses import encoded_response
+
+LOGGER = logging.getLogger("test")
+
+
+def test_nested_phases_are_counted_exclusively(monkeypatch):
+    clock = iter([0.0, 1.0, 3.0, 4.0, 6.0, 10.0])
+    monkeypatch.setattr(profiling_mod.time, "perf_counter", lambda: next(clock))
+    profile = RequestProfile()
+    with profile.phase("graph", "a"):
+        # graph: 1.0 -> 3.0、lineage: 3.0 -> 4.0、graph: 4.0 -> 6.0
+        with profile.phase("lineage", "b"):
+            pass
+    timing = profile.as_dict()
+    assert timing["phases_ms"]["graph"] == 4000.0
+    assert timing["phases_ms"]["lineage"] == 1000.0
+    assert timing["phases_ms"]["other"] == 5000.0
+    assert timing["total_ms"] == 10000.0
+    assert [model["model"] for model in timing["slowest_models"]] == ["a", "b"]
+
+
+def test_profiled_session_records_phases_models_and_caches(diamond):
+    profile = RequestProfile()
+    session = DbtSqlglot(LOGGER, profile=profile)
+    session.column_lineage("mart_model", "ID", False)
+    timing = profile.as_dict()
+
+    assert set(timing["phases_ms"]) == {*PHASES, "other"}
+    for phase in ("parse", "qualify", "lineage", "extract", "graph"):
+        assert timing["phases_ms"][phase] > 0
+    assert sum(timing["phases_ms"].values()) <= timing["total_ms"] + 0.01
+    visited = {model["model"]: model["visits"] for model in timing["slowest_models"]}
+    assert timing["models_visited"] == 5
+    assert visited["mart_model"] == 1 and visited["base_model"] == 1
+    assert timing["cache"]["parse"]["misses"] == 5
+    assert timing["budget_truncations"] == 0
+
+    # 2回目はパースもカラムリネージもキャッシュから引く
+    profile = RequestProfile()
+    DbtSqlglot(LOGGER, profile=profile).column_lineage("mart_model", "ID", False)
+    cache = profile.as_dict()["cache"]
+    assert cache["column_lineage"]["misses"] == 0 and cache["column_lineage"]["hits"] > 0
+    assert "parse" not in cache
+
+
+def test_budget_truncations_are_counted(diamond, monkeypatch):
+    profile = RequestProfile()
+    session = DbtSqlglot(LOGGER, profile=profile)
+    session._deadline = 0.0
+    session.column_lineage("mart_model", "ID", False)
+    assert session.budget_truncated
+    assert profile.as_dict()["budget_truncations"] == 1
+
+
+def test_profiling_does_not_change_the_result(diamond):
+    columns = json.dumps({"base_model": ["ID"]})
+    plain = jobs.lineage_job(LOGGER, "base_model", columns, True, True, -1)
+    profiled = jobs.lineage_job(LOGGER, "base_model", columns, True, True, -1, True)
+    timing = profiled.pop("timing")
+    assert profiled == plain
+    assert "timing" not in plain
+    # 1回目に構築したリバース索引を引く
+    assert timing["cache"]["reverse_index"]["misses"] == 0 and timing["cache"]["reverse_index"]["hits"] > 0
+
+
+def test_timing_is_returned_in_the_body_and_server_timing_header(diamond):
+    encoded = jobs.encoded_job(jobs.lineage_job, None, LOGGER, "mart_model", "ID", False, False, -1, True)
+    timing = json.loads(encoded.body)["timing"]
+    header = encoded_response(encoded).headers["server-timing"]
+    assert header.startswith(server_timing(timing))
+    assert [metric.split(";")[0] for metric in header.split(", ")] == [*PHASES, "other", "total", "encode"]
+
+    plain = jobs.encoded_job(jobs.lineage_job, None, LOGGER, "mart_model", "ID", False, False, -1)
+    assert "server-timing" not in encoded_response(plain).headers
+    assert "timing" not in json.loads(plain.body)
+
+
+def test_cte_job_timing(dbt):
+    res = jobs.cte_job(LOGGER, "child_model", ["ID"], True)
+    assert res["timing"]["models_visited"] == 1
+    assert jobs.cte_job(LOGGER, "child_model", ["ID"])["nodes"] == res["nodes"]
@@ -0,0 +1,68 @@
+"""Tests for the name/alias/schema indexes built once when a project loads.
+
+Name resolution and the sidebar endpoints (`/schemas`, `/sources`, `/columns`)
+read these indexes instead of scanning the whole manifest per call.
+"""
+import json
+import logging
+
+from dbt_column_lineage.project import DbtProject
+
+
+def _model(name, schema, fqn_dirs, alias=None, columns=None, resource_type='model', package='proj'):
+    return {
+        'resource_type': resource_type, 'name': name, 'alias': alias or name,
+        'unique_id': f'{resource_type}.proj.{name}', 'schema': schema, 'package_name': package,
+        'fqn': ['proj', 'models', *fqn_dirs, name], 'database': 'db',
+        'columns': columns if columns is not None else {'id': {'name': 'id', 'description': 'pk'}},
+    }
+
+
+def _load(tmp_path, monkeypatch, nodes, catalog_nodes=None):
+    target = tmp_path / 'target'
+    target.mkdir()
+    manifest = {'metadata': {'project_name': 'proj'}, 'nodes': nodes, 'sources': {}, 'child_map': {}, 'parent_map': {}}
+    (target / 'manifest.json').write_text(json.dumps(manifest))
+    (target / 'catalog.json').write_text(json.dumps({'nodes': catalog_nodes or {}}))
+    monkeypatch.setenv('DBT_PROJECT_DIR', str(tmp_path))
+    return DbtProject(logging.getLogger('test'))
+
+
+def test_name_index_prefers_model_over_seed_and_snapshot(tmp_path, monkeypatch):
+    nodes = {n['unique_id']: n for n in [
+        _model('dup', 'raw', [], resource_type='snapshot'),
+        _model('dup', 'raw', [], resource_type='seed'),
+        _model('dup', 'mart', []),
+        _model('only_seed', 'raw', [], resource_type='seed'),
+    ]}
+    project = _load(tmp_path, monkeypatch, nodes, {'seed.proj.only_seed': {'columns': {'ID': {}}}})
+    assert project.nodes_by_name['dup']['resource_type'] == 'model'
+    assert project.nodes_by_name['only_seed']['resource_type'] == 'seed'
+    assert project.catalog_by_name['only_seed'] == {'columns': {'ID': {}}}
+    assert 'missing' not in project.nodes_by_name
+
+
+def test_schema_and_source_options(tmp_path, monkeypatch):
+    nodes = {n['unique_id']: n for n in [
+        _model('b_orders', 'mart', ['sales']),
+        _model('a_orders', 'mart', ['sales']),
+        _model('customers', 'mart', ['crm']),
+        _model('no_columns', 'staging', [], columns={}),
+        _model('other_pkg', 'vendor', [], package='dep'),
+    ]}
+    project = _load(tmp_path, monkeypatch, nodes)
+    # カラム定義なし / 他パッケージのスキーマは選択肢に出ない
+    assert project.schema_options == [{'value': 'mart', 'label': 'mart'}]
+    assert project.source_options_by_schema['mart'] == [
+        {'label': 'crm', 'options': [{'value': 'customers', 'label': 'customers'}]},
+        {'label': 'sales', 'options': [{'value': 'a_orders', 'label': 'a_orders'},
+                                       {'value': 'b_orders', 'label': 'b_orders'}]},
+    ]
+    assert project.nodes_by_alias['customers']['name'] == 'customers'
+
+
+def test_list_endpoints_read_indexes(dbt):
+    dbt.project.nodes_by_alias['base_model'] = {'columns': {'id': {'name': 'ID', 'description': 'pk'}}}
+    assert dbt.list_columns('base_model') == [{'value': 'id', 'label': 'ID', 'description': 'pk'}]
+    assert dbt.list_columns('nope') is None
+    assert dbt.list_sources('nope') == []
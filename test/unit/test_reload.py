@@ -0,0 +1,110 @@
+"""Tests for hot reload of manifest.json / catalog.json.
+
+`DbtProject.reload()` loads a new snapshot, carries over the parsed-model and
+reverse-index caches whose inputs did not change, and swaps it in atomically.
+Sessions created before the swap keep working on the old snapshot.
+"""
+import json
+import logging
+import shutil
+import time
+
+import pytest
+
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.project import DbtProject, ProjectReloader
+
+from conftest import FIXTURE_DIR
+
+LOGGER = logging.getLogger("test")
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    shutil.copytree(FIXTURE_DIR / "target", tmp_path / "target")
+    monkeypatch.setenv("DBT_PROJECT_DIR", str(tmp_path))
+    DbtProject._instance = None
+    yield tmp_path
+    DbtProject._instance = None
+
+
+def _edit(project_dir, name, fn):
+    path = project_dir / "target" / name
+    data = json.loads(path.read_text())
+    fn(data)
+    path.write_text(json.dumps(data))
+
+
+def test_reload_swaps_snapshot_but_running_session_keeps_old(project_dir):
+    running = DbtSqlglot(LOGGER)
+    _edit(project_dir, "manifest.json",
+          lambda m: m["nodes"]["model.test_proj.plain_model"]["config"].update(materialized="table"))
+    new = DbtProject.reload(LOGGER)
+
+    assert DbtProject.get(LOGGER) is new
+    assert running.project is not new
+    running.table_lineage("plain_model")
+    assert running.ret_edges_nodes()["nodes"][0]["data"]["materialized"] == "view"
+    fresh = DbtSqlglot(LOGGER)
+    fresh.table_lineage("plain_model")
+    assert fresh.ret_edges_nodes()["nodes"][0]["data"]["materialized"] == "table"
+
+
+def test_reload_carries_over_only_unchanged_parsed_models(project_dir):
+    session = DbtSqlglot(LOGGER)
+    session.column_lineage("base_model", "ID", True)  # child_model / plain_model をパース
+    old = session.project
+    _edit(project_dir, "manifest.json", lambda m: m["nodes"]["model.test_proj.plain_model"].update(
+        compiled_code="select id from db.analytics.base_model"))
+    new = DbtProject.reload(LOGGER)
+
+    child_key = new.model_cache_key("model.test_proj.child_model")
+    assert new.parse_cache.get(child_key) is old.parse_cache.get(child_key)
+    assert new.model_cache_key("model.test_proj.plain_model") != old.model_cache_key("model.test_proj.plain_model")
+    assert len(new.parse_cache) == 1
+    # 子モデルの SQL が変わったので base_model のリバース索引は作り直しになる
+    assert "base_model" not in new.reverse_index_cache
+
+
+def test_upstream_catalog_change_invalidates_dependants(project_dir):
+    session = DbtSqlglot(LOGGER)
+    session.column_lineage("base_model", "ID", True)
+    old = session.project
+    _edit(project_dir, "catalog.json",
+          lambda c: c["nodes"]["model.test_proj.base_model"]["columns"].update(MAR={"name": "MAR", "type": "INT"}))
+    new = DbtProject.reload(LOGGER)
+    assert len(new.parse_cache) == 0
+    assert new.model_cache_key("model.test_proj.base_model") == old.model_cache_key("model.test_proj.base_model")
+
+
+def test_unchanged_reverse_index_is_carried_over(project_dir):
+    session = DbtSqlglot(LOGGER)
+    session.column_lineage("base_model", "ID", True)
+    entries = session.project.reverse_index_cache["base_model"]
+    new = DbtProject.reload(LOGGER)
+    assert new.reverse_index_cache["base_model"] is entries
+
+
+def test_failed_reload_keeps_current_snapshot(project_dir):
+    current = DbtProject.get(LOGGER)
+    (project_dir / "target" / "manifest.json").write_text("{ half written")
+    assert ProjectReloader(LOGGER).reload() is False
+    assert DbtProject.get(LOGGER) is current
+
+
+def test_watcher_reloads_when_artifacts_change(project_dir):
+    current = DbtProject.get(LOGGER)
+    reloaded = []
+    reloader = ProjectReloader(LOGGER, interval=0.01, on_reload=lambda: reloaded.append(True))
+    reloader.start_watching()
+    try:
+        time.sleep(0.05)
+        assert DbtProject.get(LOGGER) is current
+        _edit(project_dir, "catalog.json", lambda c: None)
+        deadline = time.monotonic() + 5
+        while not reloaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        reloader.stop()
+    assert reloaded
+    assert DbtProject.get(LOGGER) is not current
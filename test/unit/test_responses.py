@@ -0,0 +1,91 @@
+"""Tests for JSON serialization and response compression.
+
+Lineage payloads are serialized (with orjson when installed, otherwise stdlib
+json producing the same bytes as `JSONResponse`) and compressed with br/gzip in
+the worker, according to `Accept-Encoding`. `/schemas` and `/sources` keep their
+serialized bytes per project snapshot and answer `304` to a matching ETag.
+"""
+import gzip
+import json
+import logging
+
+import pytest
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+import dbt_column_lineage.responses as responses
+from dbt_column_lineage import jobs
+
+LOGGER = logging.getLogger("test")
+
+
+def _request(**headers):
+    return Request({"type": "http", "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_serialized_bytes_match_json_response(dbt, monkeypatch, fast):
+    if not fast:
+        monkeypatch.setattr(responses, "orjson", None)
+    payload = jobs.lineage_job(LOGGER, "child_model", '{"child_model": ["id"]}', True, False, -1)
+    payload["nodes"][0]["data"]["description"] = "日本語の説明"
+    assert responses.dumps(payload) == JSONResponse(content=payload).body
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate", "gzip"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+    ("*", "gzip"),
+])
+def test_accepted_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(responses, "brotli", None)
+    assert responses.accepted_encoding(header) == expected
+
+
+def test_brotli_is_preferred_when_installed(monkeypatch):
+    monkeypatch.setattr(responses, "brotli", object())
+    assert responses.accepted_encoding("gzip, br") == "br"
+
+
+def test_only_large_bodies_are_compressed(monkeypatch):
+    monkeypatch.setattr(responses, "RESPONSE_COMPRESS_MIN_BYTES", 100)
+    small = responses.encode_json({"a": 1}, "gzip")
+    assert small == responses.EncodedBody(b'{"a":1}', None, False)
+
+    content = {"nodes": ["X" * 10] * 50}
+    large = responses.encode_json(content, "gzip")
+    assert large.encoding == "gzip" and large.negotiated
+    assert json.loads(gzip.decompress(large.body)) == content
+    response = responses.encoded_response(large)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    monkeypatch.setattr(responses, "RESPONSE_COMPRESS_MIN_BYTES", 0)
+    assert responses.encode_json(content, "gzip").encoding is None
+
+
+def test_encoded_job_passes_through_missing_results(dbt):
+    assert jobs.encoded_job(lambda: None, "gzip") is None
+    encoded = jobs.encoded_job(jobs.cte_job, None, LOGGER, "child_model", [])
+    assert json.loads(encoded.body)["tableName"] == "child_model"
+
+
+def test_cached_response_serializes_once_and_revalidates():
+    cache, calls = {}, []
+
+    def build():
+        calls.append(1)
+        return [{"value": "analytics", "label": "analytics"}]
+    first = responses.cached_json_response(_request(), cache, ("schemas",), build)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and json.loads(first.body) == build()
+    calls.clear()
+
+    again = responses.cached_json_response(_request(if_none_match=etag), cache, ("schemas",), build)
+    assert again.status_code == 304 and again.body == b"" and again.headers["etag"] == etag
+    other = responses.cached_json_response(_request(if_none_match='W/"other"'), cache, ("schemas",), build)
+    assert other.status_code == 200
+    assert calls == []
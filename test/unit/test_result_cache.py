@@ -0,0 +1,106 @@
+"""Tests for the `/lineage` / `/cte` result cache.
+
+Encoded responses are cached per normalized query and per project fingerprint
+(the artifacts' `invocation_id`s, or their mtimes), bounded by entries/bytes,
+optionally expired by TTL and optionally persisted to SQLite so restarted
+processes start warm.
+"""
+import json
+import logging
+
+import dbt_column_lineage.result_cache as result_cache_mod
+from dbt_column_lineage.project import DbtProject
+from dbt_column_lineage.responses import EncodedBody, encode_json
+from dbt_column_lineage.result_cache import ResultCache, lineage_query_key
+
+LOGGER = logging.getLogger("test")
+BODY = EncodedBody(b'{"nodes":[]}', None, False)
+
+
+def test_memory_hits_misses_and_stats():
+    cache = ResultCache(LOGGER, max_entries=2, max_bytes=1024)
+    assert cache.get("fp1", ("q",)) is None
+    cache.put("fp1", ("q",), BODY)
+    assert cache.get("fp1", ("q",)) == BODY
+    # 成果物の版が変われば別キー
+    assert cache.get("fp2", ("q",)) is None
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 2, "entries": 1, "bytes": len(BODY.body)}
+
+
+def test_ttl_expires_entries(monkeypatch):
+    cache = ResultCache(LOGGER, max_entries=2, max_bytes=1024, ttl_seconds=60)
+    now = [1000.0]
+    monkeypatch.setattr(result_cache_mod.time, "time", lambda: now[0])
+    cache.put("fp", ("q",), BODY)
+    now[0] += 59
+    assert cache.get("fp", ("q",)) == BODY
+    now[0] += 2
+    assert cache.get("fp", ("q",)) is None
+
+
+def test_disk_persistence_survives_restart_and_drops_old_versions(tmp_path):
+    path = str(tmp_path / "cache" / "results.sqlite")
+    ResultCache(LOGGER, 8, 1024, path=path).put("fp1", ("q", "gzip"), EncodedBody(b"\x1f\x8b", "gzip", True))
+
+    restarted = ResultCache(LOGGER, 8, 1024, path=path)
+    assert restarted.get("fp1", ("q", "gzip")) == EncodedBody(b"\x1f\x8b", "gzip", True)
+    assert restarted.stats()["disk_hits"] == 1
+    # 2回目はメモリから
+    restarted.get("fp1", ("q", "gzip"))
+    assert restarted.stats()["hits"] == 1
+
+    # 新しい方から KEEP_GENERATIONS 版を残し、それより古い版は消える
+    for generation in range(2, result_cache_mod.KEEP_GENERATIONS + 2):
+        ResultCache(LOGGER, 8, 1024, path=path).put(f"fp{generation}", ("q", "gzip"), BODY)
+    assert ResultCache(LOGGER, 8, 1024, path=path).get("fp1", ("q", "gzip")) is None
+    assert ResultCache(LOGGER, 8, 1024, path=path).get("fp2", ("q", "gzip")) == BODY
+
+
+def test_workers_on_different_versions_keep_each_others_rows(tmp_path):
+    # リロード中は新旧の版のワーカーが同じファイルに書く
+    path = str(tmp_path / "results.sqlite")
+    old, new = ResultCache(LOGGER, 8, 1024, path=path), ResultCache(LOGGER, 8, 1024, path=path)
+    for query in ("a", "b", "c"):
+        old.put("fp-old", (query,), BODY)
+        new.put("fp-new", (query,), BODY)
+    reader = ResultCache(LOGGER, 8, 1024, path=path)
+    assert all(reader.get(fingerprint, (query,)) == BODY for fingerprint in ("fp-old", "fp-new") for query in "abc")
+
+
+def test_disk_errors_do_not_raise(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ResultCache(LOGGER, 8, 1024, path=str(blocker / "results.sqlite"))
+    cache.put("fp", ("q",), BODY)
+    cache.clear()
+    assert cache.get("fp", ("q",)) is None
+
+
+def test_query_key_normalization():
+    key = lineage_query_key("a,b", '{"a": ["id", "Name"], "zzz": ["x"]}', True, False, -1)
+    assert key == lineage_query_key("a,b", '{"b": [""], "a": ["ID", "NAME"]}', True, False, -1)
+    assert key != lineage_query_key("b,a", '{"a": ["id", "Name"]}', True, False, -1)
+    assert key != lineage_query_key("a,b", '{"a": ["id", "Name"]}', True, True, -1)
+    # テーブルリネージでは columns は結果に関係しない
+    assert lineage_query_key("a", '{"a": ["id"]}', False, False, 1) == lineage_query_key("a", "{}", False, False, 1)
+    assert lineage_query_key("a", "not json", True, False, 1)[2] == "not json"
+
+
+def test_truncated_results_are_flagged():
+    assert encode_json({"nodes": [], "truncated": True}, None).truncated
+    assert not encode_json({"nodes": [], "truncated": False}, None).truncated
+
+
+def test_project_fingerprint_uses_invocation_ids(diamond):
+    manifest_path = diamond / "target" / "manifest.json"
+    catalog_path = diamond / "target" / "catalog.json"
+    without_ids = DbtProject(LOGGER).fingerprint
+    assert without_ids == ":".join(str(m) for m in DbtProject.artifact_mtimes()[:2])
+
+    manifest = json.loads(manifest_path.read_text())
+    manifest["metadata"]["invocation_id"] = "run-1"
+    manifest_path.write_text(json.dumps(manifest))
+    catalog = json.loads(catalog_path.read_text())
+    catalog["metadata"] = {"invocation_id": "docs-1"}
+    catalog_path.write_text(json.dumps(catalog))
+    assert DbtProject(LOGGER).fingerprint == "run-1:docs-1"
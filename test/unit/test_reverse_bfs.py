@@ -0,0 +1,66 @@
+"""Tests for multi-hop reverse column lineage.
+
+Reverse lineage walks downstream breadth-first up to the requested depth
+(-1 = to the leaves). Reverse indexes for all sources on the same level are
+loaded or built together, and a child shared by several of them is computed
+once.
+"""
+import logging
+
+from dbt_column_lineage.lineage import DbtSqlglot
+
+LOGGER = logging.getLogger("test")
+
+
+def _names(session):
+    return {node["data"]["name"] for node in session.ret_edges_nodes()["nodes"]}
+
+
+def test_depth_minus_one_reaches_the_leaves(diamond):
+    session = DbtSqlglot(LOGGER, request_depth=-1)
+    session.column_lineage("base_model", "ID", True)
+    assert _names(session) == {"base_model", "plain_model", "child_model", "left_model", "right_model", "mart_model"}
+    # mart_model.ID は left/right の両方から届く
+    targets = {edge["target"] for edge in session.ret_edges_nodes()["edges"] if edge["sourceHandle"] == "ID__source"}
+    assert len(targets) == 4
+
+
+def test_depth_limits_the_hops(diamond):
+    session = DbtSqlglot(LOGGER, request_depth=1)
+    session.column_lineage("base_model", "ID", True)
+    assert _names(session) == {"base_model", "plain_model", "child_model"}
+
+    session = DbtSqlglot(LOGGER, request_depth=2)
+    session.column_lineage("base_model", "ID", True)
+    assert "left_model" in _names(session) and "mart_model" not in _names(session)
+
+    session = DbtSqlglot(LOGGER, request_depth=0)
+    session.column_lineage("base_model", "ID", True)
+    assert _names(session) == {"base_model"}
+
+
+def test_each_level_is_built_in_one_batch(diamond, monkeypatch):
+    batches = []
+    lookups = []
+    original_build = DbtSqlglot._DbtSqlglot__build_reverse_indexes
+    original_lookup = DbtSqlglot._DbtSqlglot__live_column_lookup
+
+    def build(self, sources):
+        batches.append(list(sources))
+        return original_build(self, sources)
+
+    def lookup(self, ref, ref_dbt_node, source):
+        lookups.append(ref)
+        return original_lookup(self, ref, ref_dbt_node, source)
+    monkeypatch.setattr(DbtSqlglot, "_DbtSqlglot__build_reverse_indexes", build)
+    monkeypatch.setattr(DbtSqlglot, "_DbtSqlglot__live_column_lookup", lookup)
+
+    DbtSqlglot(LOGGER).column_lineage("base_model", "ID", True)
+    assert batches == [["base_model"], ["child_model", "plain_model"], ["left_model", "right_model"], ["mart_model"]]
+    # mart_model は left/right 両方の子だが、リネージの計算は1回
+    assert lookups.count("model.test_proj.mart_model") == 1
+
+    # 索引はキャッシュ済みなので2回目は構築しない
+    batches.clear()
+    DbtSqlglot(LOGGER).column_lineage("base_model", "ID", True)
+    assert batches == []
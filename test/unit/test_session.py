@@ -0,0 +1,44 @@
+"""Tests for the per-request lineage session.
+
+`DbtProject` holds the loaded manifest/catalog once per process; every request
+builds its graph in its own `DbtSqlglot` session. Two overlapping requests must
+not see (or overwrite) each other's nodes, edges, depth or time budget.
+"""
+import logging
+
+from dbt_column_lineage.lineage import DbtSqlglot
+
+
+def test_sessions_share_loaded_project(dbt):
+    other = DbtSqlglot(logging.getLogger("test"), request_depth=1)
+    assert other.project is dbt.project
+    assert other is not dbt
+
+
+def test_sessions_keep_independent_graphs(dbt):
+    other = DbtSqlglot(logging.getLogger("test"), request_depth=-1)
+    dbt.table_lineage("base_model", True)
+    other.column_lineage("plain_model", "ID", False)
+
+    names = {n["data"]["name"] for n in dbt.ret_edges_nodes()["nodes"]}
+    other_names = {n["data"]["name"] for n in other.ret_edges_nodes()["nodes"]}
+    # reverse のテーブルリネージ結果に、別セッションのカラムリネージが混ざらない
+    assert names == {"base_model", "child_model", "plain_model"}
+    assert other_names == {"plain_model", "base_model"}
+    assert all(n["data"]["columns"] == [] for n in dbt.ret_edges_nodes()["nodes"])
+
+
+def test_new_session_does_not_reset_running_one(dbt):
+    dbt.table_lineage("base_model", True)
+    before = len(dbt.ret_edges_nodes()["edges"])
+    # 従来は singleton の __init__ が nodes/edges をクリアしていた
+    DbtSqlglot(logging.getLogger("test"), request_depth=0)
+    assert len(dbt.ret_edges_nodes()["edges"]) == before
+    assert dbt.request_depth == -1
+
+
+def test_reverse_index_cache_is_shared_across_sessions(dbt):
+    dbt.column_lineage("base_model", "ID", True)
+    assert "base_model" in dbt.project.reverse_index_cache
+    other = DbtSqlglot(logging.getLogger("test"))
+    assert other.project.reverse_index_cache is dbt.project.reverse_index_cache
@@ -0,0 +1,140 @@
+"""Tests for single-flight coalescing of identical concurrent work.
+
+Concurrent identical `/lineage` / `/cte` queries share one pool computation
+(`AsyncSingleFlight`), and concurrent sessions needing the same source's
+reverse index wait for the one building it (`SingleFlight` on `DbtProject`)
+instead of building it N times in parallel.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+import dbt_column_lineage.lineage as lineage_mod
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.singleflight import AsyncSingleFlight, SingleFlight
+
+LOGGER = logging.getLogger("test")
+
+
+def test_claim_and_release():
+    flight = SingleFlight()
+    assert flight.claim("a") is None
+    event = flight.claim("a")
+    assert event is not None and not event.is_set()
+    assert flight.claim("b") is None
+    flight.release("a")
+    assert event.is_set()
+    assert flight.claim("a") is None
+    assert flight.waits == 1
+
+
+def test_async_runs_share_one_computation():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"nodes": []}
+
+    async def scenario():
+        results = await asyncio.gather(*[flight.run("q", compute) for _ in range(5)])
+        assert flight.in_flight == 0
+        # 終わった後の同じキーは新しく計算する
+        await flight.run("q", compute)
+        return results
+    results = asyncio.run(scenario())
+    assert calls == [1, 1]
+    assert all(result is results[0] for result in results)
+    assert flight.coalesced == 4
+
+
+def test_async_leader_cancellation_does_not_cancel_followers():
+    flight = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.run("q", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.run("q", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_async_errors_reach_every_waiter():
+    flight = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("busy")
+
+    async def scenario():
+        return await asyncio.gather(*[flight.run("q", compute) for _ in range(3)], return_exceptions=True)
+    assert [str(e) for e in asyncio.run(scenario())] == ["busy"] * 3
+
+
+def _record_builds(monkeypatch, delay=0.0):
+    batches = []
+    original = DbtSqlglot._DbtSqlglot__build_reverse_indexes
+
+    def build(self, sources):
+        batches.append(list(sources))
+        time.sleep(delay)
+        return original(self, sources)
+    monkeypatch.setattr(DbtSqlglot, "_DbtSqlglot__build_reverse_indexes", build)
+    return batches
+
+
+def _reverse(results, index):
+    session = DbtSqlglot(LOGGER, request_depth=1)
+    session.column_lineage("base_model", "ID", True)
+    results[index] = session.ret_edges_nodes()
+
+
+def test_concurrent_sessions_build_a_reverse_index_once(diamond, monkeypatch):
+    batches = _record_builds(monkeypatch, delay=0.2)
+    results = [None, None]
+    threads = [threading.Thread(target=_reverse, args=(results, i)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert batches.count(["base_model"]) == 1
+    assert results[0] == results[1]
+
+
+def test_waiter_builds_itself_when_the_other_build_was_not_saved(diamond, monkeypatch):
+    expected = [None]
+    _reverse(expected, 0)
+    session = DbtSqlglot(LOGGER, request_depth=1)
+    session.project.reverse_index_cache.clear()
+    batches = _record_builds(monkeypatch)
+
+    # 別のリクエストが構築中(に見せかけて、保存せずに終わる)
+    flight = session.project.reverse_index_flight
+    assert flight.claim("base_model") is None
+    threading.Timer(0.05, flight.release, args=("base_model",)).start()
+    session.column_lineage("base_model", "ID", True)
+    assert batches == [["base_model"]]
+    assert flight.waits == 1
+    assert session.ret_edges_nodes() == expected[0]
+
+
+def test_waiting_respects_the_time_budget(diamond, monkeypatch):
+    monkeypatch.setattr(lineage_mod, "MAX_LINEAGE_SECONDS", 0.05)
+    session = DbtSqlglot(LOGGER, request_depth=1)
+    flight = session.project.reverse_index_flight
+    assert flight.claim("base_model") is None
+    try:
+        session.column_lineage("base_model", "ID", True)
+    finally:
+        flight.release("base_model")
+    assert session.budget_truncated
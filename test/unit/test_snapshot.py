@@ -0,0 +1,82 @@
+"""Tests for the binary project snapshot (`dbt-column-lineage snapshot`).
+
+The snapshot stores the pruned, indexed project state with the compiled SQL
+appended raw and memory-mapped on load. The server prefers it over the JSON
+artifacts only while it matches their version.
+"""
+import io
+import json
+import logging
+import os
+import pickle
+
+import pytest
+
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.manifest import MappedCodeStore
+from dbt_column_lineage.project import DbtProject
+from dbt_column_lineage.snapshot import ProjectSnapshot, _SnapshotUnpickler
+
+LOGGER = logging.getLogger("test")
+
+
+def _lineage(project):
+    session = DbtSqlglot(LOGGER, project=project)
+    session.column_lineage("mart_model", "ID", False)
+    forward = session.ret_edges_nodes()
+    session = DbtSqlglot(LOGGER, request_depth=-1, project=project)
+    session.column_lineage("base_model", "ID", True)
+    return forward, session.ret_edges_nodes()
+
+
+def test_snapshot_round_trip(diamond):
+    from_json = DbtProject(LOGGER)
+    assert not from_json.loaded_from_snapshot
+    ProjectSnapshot.save(from_json, DbtProject.snapshot_path())
+
+    from_snapshot = DbtProject(LOGGER)
+    assert from_snapshot.loaded_from_snapshot
+    assert isinstance(from_snapshot.compiled_code_store, MappedCodeStore)
+    assert from_snapshot.fingerprint == from_json.fingerprint
+    assert from_snapshot.schema_options == from_json.schema_options
+    assert from_snapshot.source_options_by_schema == from_json.source_options_by_schema
+    assert from_snapshot.dbt_manifest_child_map == from_json.dbt_manifest_child_map
+    for unique_id, node in from_json.dbt_manifest_nodes.items():
+        assert dict(from_snapshot.dbt_manifest_nodes[unique_id]) == dict(node)
+    # 索引はノードを共有したまま復元される
+    assert from_snapshot.nodes_by_name["base_model"] is from_snapshot.dbt_manifest_nodes["model.test_proj.base_model"]
+    assert _lineage(from_snapshot) == _lineage(from_json)
+
+
+def test_stale_snapshot_is_ignored(diamond):
+    ProjectSnapshot.save(DbtProject(LOGGER), DbtProject.snapshot_path())
+    manifest_path = diamond / "target" / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["nodes"]["model.test_proj.base_model"]["compiled_code"] = "select 1 as id"
+    manifest_path.write_text(json.dumps(manifest))
+    # 更新時刻が同じでも版が変わるように進める
+    stat = os.stat(manifest_path)
+    os.utime(manifest_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    project = DbtProject(LOGGER)
+    assert not project.loaded_from_snapshot
+    assert project.dbt_manifest_nodes["model.test_proj.base_model"].compiled_code == "select 1 as id"
+
+
+def test_invalid_snapshot_files_are_ignored(diamond):
+    path = DbtProject.snapshot_path()
+    with open(path, "wb") as f:
+        f.write(b"not a snapshot")
+    assert not DbtProject(LOGGER).loaded_from_snapshot
+
+    ProjectSnapshot.save(DbtProject(LOGGER), path)
+    with open(path, "r+b") as f:
+        f.truncate(200)
+    assert not DbtProject(LOGGER).loaded_from_snapshot
+    assert not DbtProject(LOGGER, use_snapshot=False).loaded_from_snapshot
+
+
+def test_unpickler_only_restores_nodes():
+    payload = pickle.dumps({"x": io.BytesIO(b"")})
+    with pytest.raises(pickle.UnpicklingError):
+        _SnapshotUnpickler(io.BytesIO(payload), None).load()
@@ -0,0 +1,162 @@
+"""Tests for the streaming lineage endpoint (`GET /api/v1/lineage/stream`).
+
+`LineageGraph` reports every change (node, edge, added columns, flags) to a
+listener; the stream job forwards those events in chunks through the pool
+without keeping the graph, and finishes with a summary event. Replaying the
+events must rebuild exactly the graph `/lineage` returns.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dbt_column_lineage import jobs
+from dbt_column_lineage.graph import LineageGraph
+from dbt_column_lineage.lineage import DbtSqlglot
+from dbt_column_lineage.pool import LineagePool, PoolSaturated
+
+LOGGER = logging.getLogger("test")
+
+
+def _replay(events):
+    nodes, edges = {}, {}
+    for event in events:
+        if event["event"] == "node":
+            nodes[event["node"]["id"]] = event["node"]
+        elif event["event"] == "columns":
+            nodes[event["id"]]["data"]["columns"].extend(event["columns"])
+        elif event["event"] == "elements":
+            nodes[event["id"]]["data"]["elements"].extend(event["elements"])
+        elif event["event"] == "flag":
+            nodes[event["id"]]["data"][event["flag"]] = True
+        elif event["event"] == "edge":
+            edges[event["edge"]["id"]] = event["edge"]
+    return {"edges": list(edges.values()), "nodes": list(nodes.values())}
+
+
+def _run_stream_job(*args, cancel=None):
+    events, cancel = queue.Queue(), cancel or threading.Event()
+    jobs.lineage_stream_job(events, cancel, LOGGER, *args)
+    chunks = []
+    while (chunk := events.get()) is not None:
+        chunks.append(chunk)
+    return [event for chunk in chunks for event in chunk]
+
+
+@pytest.mark.parametrize("args", [
+    ("mart_model", '{"mart_model": ["id"]}', True, False, -1),
+    ("base_model", '{"base_model": ["id"]}', True, True, -1),
+    ("plain_model", "{}", False, False, -1),
+    ("plain_model", "{}", False, True, 1),
+])
+def test_replayed_events_rebuild_the_lineage_response(diamond, args):
+    expected = jobs.lineage_job(LOGGER, *args)
+    depth = jobs.encoded_job(jobs.lineage_job, None, LOGGER, *args).stats.depth
+    events = _run_stream_job(*args)
+
+    assert events[-1] == {"event": "summary", "truncated": False,
+                          "nodes": len(expected["nodes"]), "edges": len(expected["edges"]), "depth": depth}
+    replayed = _replay(events[:-1])
+    assert replayed["nodes"] == expected["nodes"]
+    assert replayed["edges"] == expected["edges"]
+
+
+def test_retained_graph_emits_node_as_it_was_when_added():
+    events = []
+    g = LineageGraph(listener=events.append)
+    g.add_node({"id": "1", "data": {"name": "a", "columns": ["X"]}})
+    g.merge_columns("1", ["X", "Y"])
+    g.merge_columns("1", ["Y"])
+    g.set_flag("1", "last")
+    g.set_flag("1", "last")
+    assert events == [
+        {"event": "node", "node": {"id": "1", "data": {"name": "a", "columns": ["X"]}}},
+        {"event": "columns", "id": "1", "columns": ["Y"]},
+        {"event": "flag", "id": "1", "flag": "last"},
+    ]
+    assert g.get_node("1")["data"] == {"name": "a", "columns": ["X", "Y"], "last": True}
+
+
+def test_cancelled_stream_stops_without_summary(diamond):
+    cancel = threading.Event()
+    cancel.set()
+    events = _run_stream_job("mart_model", '{"mart_model": ["id"]}', True, False, -1, cancel=cancel)
+    # 切断済みなので最初のイベントを送ろうとした時点で打ち切る
+    assert events == []
+
+
+def test_errors_are_reported_as_an_event(diamond, monkeypatch):
+    def broken(self, source, revs=False):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(DbtSqlglot, "table_lineage", broken)
+    events = _run_stream_job("plain_model", "{}", False, False, -1)
+    assert events == [{"event": "error", "detail": "boom"}]
+
+
+def test_pool_stream_yields_chunks_and_frees_the_slot(diamond):
+    pool = LineagePool("thread", max_workers=1, max_queue=0)
+
+    async def scenario():
+        events = []
+        async for chunk in pool.stream(jobs.lineage_stream_job, LOGGER, "plain_model", "{}", False, False, -1):
+            events.extend(chunk)
+        return events
+    try:
+        events = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert events[-1]["event"] == "summary"
+    assert pool.in_flight == 0
+
+
+def test_pool_stream_rejects_when_saturated():
+    pool = LineagePool("thread", max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturated):
+            await pool.stream(jobs.lineage_stream_job).__anext__()
+        release.set()
+        await running
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_pool_stream_does_not_hold_default_executor_threads():
+    # 待機中のストリームがループの既定 executor のスレッドを占有しない
+    pool = LineagePool("thread", max_workers=4, max_queue=0)
+    release = threading.Event()
+
+    def job(events, cancel):
+        events.put([{"event": "start"}])
+        release.wait()
+        events.put([{"event": "end"}])
+        events.put(None)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+
+        async def consume():
+            return [event for chunk in [c async for c in pool.stream(job)] for event in chunk]
+        streams = [asyncio.ensure_future(consume()) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        try:
+            # 既定の executor(1スレッド)が空いていれば応答できる
+            assert await asyncio.wait_for(asyncio.to_thread(lambda: "free"), 1) == "free"
+        finally:
+            release.set()
+        return await asyncio.gather(*streams)
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert results == [[{"event": "start"}, {"event": "end"}]] * 4
+    assert pool.in_flight == 0